@@ -1,20 +1,156 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils.functional import cached_property
+from django.utils.text import Truncator
 from .models import *
+from .changes import record_changes
+from .personalization import invalidate_shared_payloads
+from .stats import invalidate_blog_author_stats
 # Register your models here.
 
-class BlogAdmin(admin.ModelAdmin):
+
+# Paginator for large changelists
+# Unfiltered changelists use a cheap row estimate instead of COUNT(*) once a table
+# is larger than ADMIN_EXACT_COUNT_LIMIT rows, and filtered ones stop counting there
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+
+        # Bounded count: the database stops scanning after `limit + 1` rows
+        return queryset.order_by()[:limit + 1].count()
+
+
+def estimate_row_count(model, using='default'):
+    # PostgreSQL keeps a row estimate in its catalog
+    # Elsewhere the highest primary key is read from the index, which is close
+    # enough for pagination as long as most rows are never deleted
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0]
+    return model._default_manager.using(using).aggregate(highest=Max('pk'))['highest']
+
+
+# Base class for the admins of large tables
+# No second unfiltered COUNT(*) and no per-row queries from related objects
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+# Blogs flagged as near-duplicates of an older blog, see blog/duplicates.py
+class NearDuplicateFilter(admin.SimpleListFilter):
+    title = 'near-duplicate'
+    parameter_name = 'near_duplicate'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Yes'), ('no', 'No')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(signature__duplicate_of__isnull=False)
+        if self.value() == 'no':
+            return queryset.exclude(signature__duplicate_of__isnull=False)
+        return queryset
+
+
+class BlogAdmin(LargeTableAdmin):
     prepopulated_fields = {"slug": ('title',)}
-    
-    
+    list_display = ('title', 'user', 'category', 'created_date')
+    list_select_related = ('user', 'category')
+    list_filter = ('created_date', 'category', NearDuplicateFilter) # Both columns are indexed, the filter joins on the signature key
+    search_fields = ('=slug', '=user__username', '=user__email') # Exact matches use the indexes
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('category', 'tags')
+    readonly_fields = ('excerpt',)
+
+
 class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ('title',)}
-    
-    
-class TagAdmin(admin.ModelAdmin):
+    list_display = ('title', 'slug', 'blog_count', 'created_date')
+    search_fields = ('^title',) # Used by the category autocomplete
+    ordering = ('title',)
+    readonly_fields = ('blog_count',)
+
+
+class TagAdmin(LargeTableAdmin):
     prepopulated_fields = {"slug": ('title',)}
-    
+    list_display = ('title', 'slug', 'blog_count', 'created_date')
+    search_fields = ('^slug',) # Used by the tag autocomplete
+    ordering = ('-blog_count', 'title') # Most used tags first, served by the popularity index
+    readonly_fields = ('blog_count',)
+    actions = ['delete_unused_tags']
+
+    @admin.action(description="Delete selected tags that are not used by any blog", permissions=['delete'])
+    def delete_unused_tags(self, request, queryset):
+        # Checked on the links themselves, a drifted `blog_count` must never delete a used tag
+        deleted, _ = queryset.filter(tag_blogs__isnull=True).delete()
+        self.message_user(request, f"Deleted {deleted} unused tags.", messages.SUCCESS)
+
+
+class FavouriteAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'blog', 'created_date')
+    list_select_related = ('user', 'blog') # Favourite.__str__ reads both
+    list_filter = ('created_date',)
+    search_fields = ('=user__username', '=user__email', '=blog__slug')
+    raw_id_fields = ('user', 'blog')
+    actions = ['delete_in_bulk']
+
+    @admin.action(description="Delete selected favourites (set-based)", permissions=['delete'])
+    def delete_in_bulk(self, request, queryset):
+        deleted, _ = queryset.delete()
+        self.message_user(request, f"Deleted {deleted} favourites.", messages.SUCCESS)
+
+
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ('id', 'short_comment', 'rating', 'user', 'blog', 'created_date')
+    list_select_related = ('user', 'blog')
+    list_filter = ('rating', 'created_date')
+    search_fields = ('=user__username', '=user__email', '=blog__slug')
+    raw_id_fields = ('user', 'blog')
+    actions = ['clear_rating', 'delete_in_bulk']
+
+    @admin.display(description='comment')
+    def short_comment(self, obj):
+        return Truncator(obj.comment).chars(60)
+
+    @admin.action(description="Clear the rating of selected reviews", permissions=['change'])
+    def clear_rating(self, request, queryset):
+        # One UPDATE, which sends no post_save: the side effects of the save receivers
+        # (change feed, author stats, shared payloads) are applied in bulk from the ids
+        reviews = queryset.exclude(rating=None)
+        with transaction.atomic():
+            review_ids = list(reviews.values_list('id', flat=True))
+            blog_ids = list(reviews.values_list('blog_id', flat=True).distinct())
+            updated = reviews.update(rating=None)
+            record_changes('review', review_ids, ChangeLogEntry.UPDATE)
+            invalidate_blog_author_stats(blog_ids)
+            invalidate_shared_payloads()
+        self.message_user(request, f"Cleared the rating of {updated} reviews.", messages.SUCCESS)
+
+    @admin.action(description="Delete selected reviews (set-based)", permissions=['delete'])
+    def delete_in_bulk(self, request, queryset):
+        deleted, _ = queryset.delete()
+        self.message_user(request, f"Deleted {deleted} reviews.", messages.SUCCESS)
+
+
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Blog, BlogAdmin)
-admin.site.register(Favourite)
-admin.site.register(Review)
\ No newline at end of file
+admin.site.register(Favourite, FavouriteAdmin)
+admin.site.register(Review, ReviewAdmin)
@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from users.models import User
+from .models import Blog, Category, Review, Tag
+
+
+# Helpers shared by the benchmark management commands
+# Data is seeded inside a transaction that is always rolled back, so the
+# commands can run against any database without leaving rows behind
+
+
+@contextmanager
+def seeded_corpus(blogs=200, tags_per_blog=3, reviews_per_blog=5, description_words=300):
+    """
+    Seed a synthetic corpus and roll it back on exit.
+
+        with seeded_corpus(blogs=200, tags_per_blog=3, reviews_per_blog=5):
+            ...
+    """
+    with transaction.atomic():
+        yield seed_corpus(blogs, tags_per_blog, reviews_per_blog, description_words)
+        transaction.set_rollback(True) # Always roll back
+
+
+def seed_corpus(blogs, tags_per_blog, reviews_per_blog, description_words=300):
+    rng = random.Random(42)
+    words = ['django', 'python', 'api', 'query', 'cache', 'index', 'render', 'serializer',
+             'request', 'response', 'latency', 'thread', 'worker', 'model', 'signal', 'view']
+
+    users = User.objects.bulk_create(
+        User(email=f'bench{index}@example.com', username=f'bench{index}', password='!')
+        for index in range(20)
+    )
+    categories = Category.objects.bulk_create(
+        Category(title=f'Bench category {index}', slug=f'bench-category-{index}') for index in range(10)
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(title=f'bench-tag-{index}', slug=f'bench-tag-{index}') for index in range(max(tags_per_blog * 5, 1))
+    )
+
+    blog_objects = Blog.objects.bulk_create(
+        Blog(
+            user=rng.choice(users),
+            category=rng.choice(categories),
+            title=f'Benchmark post {index}',
+            slug=f'benchmark-post-{index}',
+            description=' '.join(rng.choice(words) for _ in range(description_words)),
+        )
+        for index in range(blogs)
+    )
+
+    through = Blog.tags.through
+    through.objects.bulk_create(
+        through(blog_id=blog.id, tag_id=tag.id)
+        for blog in blog_objects
+        for tag in rng.sample(tags, min(tags_per_blog, len(tags)))
+    )
+    Review.objects.bulk_create(
+        Review(
+            user=rng.choice(users),
+            blog=blog,
+            comment=' '.join(rng.choice(words) for _ in range(20)),
+            rating=rng.randint(1, 5),
+        )
+        for blog in blog_objects
+        for _ in range(reviews_per_blog)
+    )
+    return blog_objects
+
+
+def measure(func, repeat=20):
+    """
+    Run `func` `repeat` times and return the median wall time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .fast_serializers import BlogValuesSerializer
+from .models import Blog, Category, ChangeLogEntry, Review, Tag
+
+
+# Change feed
+# Signals append an entry per created, updated or deleted object (blog/signals.py).
+# Entries are written on the connection of the change, so they commit or roll back with it
+# as long as the write runs in a transaction (saves through the API views and the admin do).
+# Clients read everything after their last cursor and apply the latest state of each object.
+# `compact_changes()` keeps the latest entry per object, and deletions (tombstones) for
+# CHANGE_FEED_RETENTION_DAYS only. It leaves a purge marker with the id of the last entry it
+# dropped, and a client whose cursor is older gets `resync` and starts again from 0.
+
+CHANGE_FEED_SETTLE_SECONDS = getattr(settings, 'CHANGE_FEED_SETTLE_SECONDS', 0)
+CHANGE_FEED_RETENTION_DAYS = getattr(settings, 'CHANGE_FEED_RETENTION_DAYS', 30)
+MAX_CHANGES = 1000 # Most entries returned per request
+PURGE = 'purge' # Model name of the purge marker, its object id is the last purged entry id
+
+
+def record_change(model, object_id, action, user_id=None):
+    ChangeLogEntry.objects.create(model=model, object_id=object_id, action=action, user_id=user_id)
+
+
+def record_changes(model, object_ids, action, user_id=None):
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=model, object_id=object_id, action=action, user_id=user_id)
+        for object_id in object_ids
+    ])
+
+
+def record_favourite_changes(pairs, action):
+    """
+    Record favourite changes for (user id, blog id) pairs, each visible to its user only.
+    """
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model='favourite', object_id=blog_id, action=action, user_id=user_id)
+        for user_id, blog_id in pairs
+    ])
+
+
+def read_changes(request, since=0, limit=200):
+    """
+    Return the entries after the `since` cursor that this user may see, oldest first,
+    with the current state of every object that still exists, and the next cursor.
+    Favourite entries are only visible to their user.
+    """
+    horizon = purged_through()
+    if since and since < horizon:
+        # Deletions after this cursor may be gone, the client has to start over
+        return {'cursor': 0, 'has_more': True, 'changes': [], 'resync': True}
+
+    user = request.user
+    entries = ChangeLogEntry.objects.filter(id__gt=since).exclude(model=PURGE).order_by('id')
+    if user.is_authenticated:
+        entries = entries.filter(Q(user__isnull=True) | Q(user=user))
+    else:
+        entries = entries.filter(user__isnull=True)
+    if CHANGE_FEED_SETTLE_SECONDS:
+        # Leave recent entries to the next poll, so a transaction that committed a lower id
+        # after a higher one (concurrent writers on PostgreSQL) is not skipped
+        entries = entries.filter(created_date__lte=timezone.now() - timedelta(seconds=CHANGE_FEED_SETTLE_SECONDS))
+
+    batch = list(entries.values('id', 'model', 'object_id', 'action')[:limit + 1])
+    has_more = len(batch) > limit
+    batch = batch[:limit]
+    cursor = batch[-1]['id'] if batch else since
+    if not has_more:
+        cursor = max(cursor, horizon) # Past the purged entries, even when none is left after them
+
+    # Only the latest entry per object matters inside a batch
+    latest = {}
+    for entry in batch:
+        latest.pop((entry['model'], entry['object_id']), None)
+        latest[entry['model'], entry['object_id']] = entry
+    changes = list(latest.values())
+
+    states = _current_states(changes, request)
+    for change in changes:
+        change['data'] = states.get((change['model'], change['object_id']))
+    return {'cursor': cursor, 'has_more': has_more, 'changes': changes, 'resync': False}
+
+
+def purged_through():
+    """
+    Id of the last entry dropped by retention, 0 if none was.
+    """
+    # Served by the (model, object_id) index
+    marker = ChangeLogEntry.objects.filter(model=PURGE).order_by('-object_id').values_list('object_id', flat=True).first()
+    return marker or 0
+
+
+def _current_states(changes, request):
+    # One query per model for the objects of the batch that still exist
+    ids = {}
+    for change in changes:
+        if change['action'] != ChangeLogEntry.DELETE and change['model'] != 'favourite':
+            ids.setdefault(change['model'], []).append(change['object_id'])
+
+    states = {}
+    if 'blog' in ids:
+        rows = BlogValuesSerializer.project(Blog.objects.filter(id__in=ids['blog']))
+        for blog in BlogValuesSerializer(rows, many=True, context={'request': request}).data:
+            states['blog', blog['id']] = blog
+    for model, queryset in (('category', Category.objects), ('tag', Tag.objects)):
+        if model in ids:
+            for row in queryset.filter(id__in=ids[model]).values('id', 'title', 'slug', 'blog_count'):
+                states[model, row['id']] = row
+    if 'review' in ids:
+        for row in Review.objects.filter(id__in=ids['review']) \
+                                 .values('id', 'blog', 'user__username', 'comment', 'rating', 'created_date'):
+            row['user'] = row.pop('user__username')
+            row['created_date'] = row['created_date'].isoformat()
+            states['review', row['id']] = row
+    return states
+
+
+def compact_changes(now=None):
+    """
+    Delete every entry that a later entry for the same object supersedes, and the
+    deletions older than CHANGE_FEED_RETENTION_DAYS. Clients always end up with the
+    same state, and the log stays about one entry per live object plus the recent
+    deletions. Returns the number of entries deleted.
+    """
+    newer = ChangeLogEntry.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), id__gt=OuterRef('id')
+    )
+    public, _ = ChangeLogEntry.objects.filter(user__isnull=True) \
+                                      .filter(Exists(newer.filter(user__isnull=True))) \
+                                      .delete()
+    private, _ = ChangeLogEntry.objects.filter(user__isnull=False) \
+                                       .filter(Exists(newer.filter(user=OuterRef('user')))) \
+                                       .delete()
+
+    # Tombstones past the retention period, remembered by a purge marker for `read_changes`
+    cutoff = (now or timezone.now()) - timedelta(days=CHANGE_FEED_RETENTION_DAYS)
+    expired = ChangeLogEntry.objects.filter(action=ChangeLogEntry.DELETE, created_date__lt=cutoff).exclude(model=PURGE)
+    last_expired = expired.order_by('-id').values_list('id', flat=True).first()
+    purged = 0
+    if last_expired is not None:
+        purged, _ = expired.filter(id__lte=last_expired).delete()
+        if last_expired > purged_through():
+            ChangeLogEntry.objects.filter(model=PURGE).delete()
+            record_change(PURGE, last_expired, ChangeLogEntry.DELETE)
+    return public + private + purged
@@ -0,0 +1,49 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+from .models import ArchiveMonth, Blog, Category, Tag
+
+
+def reconcile_blog_counts():
+    """
+    Recompute `Category.blog_count` and `Tag.blog_count` from the blog table.
+    Returns the number of (categories, tags) updated.
+    """
+    category_counts = Blog.objects.filter(category=OuterRef('pk')) \
+                                  .order_by() \
+                                  .values('category') \
+                                  .annotate(total=Count('pk')) \
+                                  .values('total')
+    tag_counts = Blog.tags.through.objects.filter(tag=OuterRef('pk')) \
+                                          .order_by() \
+                                          .values('tag') \
+                                          .annotate(total=Count('pk')) \
+                                          .values('total')
+
+    categories = Category.objects.update(
+        blog_count=Coalesce(Subquery(category_counts, output_field=IntegerField()), Value(0))
+    )
+    tags = Tag.objects.update(
+        blog_count=Coalesce(Subquery(tag_counts, output_field=IntegerField()), Value(0))
+    )
+    return categories, tags
+
+
+def monthly_blog_counts(blogs):
+    """
+    Yield an unsaved ArchiveMonth per (year, month) and per (year, month, category) of `blogs`.
+    """
+    months = blogs.order_by().annotate(year=ExtractYear('created_date'), month=ExtractMonth('created_date'))
+    for row in months.values('year', 'month').annotate(total=Count('pk')):
+        yield ArchiveMonth(year=row['year'], month=row['month'], blog_count=row['total'])
+    for row in months.values('year', 'month', 'category').annotate(total=Count('pk')):
+        yield ArchiveMonth(year=row['year'], month=row['month'], category_id=row['category'], blog_count=row['total'])
+
+
+def rebuild_archive():
+    """
+    Recompute the ArchiveMonth rollup from the blog table.
+    Returns the number of rows written.
+    """
+    ArchiveMonth.objects.all().delete()
+    return len(ArchiveMonth.objects.bulk_create(monthly_blog_counts(Blog.objects.all()), batch_size=500))
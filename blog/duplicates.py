@@ -0,0 +1,245 @@
+import hashlib
+import struct
+from collections import defaultdict
+from functools import lru_cache
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Blog, BlogSignature, SignatureBand
+from .suggest import normalize
+
+
+# Near-duplicate detection
+# The title and description of a blog are normalized and cut into overlapping
+# SHINGLE_WORDS-word shingles. Their MinHash signature (NUM_PERM minimum hash values,
+# one-permutation hashing) estimates the Jaccard similarity between two blogs: the
+# share of equal values.
+# Signatures are split into BANDS bands of ROWS values, and each band is hashed into a
+# bucket (SignatureBand, indexed on band and bucket). Blogs sharing a bucket in any band
+# are the only candidates compared, so a check is a handful of index lookups however
+# large the corpus is. With 16 bands of 8 rows, pairs above ~0.7 similarity almost
+# always share a bucket and pairs below ~0.5 rarely do.
+# Signatures are written by a signal when a blog's title or description changes,
+# `python manage.py scan_duplicates` indexes existing blogs and scans the whole corpus.
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+MAX_CANDIDATES = 200 # Most candidates compared per check, bounds the work on boilerplate buckets
+
+_DENSIFY_OFFSET = 0x9E3779B1 # Added per bin skipped when an empty bin borrows a value
+_PACKING = struct.Struct(f'<{NUM_PERM}I')
+
+
+# DUPLICATE_DETECTION ('flag', 'reject' or None) and DUPLICATE_THRESHOLD are read on
+# every call, so they can be changed without reloading the module
+def detection_mode():
+    return getattr(settings, 'DUPLICATE_DETECTION', 'flag')
+
+
+def default_threshold():
+    return getattr(settings, 'DUPLICATE_THRESHOLD', 0.8)
+
+
+def shingles(title, description):
+    words = normalize(f'{title} {description}').split()
+    if len(words) <= SHINGLE_WORDS:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[start:start + SHINGLE_WORDS]) for start in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+@lru_cache(maxsize=256) # A blog is signed by the create check and again by the signal
+def signature(title, description):
+    """
+    MinHash signature of a title and description: a tuple of NUM_PERM 32-bit values,
+    or None when there is no text.
+    """
+    # One-permutation hashing: each shingle is hashed once, the low bits pick one of NUM_PERM
+    # bins and the bin keeps the smallest high 32 bits. That is NUM_PERM minimums for the cost
+    # of one, instead of hashing every shingle NUM_PERM times
+    bins = [None] * NUM_PERM
+    for shingle in shingles(title, description):
+        value = _hash(shingle)
+        index, value = value % NUM_PERM, value >> 32
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    if all(value is None for value in bins):
+        return None
+
+    # Empty bins (short texts) borrow the value of the next filled bin, shifted by the
+    # distance, so two texts still agree on a bin with a probability close to their similarity
+    minhash = []
+    for index in range(NUM_PERM):
+        distance = 0
+        while bins[(index + distance) % NUM_PERM] is None:
+            distance += 1
+        minhash.append((bins[(index + distance) % NUM_PERM] + distance * _DENSIFY_OFFSET) & 0xFFFFFFFF)
+    return tuple(minhash)
+
+
+def similarity(first, second):
+    """
+    Estimated Jaccard similarity of the texts behind two signatures.
+    """
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def pack(minhash):
+    return _PACKING.pack(*minhash)
+
+
+def unpack(data):
+    return _PACKING.unpack(bytes(data))
+
+
+def bands(minhash):
+    """
+    (band, bucket) pairs of a signature.
+    """
+    for band in range(BANDS):
+        rows = struct.pack(f'<{ROWS}I', *minhash[band * ROWS:(band + 1) * ROWS])
+        yield band, int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True)
+
+
+def find_duplicate(minhash, before_id=None, threshold=None):
+    """
+    The (blog id, similarity) of the most similar blog at or above `threshold`, or None.
+    With `before_id`, only blogs created before that one are considered.
+    """
+    threshold = default_threshold() if threshold is None else threshold
+    same_bucket = Q()
+    for band, bucket in bands(minhash):
+        same_bucket |= Q(band=band, bucket=bucket)
+    candidates = SignatureBand.objects.filter(same_bucket)
+    if before_id is not None:
+        candidates = candidates.filter(blog_id__lt=before_id)
+    candidate_ids = candidates.order_by().values_list('blog_id', flat=True).distinct()[:MAX_CANDIDATES]
+
+    best = None
+    for blog_id, other in BlogSignature.objects.filter(blog_id__in=list(candidate_ids)) \
+                                               .values_list('blog_id', 'minhash'):
+        score = similarity(minhash, unpack(other))
+        if score >= threshold and (best is None or (score, -blog_id) > (best[1], -best[0])):
+            best = (blog_id, score)
+    return best
+
+
+def duplicate_to_reject(title, description):
+    """
+    The (blog id, similarity) a new blog duplicates when DUPLICATE_DETECTION is 'reject', otherwise None.
+    """
+    if detection_mode() != 'reject':
+        return None
+    minhash = signature(title, description)
+    return find_duplicate(minhash) if minhash is not None else None
+
+
+def index_blog(blog):
+    """
+    Store the signature and bands of a blog, flagged with the older blog it duplicates if any.
+    """
+    minhash = signature(blog.title, blog.description)
+    SignatureBand.objects.filter(blog_id=blog.pk).delete()
+    if minhash is None:
+        BlogSignature.objects.filter(blog_id=blog.pk).delete()
+        return
+
+    duplicate = find_duplicate(minhash, before_id=blog.pk)
+    BlogSignature.objects.update_or_create(blog_id=blog.pk, defaults={
+        'minhash': pack(minhash),
+        'duplicate_of_id': duplicate[0] if duplicate else None,
+        'similarity': duplicate[1] if duplicate else None,
+    })
+    SignatureBand.objects.bulk_create(
+        SignatureBand(blog_id=blog.pk, band=band, bucket=bucket) for band, bucket in bands(minhash)
+    )
+
+
+def index_corpus(rebuild=False, batch_size=500):
+    """
+    Sign every blog that has no signature yet (every blog with `rebuild`), without flagging.
+    Returns the number of blogs signed.
+    """
+    if rebuild:
+        SignatureBand.objects.all().delete()
+        BlogSignature.objects.all().delete()
+
+    signed = 0
+    last_id = 0
+    while True:
+        rows = list(Blog.objects.filter(id__gt=last_id, signature__isnull=True)
+                                .order_by('id')
+                                .values_list('id', 'title', 'description')[:batch_size])
+        if not rows:
+            return signed
+        last_id = rows[-1][0]
+        signatures = [
+            (blog_id, minhash) for blog_id, title, description in rows
+            if (minhash := signature.__wrapped__(title, description)) is not None # Not worth caching
+        ]
+        BlogSignature.objects.bulk_create(
+            BlogSignature(blog_id=blog_id, minhash=pack(minhash)) for blog_id, minhash in signatures
+        )
+        SignatureBand.objects.bulk_create(
+            SignatureBand(blog_id=blog_id, band=band, bucket=bucket)
+            for blog_id, minhash in signatures
+            for band, bucket in bands(minhash)
+        )
+        signed += len(signatures)
+
+
+def scan_corpus(threshold=None, batch_size=500):
+    """
+    Compare the blogs that share a bucket. Returns (newer blog id, older blog id, similarity)
+    for every pair at or above `threshold`, most similar first, and the number of pairs compared.
+    """
+    threshold = default_threshold() if threshold is None else threshold
+    shared = SignatureBand.objects.filter(Exists(
+        SignatureBand.objects.filter(band=OuterRef('band'), bucket=OuterRef('bucket')).exclude(blog_id=OuterRef('blog_id'))
+    ))
+    buckets = defaultdict(list)
+    for band, bucket, blog_id in shared.values_list('band', 'bucket', 'blog_id').iterator():
+        buckets[band, bucket].append(blog_id)
+
+    pairs = set()
+    for blog_ids in buckets.values():
+        pairs.update(combinations(sorted(blog_ids)[:MAX_CANDIDATES], 2)) # (older, newer)
+
+    involved = sorted({blog_id for pair in pairs for blog_id in pair})
+    minhashes = {}
+    for start in range(0, len(involved), batch_size):
+        for blog_id, minhash in BlogSignature.objects.filter(blog_id__in=involved[start:start + batch_size]) \
+                                                     .values_list('blog_id', 'minhash'):
+            minhashes[blog_id] = unpack(minhash)
+
+    duplicates = []
+    for older, newer in pairs:
+        score = similarity(minhashes[older], minhashes[newer])
+        if score >= threshold:
+            duplicates.append((newer, older, score))
+    duplicates.sort(key=lambda duplicate: (-duplicate[2], duplicate[0], duplicate[1]))
+    return duplicates, len(pairs)
+
+
+def flag_duplicates(duplicates):
+    """
+    Replace the stored flags: each newer blog points at its most similar older blog.
+    Returns the number of blogs flagged.
+    """
+    best = {}
+    for newer, older, score in duplicates: # Most similar first
+        best.setdefault(newer, (older, score))
+    BlogSignature.objects.exclude(duplicate_of__isnull=True).update(duplicate_of=None, similarity=None)
+    BlogSignature.objects.bulk_update(
+        [BlogSignature(blog_id=newer, duplicate_of_id=older, similarity=score) for newer, (older, score) in best.items()],
+        ['duplicate_of', 'similarity'],
+        batch_size=500,
+    )
+    return len(best)
@@ -0,0 +1,15 @@
+from django.utils.html import strip_tags
+
+
+EXCERPT_LENGTH = 200
+
+
+def generate_excerpt(text, length=EXCERPT_LENGTH):
+    # Plain-text preview of a description for list cards
+    # Collapses whitespace and cuts at the last word boundary before `length`
+    text = ' '.join(strip_tags(text or '').split())
+    if len(text) <= length:
+        return text
+
+    cut = text[:length].rsplit(' ', 1)[0] or text[:length]
+    return cut.rstrip(' .,;:!?-') + '…'
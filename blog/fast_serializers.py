@@ -0,0 +1,120 @@
+from collections import defaultdict
+
+from .models import Blog, Review
+from .refcache import category_cache
+
+
+# Read-optimized serializers
+# These produce exactly the JSON of their ModelSerializer counterparts for read-only
+# list endpoints, but build the output dicts straight from `.values()` rows.
+# No model instances, related managers or nested serializers are created per row.
+
+# Blog Values Serializer
+# Read-only counterpart of BlogSerializer
+# Tags and reviews of the whole page are fetched with one query each
+# Only the columns and lookups needed by the selected `fields` are fetched
+class BlogValuesSerializer:
+    # Output fields, in BlogSerializer order, and the columns each one reads
+    fields = {
+        'id': ('id',),
+        'user': ('user__username',),
+        'title': ('title',),
+        'slug': ('slug',),
+        'category': ('category_id',),
+        'category_title': ('category_id',),
+        'banner': ('banner',),
+        'description': ('description',),
+        'excerpt': ('excerpt',),
+        'tag_title': (), # Batched lookup
+        'created_date': ('created_date',),
+        'is_favourited': ('is_favourited',), # Only when the queryset annotates it
+        'reviews': (), # Batched lookup
+    }
+
+    def __init__(self, instance, many=True, context=None, fields=None):
+        assert many, "BlogValuesSerializer only serializes lists"
+        self.instance = instance # Rows from `project()`
+        self.context = context or {}
+        self.selected = tuple(self.fields if fields is None else fields)
+
+    @classmethod
+    def project(cls, queryset, fields=None, extra_columns=()):
+        """
+        Turn a Blog queryset into the `.values()` rows this serializer reads.
+        `is_favourited` is only included when the queryset annotates it, like BlogSerializer.
+        `extra_columns` are fetched but not serialized (e.g. a pagination cursor).
+        """
+        columns = ['id'] # Always fetched, tags and reviews are batched by blog id
+        columns += [column for column in extra_columns if column not in columns]
+        for name in (cls.fields if fields is None else fields):
+            if name == 'is_favourited' and 'is_favourited' not in queryset.query.annotations:
+                continue
+            columns += [column for column in cls.fields[name] if column not in columns]
+        return queryset.prefetch_related(None).values(*columns)
+
+    @property
+    def data(self):
+        rows = list(self.instance)
+        blog_ids = [row['id'] for row in rows]
+
+        tag_titles = defaultdict(list)
+        reviews = defaultdict(list)
+        if blog_ids and 'tag_title' in self.selected:
+            for blog_id, title in Blog.tags.through.objects.filter(blog_id__in=blog_ids) \
+                                                           .order_by('blog_id', 'tag_id') \
+                                                           .values_list('blog_id', 'tag__title'):
+                tag_titles[blog_id].append(title)
+
+        if blog_ids and 'reviews' in self.selected:
+            for review in Review.objects.filter(blog_id__in=blog_ids) \
+                                        .order_by('blog_id', 'id') \
+                                        .values('id', 'blog_id', 'user__username', 'comment', 'rating', 'created_date'):
+                reviews[review['blog_id']].append({
+                    'id': review['id'],
+                    'user': review['user__username'],
+                    'comment': review['comment'],
+                    'rating': review['rating'],
+                    'created_date': _date(review['created_date']),
+                })
+
+        return [self.to_representation(row, tag_titles[row['id']], reviews[row['id']]) for row in rows]
+
+    def to_representation(self, row, tag_titles, reviews):
+        data = {}
+        for name in self.selected:
+            if name == 'id':
+                data['id'] = row['id']
+            elif name == 'user':
+                data['user'] = row['user__username']
+            elif name in ('title', 'slug', 'description', 'excerpt'):
+                data[name] = row[name]
+            elif name == 'category':
+                data['category'] = row['category_id']
+            elif name == 'category_title':
+                data['category_title'] = category_cache.title(row['category_id'])
+            elif name == 'banner':
+                data['banner'] = self._banner_url(row['banner'])
+            elif name == 'tag_title':
+                data['tag_title'] = tag_titles
+            elif name == 'created_date':
+                data['created_date'] = _date(row['created_date'])
+            elif name == 'is_favourited':
+                if 'is_favourited' in row:
+                    data['is_favourited'] = row['is_favourited']
+            elif name == 'reviews':
+                data['reviews'] = reviews
+        return data
+
+    def _banner_url(self, name):
+        # Same output as DRF's ImageField: absolute URL when a request is available
+        if not name:
+            return None
+        url = Blog._meta.get_field('banner').storage.url(name)
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+def _date(value):
+    return value.isoformat() if value is not None else None
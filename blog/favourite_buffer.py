@@ -0,0 +1,178 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from users.models import User
+from .changes import record_favourite_changes
+from .models import Blog, ChangeLogEntry, Favourite
+from .stats import invalidate_blog_author_stats
+
+logger = logging.getLogger(__name__)
+
+
+# Write-behind buffer for favourite toggles
+# Toggles are acknowledged immediately and recorded per (user, blog) pair
+# Repeated add/remove pairs coalesce: only the latest state of a pair is kept,
+# and since both operations are idempotent, applying the latest state is enough
+# Pending toggles are flushed in one transaction when the buffer reaches
+# `FAVOURITE_BUFFER_MAX_SIZE` pairs or every `FAVOURITE_BUFFER_FLUSH_INTERVAL` seconds
+# The buffer lives in the process that acknowledged the toggle: reads served by that
+# process include it right away, reads served by another worker process only once it is
+# flushed (at most FAVOURITE_BUFFER_FLUSH_INTERVAL seconds later). Route a user to the
+# same worker (sticky sessions) or keep write-behind off when that matters
+class FavouriteWriteBuffer:
+
+    def __init__(self, max_size=100, flush_interval=2.0):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._pending = {}  # {(user_id, blog_id): True for add, False for remove}
+        self._in_flight = {}  # The batch being written, until its transaction commits
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Only one flush may run at a time
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, user_id, blog_id):
+        self._record(user_id, blog_id, True)
+
+    def remove(self, user_id, blog_id):
+        self._record(user_id, blog_id, False)
+
+    def pending_for_user(self, user_id):
+        """
+        Return the (added, removed) blog ids buffered for a user.
+        Used to keep reads consistent for the acting user until the next flush.
+        """
+        added, removed = set(), set()
+        with self._lock:
+            # The batch being flushed is not committed yet, newer pending toggles override it
+            for (pending_user_id, blog_id), favourited in {**self._in_flight, **self._pending}.items():
+                if pending_user_id == user_id:
+                    (added if favourited else removed).add(blog_id)
+        return added, removed
+
+    def _record(self, user_id, blog_id, favourited):
+        if self._stopped.is_set():
+            raise RuntimeError("Favourite write buffer has been shut down")
+        self._ensure_thread()
+        with self._lock:
+            self._pending[(user_id, blog_id)] = favourited
+            full = len(self._pending) >= self.max_size
+        if full:
+            self._wake.set()  # Size trigger: let the flusher thread run now
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='favourite-write-buffer', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)  # Time trigger
+            self._wake.clear()
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        """
+        Apply all pending toggles in a single transaction.
+        Returns the number of (user, blog) pairs written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch # Still read by pending_for_user until committed
+            if not batch:
+                return 0
+            try:
+                self._apply(batch)
+            except Exception:
+                logger.exception("Failed to flush %d favourite toggles", len(batch))
+                # Put the batch back unless a newer toggle superseded a pair meanwhile
+                with self._lock:
+                    for key, favourited in batch.items():
+                        self._pending.setdefault(key, favourited)
+                    self._in_flight = {}
+                return 0
+            with self._lock:
+                self._in_flight = {}
+            return len(batch)
+
+    def _apply(self, batch):
+        from .personalization import invalidate_favourite_ids # Imports this module
+
+        adds = [key for key, favourited in batch.items() if favourited]
+        removes = [key for key, favourited in batch.items() if not favourited]
+
+        with transaction.atomic():
+            if adds:
+                # Skip blogs and users deleted after the toggle was acknowledged
+                live_blog_ids = set(
+                    Blog.objects.filter(id__in={blog_id for _, blog_id in adds})
+                                .values_list('id', flat=True)
+                )
+                live_user_ids = set(
+                    User.objects.filter(id__in={user_id for user_id, _ in adds})
+                                .values_list('id', flat=True)
+                )
+                live_adds = [
+                    (user_id, blog_id) for user_id, blog_id in adds
+                    if blog_id in live_blog_ids and user_id in live_user_ids
+                ]
+                Favourite.objects.bulk_create(
+                    [Favourite(user_id=user_id, blog_id=blog_id) for user_id, blog_id in live_adds],
+                    ignore_conflicts=True,  # Already favourited rows are left untouched
+                )
+                # bulk_create sends no post_save, log the adds for the change feed here
+                # (an add that hit an existing row is logged again, which clients apply idempotently)
+                record_favourite_changes(live_adds, ChangeLogEntry.CREATE)
+                # Same for the dashboard stats of the authors and the users' favourite id sets
+                invalidate_blog_author_stats(live_blog_ids)
+                invalidate_favourite_ids({user_id for user_id, _ in live_adds})
+            if removes:
+                condition = Q()
+                for user_id, blog_id in removes:
+                    condition |= Q(user_id=user_id, blog_id=blog_id)
+                Favourite.objects.filter(condition).delete()
+
+    def shutdown(self):
+        """
+        Stop the flusher thread and write out everything still pending.
+        """
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_favourite_buffer():
+    """
+    Return the process-wide buffer, or None when write-behind mode is disabled.
+    """
+    global _buffer
+    if not getattr(settings, 'FAVOURITE_WRITE_BEHIND', False):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = FavouriteWriteBuffer(
+                    max_size=getattr(settings, 'FAVOURITE_BUFFER_MAX_SIZE', 100),
+                    flush_interval=getattr(settings, 'FAVOURITE_BUFFER_FLUSH_INTERVAL', 2.0),
+                )
+                atexit.register(_buffer.shutdown)  # Flush on clean interpreter exit
+    return _buffer
@@ -0,0 +1,232 @@
+import calendar
+import hashlib
+import re
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Blog, Category, ChangeLogEntry, Tag
+
+
+# Feeds and sitemaps for crawlers and feed readers
+# RSS and Atom feeds of the latest blogs (all, per category, per tag) and a sitemap index
+# with one sitemap per SITEMAP_SHARD_SIZE range of blog ids. Documents are streamed from
+# `values_list()` iterators, without serializers, and cached whole once fully sent.
+# Last-Modified is the time of the latest blog, category or tag entry in the change log
+# (compaction always keeps the latest one), so conditional requests get a 304 until a
+# blog changes. The signals drop the cached time on every such change (blog/signals.py).
+
+FEED_ITEMS = getattr(settings, 'FEED_ITEMS', 50)
+SITEMAP_SHARD_SIZE = getattr(settings, 'SITEMAP_SHARD_SIZE', 5000)
+FEED_CACHE_TIMEOUT = getattr(settings, 'FEED_CACHE_TIMEOUT', 300)
+FEED_MAX_AGE = getattr(settings, 'FEED_MAX_AGE', 60)
+BLOG_URL_TEMPLATE = getattr(settings, 'BLOG_URL_TEMPLATE', None)
+
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'sitemap': 'application/xml; charset=utf-8',
+}
+LAST_MODIFIED_KEY = 'feeds:last-modified'
+CHUNK_ROWS = 500 # Rows per streamed chunk
+
+_invalid_xml = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]') # Not allowed in XML 1.0
+
+
+def _text(value):
+    return escape(_invalid_xml.sub('', str(value)))
+
+
+def _attr(value):
+    return quoteattr(_invalid_xml.sub('', str(value)))
+
+
+def _timestamp(day):
+    return calendar.timegm(day.timetuple())
+
+
+def last_modified():
+    """
+    Time (seconds since the epoch) of the latest change to a blog, category or tag.
+    """
+    stamp = cache.get(LAST_MODIFIED_KEY)
+    if stamp is None:
+        latest = ChangeLogEntry.objects.filter(model__in=('blog', 'category', 'tag'), user__isnull=True) \
+                                       .order_by('-id').values_list('created_date', flat=True).first()
+        if latest is not None:
+            stamp = latest.timestamp()
+        else:
+            # Nothing logged yet (a database from before the change log, fixtures, bulk loads):
+            # the newest creation day, stable until the first logged change moves it on
+            days = [model.objects.aggregate(day=Max('created_date'))['day'] for model in (Blog, Category, Tag)]
+            stamp = float(max((_timestamp(day) for day in days if day is not None), default=0))
+        cache.set(LAST_MODIFIED_KEY, stamp, FEED_CACHE_TIMEOUT)
+    return stamp
+
+
+def invalidate_feeds():
+    # Once the change and its change log entry are committed
+    transaction.on_commit(lambda: cache.delete(LAST_MODIFIED_KEY))
+
+
+def _cache_when_sent(key, stamp, chunks):
+    # Stream the chunks and cache the document once all of it was sent
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    # A change committed while streaming may or may not be in the document, so it is
+    # not cached under the old stamp. The stamp lives in the shared cache (CACHES),
+    # so this also sees changes made through other processes
+    if last_modified() == stamp:
+        cache.set(key, ''.join(sent), FEED_CACHE_TIMEOUT)
+
+
+def cached_document(request, kind, build):
+    """
+    Answer a conditional request with a 304, or return the cached document for this URL,
+    or stream the chunks `build()` returns and cache them. `build` raises Http404 itself.
+    """
+    stamp = last_modified()
+    etag = f'"{round(stamp * 1_000_000):x}"' # Exact where Last-Modified is rounded to the second
+    response = get_conditional_response(request, etag=etag, last_modified=int(stamp))
+    if response is None:
+        url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest() # Links include the host
+        key = f'feeds:{etag.strip(chr(34))}:{url}'
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=CONTENT_TYPES[kind])
+        else:
+            response = StreamingHttpResponse(_cache_when_sent(key, stamp, build()), content_type=CONTENT_TYPES[kind])
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stamp)
+    patch_cache_control(response, public=True, max_age=FEED_MAX_AGE)
+    return response
+
+
+def _blog_url(request):
+    # A template for the blog links, the API detail endpoint unless BLOG_URL_TEMPLATE is set
+    if BLOG_URL_TEMPLATE:
+        return BLOG_URL_TEMPLATE
+    return request.build_absolute_uri(reverse('blog-detail', kwargs={'slug': 'slug'})).replace('/slug/', '/{slug}/')
+
+
+def _chunks(rows, render):
+    chunk = []
+    for row in rows:
+        chunk.append(render(row))
+        if len(chunk) >= CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def feed(request, kind, scope=None, slug=None):
+    """
+    Chunks of the RSS or Atom feed of the latest blogs: all of them, or those of the
+    category or tag (`scope`) with this slug.
+    """
+    blogs = Blog.objects.all()
+    title = 'Latest blogs'
+    if scope is not None:
+        model = Category if scope == 'category' else Tag
+        found = model.objects.filter(slug=slug).order_by('id').values_list('id', 'title').first()
+        if found is None:
+            raise Http404
+        blogs = blogs.filter(category_id=found[0]) if scope == 'category' else blogs.filter(tags=found[0])
+        title = f'Latest blogs in {found[1]}' if scope == 'category' else f'Latest blogs tagged {found[1]}'
+
+    rows = blogs.order_by('-created_date', '-id') \
+                .values_list('title', 'slug', 'excerpt', 'created_date', 'category__title')[:FEED_ITEMS]
+    blog_url = _blog_url(request)
+    home = request.build_absolute_uri(reverse('all-blogs'))
+    this = request.build_absolute_uri()
+    updated = last_modified()
+
+    if kind == 'rss':
+        head = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+            f'<title>{_text(title)}</title><link>{_text(home)}</link><description>{_text(title)}</description>'
+            f'<atom:link href={_attr(this)} rel="self"/><lastBuildDate>{http_date(updated)}</lastBuildDate>'
+        )
+        tail = '</channel></rss>\n'
+
+        def render(row):
+            title, slug, excerpt, created_date, category = row
+            link = _text(blog_url.format(slug=slug))
+            return (
+                f'<item><title>{_text(title)}</title><link>{link}</link><guid>{link}</guid>'
+                f'<description>{_text(excerpt)}</description><category>{_text(category)}</category>'
+                f'<pubDate>{http_date(_timestamp(created_date))}</pubDate></item>'
+            )
+    else:
+        head = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom">'
+            f'<title>{_text(title)}</title><link href={_attr(home)}/><link href={_attr(this)} rel="self"/>'
+            f'<id>{_text(this)}</id><updated>{time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(updated))}</updated>'
+            f'<author><name>{_text(request.get_host())}</name></author>'
+        )
+        tail = '</feed>\n'
+
+        def render(row):
+            title, slug, excerpt, created_date, category = row
+            link = blog_url.format(slug=slug)
+            return (
+                f'<entry><title>{_text(title)}</title><link href={_attr(link)}/><id>{_text(link)}</id>'
+                f'<updated>{created_date.isoformat()}T00:00:00Z</updated><summary>{_text(excerpt)}</summary>'
+                f'<category term={_attr(category)}/></entry>'
+            )
+
+    def chunks():
+        yield head
+        yield from _chunks((row for row in rows.iterator() if row[1]), render)
+        yield tail
+    return chunks()
+
+
+def sitemap_index(request):
+    """
+    Chunks of the sitemap index, one sitemap per SITEMAP_SHARD_SIZE range of blog ids.
+    """
+    ids = Blog.objects.aggregate(first=Min('id'), last=Max('id'))
+    shards = range(ids['first'] // SITEMAP_SHARD_SIZE, ids['last'] // SITEMAP_SHARD_SIZE + 1) if ids['first'] else ()
+
+    def chunks():
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
+        yield from _chunks(shards, lambda shard: (
+            f"<sitemap><loc>{_text(request.build_absolute_uri(reverse('sitemap-shard', args=[shard])))}</loc></sitemap>"
+        ))
+        yield '</sitemapindex>\n'
+    return chunks()
+
+
+def sitemap(request, shard):
+    """
+    Chunks of the sitemap of the blogs with ids in the `shard`-th SITEMAP_SHARD_SIZE range.
+    """
+    blogs = Blog.objects.filter(id__gte=shard * SITEMAP_SHARD_SIZE, id__lt=(shard + 1) * SITEMAP_SHARD_SIZE)
+    if not blogs.exists():
+        raise Http404
+    rows = blogs.order_by('id').values_list('slug', 'created_date')
+    blog_url = _blog_url(request)
+
+    def chunks():
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
+        yield from _chunks((row for row in rows.iterator(chunk_size=CHUNK_ROWS) if row[0]), lambda row: (
+            f'<url><loc>{_text(blog_url.format(slug=row[0]))}</loc><lastmod>{row[1].isoformat()}</lastmod></url>'
+        ))
+        yield '</urlset>\n'
+    return chunks()
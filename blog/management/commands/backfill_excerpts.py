@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.excerpt import generate_excerpt
+from blog.models import Blog
+
+
+class Command(BaseCommand):
+    help = "Generate the stored excerpt of blogs saved before excerpts existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Blogs updated per transaction")
+        parser.add_argument('--all', action='store_true', help="Regenerate every excerpt, not only empty ones")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Blog.objects.all() if options['all'] else Blog.objects.filter(excerpt='')
+
+        # Walk the table by primary key, reading only the columns needed
+        updated, last_id = 0, 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'description')[:batch_size]
+            )
+            if not rows:
+                break
+            with transaction.atomic():
+                Blog.objects.bulk_update(
+                    [Blog(pk=pk, excerpt=generate_excerpt(description)) for pk, description in rows],
+                    ['excerpt'],
+                )
+            updated += len(rows)
+            last_id = rows[-1][0]
+
+        self.stdout.write(self.style.SUCCESS(f"Generated excerpts for {updated} blogs"))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from blog.benchmark import measure, seeded_corpus
+from blog.views import BlogListView
+from config.middleware import CompressionMiddleware, brotli
+from config.renderers import FastJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = "Compare JSON encode time and bytes on the wire for /api/all-blogs/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blogs', type=int, default=500, help="Blogs to seed (rolled back afterwards)")
+        parser.add_argument('--page-sizes', default='4,25,100', help="Comma-separated page sizes")
+        parser.add_argument('--repeat', type=int, default=50, help="Runs per measurement (median is reported)")
+
+    def handle(self, *args, **options):
+        view = BlogListView.as_view()
+        compression = CompressionMiddleware(lambda request: None)
+        self.stdout.write(f"orjson: {'yes' if orjson else 'no'}, brotli: {'yes' if brotli else 'no'}")
+
+        with seeded_corpus(options['blogs']):
+            self.stdout.write(
+                f"{'page size':>10} {'json':>9} {'orjson':>9} {'raw bytes':>10} {'gzip':>8} {'br':>8}"
+            )
+            for size in (int(size) for size in options['page_sizes'].split(',')):
+                request = APIRequestFactory().get(
+                    '/api/all-blogs/', {'page_size': size}, HTTP_HOST=settings.ALLOWED_HOSTS[0]
+                )
+                data = view(request).data
+
+                stdlib = measure(lambda: JSONRenderer().render(data), options['repeat'])
+                fast = measure(lambda: FastJSONRenderer().render(data), options['repeat'])
+
+                body = FastJSONRenderer().render(data)
+                gzipped = len(compression.compress(body, 'gzip'))
+                brotlied = len(compression.compress(body, 'br')) if brotli else '-'
+                self.stdout.write(
+                    f"{size:>10} {stdlib:>6.3f} ms {fast:>6.3f} ms {len(body):>10} {gzipped:>8} {brotlied:>8}"
+                )
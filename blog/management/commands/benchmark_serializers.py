@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import BooleanField, Value
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from blog.benchmark import measure, seeded_corpus
+from blog.fast_serializers import BlogValuesSerializer
+from blog.models import Blog
+from blog.serializers import BlogSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare BlogSerializer and BlogValuesSerializer render times per page size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blogs', type=int, default=500, help="Blogs to seed (rolled back afterwards)")
+        parser.add_argument('--tags', type=int, default=3, help="Tags per blog")
+        parser.add_argument('--reviews', type=int, default=5, help="Reviews per blog")
+        parser.add_argument('--page-sizes', default='4,10,25,50,100', help="Comma-separated page sizes")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per measurement (median is reported)")
+
+    def handle(self, *args, **options):
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        context = {'request': Request(APIRequestFactory().get('/api/all-blogs/'))}
+
+        with seeded_corpus(options['blogs'], options['tags'], options['reviews']):
+            # Same queryset as BlogListView for an anonymous user
+            queryset = Blog.objects.annotate(is_favourited=Value(False, output_field=BooleanField())) \
+                                   .order_by('-created_date')
+
+            self.stdout.write(f"{'page size':>10} {'BlogSerializer':>16} {'values()':>10} {'speedup':>8}")
+            for size in page_sizes:
+                def model_serializer():
+                    page = queryset.select_related('user').prefetch_related('tags', 'blog_reviews__user')[:size]
+                    return BlogSerializer(page, many=True, context=context).data
+
+                def values_serializer():
+                    page = BlogValuesSerializer.project(queryset)[:size]
+                    return BlogValuesSerializer(page, many=True, context=context).data
+
+                baseline = measure(model_serializer, options['repeat'])
+                fast = measure(values_serializer, options['repeat'])
+                self.stdout.write(
+                    f"{size:>10} {baseline:>13.2f} ms {fast:>7.2f} ms {baseline / fast:>7.1f}x"
+                )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.changes import compact_changes
+from blog.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = "Delete change feed entries superseded by a later entry for the same object, and old deletions"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            deleted = compact_changes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} superseded or expired entries, {ChangeLogEntry.objects.count()} left"
+        ))
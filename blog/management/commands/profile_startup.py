@@ -0,0 +1,115 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Endpoints requested by default, each one twice: cold and warm
+DEFAULT_PATHS = (
+    '/api/all-blogs/',
+    '/api/blogs/',
+    '/api/categories/',
+    '/api/tags/',
+    '/api/search/?find=a',
+    '/api/filter-category/?category=1',
+    '/api/filter-tags/?tags=a',
+    '/api/favourites/',
+    '/api/profile/',
+)
+
+# Project packages whose import time is reported
+PROJECT_PACKAGES = ('config', 'blog', 'users')
+
+# Runs in a fresh interpreter started with `-X importtime`, so nothing is imported yet
+# Prints one JSON line with the timings, import times are read from stderr
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+result = {'setup_ms': (time.perf_counter() - started) * 1000, 'warmup': {}, 'requests': []}
+
+options = json.loads(sys.argv[1])
+if options['warm']:
+    from config.warmup import warm_up
+    result['warmup'] = warm_up(force=True)
+
+from django.test import Client
+client = Client(HTTP_HOST=options['host'])
+for path in options['paths']:
+    timings = []
+    for _ in range(2):
+        started = time.perf_counter()
+        status = client.get(path).status_code
+        timings.append((time.perf_counter() - started) * 1000)
+    result['requests'].append({'path': path, 'status': status, 'first_ms': timings[0], 'second_ms': timings[1]})
+print(json.dumps(result))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = "Report import time per project module and first-request latency per endpoint in a fresh process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help="Endpoint to request (repeatable)")
+        parser.add_argument('--warm', action='store_true', help="Run the startup warm-up before the first request")
+        parser.add_argument('--top', type=int, default=15, help="Number of slowest project modules to list")
+        parser.add_argument(
+            '--fail-above', type=float, default=None,
+            help="Exit with an error when setup or any first request takes longer (ms)",
+        )
+
+    def handle(self, *args, **options):
+        child_options = {
+            'warm': options['warm'],
+            'host': settings.ALLOWED_HOSTS[0],
+            'paths': options['paths'] or list(DEFAULT_PATHS),
+        }
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, json.dumps(child_options)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"Profiling process failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+        self.report_imports(completed.stderr, options['top'])
+        self.stdout.write(f"\ndjango.setup(): {result['setup_ms']:.1f} ms")
+        for step, elapsed in result['warmup'].items():
+            self.stdout.write(f"warm-up {step}: {elapsed:.1f} ms")
+
+        self.stdout.write(f"\n{'endpoint':<40} {'status':>6} {'first':>10} {'second':>10}")
+        for request in result['requests']:
+            self.stdout.write(
+                f"{request['path']:<40} {request['status']:>6} "
+                f"{request['first_ms']:>7.1f} ms {request['second_ms']:>7.1f} ms"
+            )
+
+        threshold = options['fail_above']
+        if threshold is not None:
+            slow = [request['path'] for request in result['requests'] if request['first_ms'] > threshold]
+            if result['setup_ms'] > threshold:
+                slow.insert(0, 'django.setup()')
+            if slow:
+                raise CommandError(f"Above {threshold:g} ms: {', '.join(slow)}")
+
+    def report_imports(self, stderr, top):
+        # `-X importtime` lines: self time | cumulative time | nested module name (microseconds)
+        modules = []
+        for line in stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match and match.group(4).split('.')[0] in PROJECT_PACKAGES:
+                modules.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+
+        total = sum(self_us for _, self_us, _ in modules)
+        self.stdout.write(f"Project modules: {len(modules)}, own import time {total / 1000:.1f} ms")
+        self.stdout.write(f"{'module':<40} {'self':>10} {'cumulative':>12}")
+        for cumulative_us, self_us, name in sorted(modules, reverse=True)[:top]:
+            self.stdout.write(f"{name:<40} {self_us / 1000:>7.1f} ms {cumulative_us / 1000:>9.1f} ms")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.counters import rebuild_archive, reconcile_blog_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the maintained blog_count columns of categories and tags and the monthly archive"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            categories, tags = reconcile_blog_counts()
+            archive_rows = rebuild_archive()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled blog counts for {categories} categories and {tags} tags, "
+            f"rebuilt {archive_rows} archive rows"
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.duplicates import flag_duplicates, index_corpus, scan_corpus
+
+
+class Command(BaseCommand):
+    help = "Sign the blogs that have no MinHash signature yet and list the near-duplicate pairs of the corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Sign every blog again, e.g. after changing the shingling")
+        parser.add_argument('--threshold', type=float, help="Smallest estimated similarity reported, DUPLICATE_THRESHOLD by default")
+        parser.add_argument('--flag', action='store_true', help="Store the result as the near-duplicate flags shown in the admin")
+        parser.add_argument('--show', type=int, default=20, help="Number of pairs listed")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            signed = index_corpus(rebuild=options['rebuild'])
+        self.stdout.write(f"Signed {signed} blogs")
+
+        duplicates, compared = scan_corpus(options['threshold'])
+        self.stdout.write(f"{len(duplicates)} near-duplicate pairs among {compared} candidate pairs")
+        for newer, older, score in duplicates[:options['show']]:
+            self.stdout.write(f"  blog {newer} ~ blog {older}: {score:.2f}")
+
+        if options['flag']:
+            with transaction.atomic():
+                flagged = flag_duplicates(duplicates)
+            self.stdout.write(self.style.SUCCESS(f"Flagged {flagged} blogs as near-duplicates"))
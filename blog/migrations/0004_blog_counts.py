@@ -0,0 +1,48 @@
+# Generated by Django 5.1.5 on 2026-10-19 03:09
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_blog_counts(apps, schema_editor):
+    Blog = apps.get_model('blog', 'Blog')
+    Category = apps.get_model('blog', 'Category')
+    Tag = apps.get_model('blog', 'Tag')
+
+    category_counts = Blog.objects.filter(category=OuterRef('pk')).order_by() \
+                                  .values('category').annotate(total=Count('pk')).values('total')
+    tag_counts = Blog.tags.through.objects.filter(tag=OuterRef('pk')).order_by() \
+                                          .values('tag').annotate(total=Count('pk')).values('total')
+
+    Category.objects.update(blog_count=Coalesce(Subquery(category_counts, output_field=IntegerField()), Value(0)))
+    Tag.objects.update(blog_count=Coalesce(Subquery(tag_counts, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='blog_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='blog_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['-blog_count', 'title'], name='blog_category_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-blog_count', 'title'], name='blog_tag_popular_idx'),
+        ),
+        migrations.RunPython(backfill_blog_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_blog_excerpt'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blog',
+            name='created_date',
+            field=models.DateField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='favourite',
+            name='created_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='created_date',
+            field=models.DateField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.5 on 2026-10-19 03:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_archive_months(apps, schema_editor):
+    Blog = apps.get_model('blog', 'Blog')
+    ArchiveMonth = apps.get_model('blog', 'ArchiveMonth')
+
+    months = Blog.objects.order_by().annotate(year=ExtractYear('created_date'), month=ExtractMonth('created_date'))
+    rows = [
+        ArchiveMonth(year=row['year'], month=row['month'], blog_count=row['total'])
+        for row in months.values('year', 'month').annotate(total=Count('pk'))
+    ]
+    rows += [
+        ArchiveMonth(year=row['year'], month=row['month'], category_id=row['category'], blog_count=row['total'])
+        for row in months.values('year', 'month', 'category').annotate(total=Count('pk'))
+    ]
+    ArchiveMonth.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('blog_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['created_date', 'id'], name='blog_archive_keyset_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivemonth',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archive_months', to='blog.category'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivemonth',
+            constraint=models.UniqueConstraint(fields=('year', 'month', 'category'), name='blog_archive_month_category_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivemonth',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('year', 'month'), name='blog_archive_month_total_uniq'),
+        ),
+        migrations.RunPython(backfill_archive_months, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-19 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogSignature',
+            fields=[
+                ('blog', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='blog.blog')),
+                ('minhash', models.BinaryField()),
+                ('similarity', models.FloatField(blank=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='blog.blog')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='blog.blog')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='blog_lsh_bucket_idx')],
+            },
+        ),
+    ]
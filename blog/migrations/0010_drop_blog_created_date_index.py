@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blog',
+            name='created_date',
+            field=models.DateField(auto_now_add=True),
+        ),
+    ]
@@ -2,35 +2,55 @@ from django.db import models
 from users.models import User
 from django.utils.text import slugify
 from .slug import generate_unique_slug
+from .excerpt import generate_excerpt
+from .tracking import ChangeTrackingMixin
 # Create your models here.
 
-class Category(models.Model):
+class Category(ChangeTrackingMixin, models.Model):
     title=models.CharField(max_length=150, unique=True)
     slug=models.SlugField(null=True, blank=True)
     created_date=models.DateField(auto_now_add=True)
+    blog_count=models.PositiveIntegerField(default=0) # Maintained by signals, see blog/signals.py
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-blog_count', 'title'], name='blog_category_popular_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.title
     
     def save(self,*args,**kwargs):
-        self.slug=slugify(self.title)
+        # Only re-slugify when the title really changed
+        # ChangeTrackingMixin then writes just the modified columns
+        if 'title' in self.changed_fields or not self.slug:
+            self.slug=slugify(self.title)
         super().save(*args,**kwargs)
         
 
-class Tag(models.Model):
+class Tag(ChangeTrackingMixin, models.Model):
     title=models.CharField(max_length=150)
-    slug=models.SlugField(null=True,blank=True)
+    slug=models.SlugField(null=True,blank=True) # SlugField is indexed, used for prefix lookups
     created_date=models.DateField(auto_now_add=True)
+    blog_count=models.PositiveIntegerField(default=0) # Maintained by signals, see blog/signals.py
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-blog_count', 'title'], name='blog_tag_popular_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.title
     
     def save(self,*args,**kwargs):
-        self.slug=slugify(self.title)
+        # Only re-slugify when the title really changed
+        # ChangeTrackingMixin then writes just the modified columns
+        if 'title' in self.changed_fields or not self.slug:
+            self.slug=slugify(self.title)
         super().save(*args,**kwargs)
 
 
-class Blog(models.Model):
+class Blog(ChangeTrackingMixin, models.Model):
     user=models.ForeignKey(User,related_name='user_blogs',on_delete=models.CASCADE)
     category=models.ForeignKey(Category,related_name='category_blogs',on_delete=models.CASCADE)
     tags=models.ManyToManyField(Tag,related_name='tag_blogs',blank=True)
@@ -38,8 +58,15 @@ class Blog(models.Model):
     slug=models.SlugField(null=True, blank=True)
     banner=models.ImageField(blank=True, upload_to='blog_banners/')
     description=models.TextField()
+    excerpt=models.CharField(max_length=300, blank=True, editable=False) # Generated from the description on save
     created_date=models.DateField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination of the monthly archive, newest first
+            # Also serves the admin's date filter and ordering, it leads with `created_date`
+            models.Index(fields=['created_date', 'id'], name='blog_archive_keyset_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.title
@@ -55,14 +82,28 @@ class Blog(models.Model):
         updating = self.pk is not None # Check if the object is being updated
 
         if updating:
-            # Fetch the original object to check if the title has changed
-            original = Blog.objects.get(pk=self.pk)
-            if original.title != self.title: # Check if the title has changed
+            if self.is_tracked:
+                # Compare with the value the blog was loaded with, no extra query needed
+                title_changed = 'title' in self.changed_fields
+            else:
+                # Fetch the original object to check if the title has changed
+                title_changed = Blog.objects.filter(pk=self.pk).values_list('title', flat=True).first() != self.title
+            if title_changed: # Check if the title has changed
                 self.slug = generate_unique_slug(self, self.title, update=True) # Generate a new slug
         else:
             # Generate slug only for new objects
             self.slug = generate_unique_slug(self, self.title)
         
+        # Store a short plain-text excerpt so list views never need the full description
+        if 'description' in self.changed_fields:
+            self.excerpt = generate_excerpt(self.description)
+
+        # Keep derived columns in step when the caller limits the update
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            derived = {'title': 'slug', 'description': 'excerpt'}
+            kwargs['update_fields'] = set(update_fields) | {derived[name] for name in update_fields if name in derived}
+        
         super().save(*args, **kwargs)
 
     
@@ -72,13 +113,14 @@ class Blog(models.Model):
         # This property is used in the BlogDetailSerializer
         # It returns all blogs in the same category except the current blog
         # This is used to display related blogs on the blog detail page
-        return self.category.category_blogs.all().exclude(pk=self.pk)
+        # Filter on `category_id` so the category itself is never loaded
+        return Blog.objects.filter(category_id=self.category_id).exclude(pk=self.pk)
 
 
 class Favourite(models.Model):
     user = models.ForeignKey(User, related_name='favourites', on_delete=models.CASCADE)
     blog = models.ForeignKey(Blog, related_name='favourited_by', on_delete=models.CASCADE)
-    created_date = models.DateTimeField(auto_now_add=True)
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'blog')
@@ -92,7 +134,81 @@ class Review(models.Model):
     blog = models.ForeignKey(Blog,related_name='blog_reviews',on_delete=models.CASCADE)
     comment = models.TextField(max_length=500)
     rating = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)],null=True)
-    created_date = models.DateField(auto_now_add=True)
+    created_date = models.DateField(auto_now_add=True, db_index=True)
     
     def __str__(self) -> str:
-        return self.comment
\ No newline at end of file
+        return self.comment
+
+# Number of blogs created per month, in total and per category
+# Maintained by signals (see blog/signals.py) so the archive sidebar never runs a GROUP BY
+# Rows with an empty category hold the totals over all categories
+class ArchiveMonth(models.Model):
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    category = models.ForeignKey(Category, related_name='archive_months', null=True, blank=True, on_delete=models.CASCADE)
+    blog_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month', 'category'], name='blog_archive_month_category_uniq'),
+            # NULLs never compare equal, so the totals need their own constraint
+            models.UniqueConstraint(
+                fields=['year', 'month'], condition=models.Q(category__isnull=True), name='blog_archive_month_total_uniq'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.year}-{self.month:02d}: {self.blog_count}"
+
+
+# Append-only log of changes behind the /api/changes/ feed
+# Written by signals in the same transaction as the change itself (see blog/changes.py)
+# The auto-incremented id is the sync cursor
+class ChangeLogEntry(models.Model):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(CREATE, 'Create'), (UPDATE, 'Update'), (DELETE, 'Delete')]
+
+    model = models.CharField(max_length=20) # blog, review, tag, category or favourite
+    object_id = models.BigIntegerField() # For favourites, the id of the blog
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    user = models.ForeignKey(User, related_name='change_log', null=True, blank=True, on_delete=models.CASCADE) # Only set on entries visible to one user
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id'], name='blog_changelog_object_idx'), # Used by compaction
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.action} {self.model} {self.object_id}"
+
+
+# MinHash signature of a blog's title and description, for near-duplicate detection
+# Written by a signal whenever either changes (see blog/duplicates.py)
+class BlogSignature(models.Model):
+    blog = models.OneToOneField(Blog, related_name='signature', primary_key=True, on_delete=models.CASCADE)
+    minhash = models.BinaryField() # NUM_PERM unsigned 32-bit values
+    duplicate_of = models.ForeignKey(Blog, related_name='+', null=True, blank=True, on_delete=models.SET_NULL) # Most similar older blog
+    similarity = models.FloatField(null=True, blank=True) # Estimated Jaccard similarity with `duplicate_of`
+    updated_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Signature of blog {self.blog_id}"
+
+
+# Locality-sensitive hashing bands of the signatures
+# Blogs sharing a bucket in any band are the candidates compared with a new blog
+class SignatureBand(models.Model):
+    blog = models.ForeignKey(Blog, related_name='signature_bands', on_delete=models.CASCADE)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField() # Hash of the band's rows of the signature
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='blog_lsh_bucket_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Band {self.band} of blog {self.blog_id}"
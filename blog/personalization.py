@@ -0,0 +1,122 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .favourite_buffer import get_favourite_buffer
+from .models import Favourite
+from .refcache import bump_version, bump_versions, get_version
+
+
+# Shared blog payloads with a per-user favourite overlay
+# The blog list and detail responses only differ between users in `is_favourited`.
+# They are computed once as the anonymous payload (`is_favourited` false), cached under
+# the request URL and the 'blog-payload' version stamp, and shared by every user.
+# For a signed-in user `is_favourited` is then set from the ids of the blogs they
+# favourited, loaded with one query and cached per user.
+# Payloads are cached per URL for the recognized query parameters only, a URL with any
+# other parameter is computed every time rather than adding a cache entry per junk query.
+# Blog, review, tag, category and username changes bump the stamp (blog/signals.py).
+# The id sets are cached under a per-user stamp, which favourite writes bump once committed
+# (blog/signals.py, blog/favourite_buffer.py): a set loaded before a write and cached
+# after it lands under the old stamp and is never read.
+# Both live in the shared cache (CACHES): with a per-process cache, the other processes
+# would keep showing old favourites and payloads until their timeouts.
+
+BLOG_PAYLOAD_CACHE_TIMEOUT = getattr(settings, 'BLOG_PAYLOAD_CACHE_TIMEOUT', 60)
+FAVOURITE_IDS_CACHE_TIMEOUT = getattr(settings, 'FAVOURITE_IDS_CACHE_TIMEOUT', 300)
+PAYLOAD_VERSION = 'blog-payload'
+
+
+def can_share(fields):
+    """
+    Whether a payload with these fields can be shared: the overlay needs the blog ids.
+    """
+    return 'is_favourited' not in fields or 'id' in fields
+
+
+def shared_payload(request, compute, params=()):
+    """
+    Return the cached payload for this URL, or cache what `compute()` returns.
+    `compute` must build the anonymous payload. Only URLs whose query parameters are
+    among `params`, each given once, are cached, keyed on the parameters in sorted order.
+    """
+    query = request.query_params
+    if any(name not in params or len(query.getlist(name)) > 1 for name in query):
+        return compute()
+    url = f'{request.build_absolute_uri(request.path)}?{urlencode(sorted(query.items()))}'
+    url = hashlib.sha1(url.encode()).hexdigest() # Banner URLs and page links include the host
+    key = f'blog-payload:{get_version(PAYLOAD_VERSION)}:{url}'
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, BLOG_PAYLOAD_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_shared_payloads():
+    # Once the change is committed, so a request in between can not cache the old payload again
+    transaction.on_commit(lambda: bump_version(PAYLOAD_VERSION))
+
+
+def _favourites_version(user_id):
+    return f'favourites:{user_id}'
+
+
+def _favourite_ids_key(user_id):
+    version = get_version(_favourites_version(user_id), FAVOURITE_IDS_CACHE_TIMEOUT)
+    return f'favourite-ids:{user_id}:{version}'
+
+
+def favourite_ids(user):
+    """
+    The ids of the blogs this user favourited, including toggles still in the write buffer.
+    """
+    key = _favourite_ids_key(user.id) # Before the query, see above
+    ids = cache.get(key)
+    if ids is None:
+        ids = set(Favourite.objects.filter(user=user).values_list('blog_id', flat=True))
+        cache.set(key, ids, FAVOURITE_IDS_CACHE_TIMEOUT)
+
+    buffer = get_favourite_buffer()
+    if buffer is not None:
+        added, removed = buffer.pending_for_user(user.id)
+        ids = (ids | added) - removed
+    return ids
+
+
+def invalidate_favourite_ids(user_ids):
+    """
+    Bump the stamps of these users' cached id sets once the current transaction commits.
+    Never patched: a read, change and write of the set would lose concurrent toggles.
+    """
+    names = [_favourites_version(user_id) for user_id in set(user_ids)]
+    if names:
+        transaction.on_commit(lambda: bump_versions(names, FAVOURITE_IDS_CACHE_TIMEOUT))
+
+
+def personalize(data, user):
+    """
+    Set `is_favourited` for the user in a shared list, page or detail payload.
+    Returns new dicts, the shared payload is left as it is.
+    """
+    if not user.is_authenticated:
+        return data
+
+    ids = None
+
+    def overlay(blog):
+        nonlocal ids
+        if 'is_favourited' not in blog:
+            return blog
+        if ids is None:
+            ids = favourite_ids(user)
+        return {**blog, 'is_favourited': blog['id'] in ids}
+
+    if isinstance(data, list):
+        return [overlay(blog) for blog in data]
+    if 'results' in data:
+        return {**data, 'results': [overlay(blog) for blog in data['results']]}
+    return overlay(data)
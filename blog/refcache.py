@@ -0,0 +1,167 @@
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Version stamps
+# A stamp is a value kept in the Django cache and replaced whenever the data it
+# guards changes. Process-local copies remember the stamp they were built from
+# and reload when it moves on. The cache must be shared by every process (see
+# CACHES in config/settings.py), a per-process LocMemCache would keep each
+# process on its own stamps and its stale copies
+def _version_key(name):
+    return f'refcache:version:{name}'
+
+
+def _new_version():
+    # Unique rather than incremented: the file and database backends do not increment
+    # atomically, and two bumps ending on the same value would hide the second change
+    return f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+
+
+# Stamps are unique, so one that expires (with a `timeout`) only makes its copies miss
+def get_version(name, timeout=None):
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), _new_version(), timeout=timeout)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def bump_version(name, timeout=None):
+    bump_versions([name], timeout)
+
+
+def bump_versions(names, timeout=None):
+    cache.set_many({_version_key(name): _new_version() for name in names}, timeout=timeout)
+
+
+# Stamps checked during the current request, so a list page reads each stamp once
+# instead of once per row. Outside requests (commands, workers) every lookup checks
+_checked = threading.local()
+
+
+def start_request_checks():
+    _checked.versions = {}
+
+
+def end_request_checks():
+    _checked.versions = None
+
+
+def _checked_version(name):
+    versions = getattr(_checked, 'versions', None)
+    if versions is None:
+        return get_version(name)
+    if name not in versions:
+        versions[name] = get_version(name)
+    return versions[name]
+
+
+# Process-local reference data cache
+# Loads a small table once per process and serves lookups from memory
+class ReferenceCache:
+
+    # A complete cache reloads on a primary key miss (at most once per second),
+    # which picks up rows created by processes that do not share the cache
+    def __init__(self, name, loader, complete=True, max_size=None):
+        self.name = name
+        self._loader = loader # Returns an iterable of model instances
+        self._complete = complete
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = 0.0
+        self._by_pk = {}
+        self._by_title = {}
+
+    def _current(self):
+        version = _checked_version(self.name)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    objects = list(self._loader())
+                    self._by_pk = {obj.pk: obj for obj in objects}
+                    self._by_title = {obj.title: obj for obj in objects}
+                    self._version = version
+                    self._loaded_at = time.monotonic()
+        return self._by_pk, self._by_title
+
+    def _lookup(self, pk):
+        obj = self._current()[0].get(pk)
+        if obj is None and self._complete and time.monotonic() - self._loaded_at > 1.0:
+            self._version = None
+            obj = self._current()[0].get(pk)
+        return obj
+
+    def get(self, pk):
+        """
+        Return a copy of the cached instance with this primary key, or None.
+        Copies keep callers from mutating the shared instance.
+        """
+        obj = self._lookup(pk)
+        return copy.copy(obj) if obj is not None else None
+
+    def get_by_title(self, title):
+        obj = self._current()[1].get(title)
+        return copy.copy(obj) if obj is not None else None
+
+    def title(self, pk):
+        obj = self._lookup(pk)
+        return obj.title if obj is not None else None
+
+    def remember(self, obj):
+        """
+        Add an instance looked up in the database, so the next lookup is a hit.
+        Call it once the instance is committed (`transaction.on_commit`): a row created
+        in a transaction that rolls back must not stay in the cache.
+        """
+        self._current()
+        with self._lock:
+            if self._max_size is not None and len(self._by_pk) >= self._max_size:
+                return
+            self._by_pk[obj.pk] = copy.copy(obj)
+            self._by_title[obj.title] = self._by_pk[obj.pk]
+
+    def warm(self):
+        """
+        Load the cache now instead of on the first lookup.
+        """
+        self._current()
+
+    def invalidate(self):
+        """
+        Reload in every process once the current transaction commits. Bumping earlier would
+        let another process reload the old rows under the new stamp and keep them.
+        """
+        transaction.on_commit(self._invalidate_now)
+
+    def _invalidate_now(self):
+        self._version = None # Reload in this process right away
+        bump_version(self.name) # And in every process sharing the cache
+        versions = getattr(_checked, 'versions', None)
+        if versions is not None:
+            versions.pop(self.name, None) # Including the rest of this request
+
+
+def _load_categories():
+    from .models import Category
+    return Category.objects.all()
+
+
+TAG_CACHE_SIZE = getattr(settings, 'TAG_CACHE_SIZE', 500)
+
+
+def _load_hot_tags():
+    # Only the most used tags are kept, the rest is looked up in the database
+    from .models import Tag
+    return Tag.objects.order_by('-blog_count', 'title')[:TAG_CACHE_SIZE]
+
+
+category_cache = ReferenceCache('category', _load_categories)
+tag_cache = ReferenceCache('tag', _load_hot_tags, complete=False, max_size=TAG_CACHE_SIZE)
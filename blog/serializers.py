@@ -1,24 +1,64 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from .models import (
     Blog,
     Category,
     Tag,
-    Favourite,
     Review,
 )
+from jobs.queue import enqueue
+from .refcache import category_cache, tag_cache
+
+
+# Sparse fieldsets
+# `?fields=a,b` keeps only the listed fields and `?exclude=a,b` drops fields
+# `default_exclude` is dropped too, unless the field is asked for in `?fields=`
+# Only read requests are affected, so writes always validate every field
+def resolve_fieldset(request, available, default_exclude=()):
+    available = list(available)
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return available
+
+    params = getattr(request, 'query_params', request.GET)
+    requested = {name.strip() for name in params.get('fields', '').split(',') if name.strip()}
+    excluded = {name.strip() for name in params.get('exclude', '').split(',') if name.strip()}
+
+    if requested:
+        selected = [name for name in available if name in requested]
+    else:
+        selected = [name for name in available if name not in default_exclude]
+    return [name for name in selected if name not in excluded]
+
+
+class SparseFieldsetMixin:
+    """
+    Drop readable fields that were not selected with `?fields=` / `?exclude=`.
+    Write-only fields are always kept.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        readable = [name for name, field in fields.items() if not field.write_only]
+        selected = set(resolve_fieldset(self.context.get('request'), readable))
+        return {
+            name: field for name, field in fields.items()
+            if field.write_only or name in selected
+        }
 
 # Category Serializer
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['id', 'title', 'slug']
+        fields = ['id', 'title', 'slug', 'blog_count']
+        read_only_fields = ['blog_count']
 
 # Tag Serializer
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = ['id', 'title', 'slug']
+        fields = ['id', 'title', 'slug', 'blog_count']
+        read_only_fields = ['blog_count']
 
 # Review Serializer
 class ReviewSerializer(serializers.ModelSerializer):
@@ -30,11 +70,46 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ["id", 'user', 'title', 'comment', 'rating', 'created_date']
 
 
+# Review Create Serializer
+# Used by the review-write path of BlogDetailView
+# Returns the same payload as ReviewSerializer without resolving the blog
+class ReviewCreateSerializer(serializers.ModelSerializer):
+    user = serializers.CharField(source='user.username', read_only=True) # Use the username for the user
+    rating = serializers.IntegerField(min_value=1, max_value=5, required=False, allow_null=True) # Ratings go from 1 to 5
 
-class BlogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Review
+        fields = ["id", 'user', 'comment', 'rating', 'created_date']
+
+
+
+# Category field validated against the process-local category cache
+# Falls back to the database for categories the cache has not seen yet
+class CachedCategoryField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        if not isinstance(data, bool):
+            try:
+                category = category_cache.get(int(data))
+            except (TypeError, ValueError):
+                category = None
+            if category is not None:
+                return category
+        return super().to_internal_value(data)
+
+
+# Category title read from the category cache instead of the related object
+class CachedCategoryTitleField(serializers.ReadOnlyField):
+    def get_attribute(self, instance):
+        title = category_cache.title(instance.category_id)
+        if title is None:
+            return str(instance.category)
+        return title
+
+
+class BlogSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     
-    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
-    category_title = serializers.StringRelatedField(source='category', read_only=True)
+    category = CachedCategoryField(queryset=Category.objects.all())
+    category_title = CachedCategoryTitleField()
     
     tags = serializers.CharField(write_only=True)  # Accept comma-separated string for tags
     tag_title = serializers.StringRelatedField(source='tags', many=True, read_only=True)
@@ -56,6 +131,7 @@ class BlogSerializer(serializers.ModelSerializer):
             'category_title',
             'banner',
             'description',
+            'excerpt',
             'tags',
             'tag_title',
             'created_date',
@@ -78,15 +154,17 @@ class BlogSerializer(serializers.ModelSerializer):
 
         if tags_data:
             # Get current tags before updating
-            old_tags = list(instance.tags.all())
+            old_tag_ids = {tag.id for tag in instance.tags.all()}
 
             # Update tags (this will replace old tags with new ones)
-            instance.tags.set(self._get_or_create_tags(tags_data))
+            new_tags = self._get_or_create_tags(tags_data)
+            instance.tags.set(new_tags)
 
-            # Delete orphaned tags (tags that are not linked to any blog)
-            for tag in old_tags:
-                if not Blog.objects.filter(tags=tag).exists():  # Check if the tag is used in any blog
-                    tag.delete()
+            # Tags that are no longer linked to any blog are deleted by a background job
+            # (see blog/tasks.py), queued once the update commits
+            removed_tag_ids = sorted(old_tag_ids - {tag.id for tag in new_tags})
+            if removed_tag_ids:
+                transaction.on_commit(lambda: enqueue('blog.delete_orphan_tags', tag_ids=removed_tag_ids))
 
         instance.save()
         return instance
@@ -95,20 +173,25 @@ class BlogSerializer(serializers.ModelSerializer):
         """
         Parse comma-separated tags and resolve to Tag objects (create if necessary).
         """
+        titles = [tag_name.strip() for tag_name in tags.split(',') if tag_name.strip()]  # Avoid empty strings
+
+        # Hot tags are served from the tag cache, checked in one query: it may still hold a tag
+        # deleted since it was loaded, and linking that one would fail the commit
+        cached = {title: tag_cache.get_by_title(title) for title in titles}
+        cached_ids = {tag_obj.id for tag_obj in cached.values() if tag_obj is not None}
+        live_ids = set(Tag.objects.filter(id__in=cached_ids).values_list('id', flat=True)) if cached_ids else set()
+        if cached_ids - live_ids:
+            tag_cache.invalidate()
+
         tag_objects = []
-        for tag_name in tags.split(','):  # Split comma-separated tags
-            tag_name = tag_name.strip()
-            if tag_name:  # Avoid empty strings
-                tag_obj, created = Tag.objects.get_or_create(title=tag_name)
-                tag_objects.append(tag_obj)
+        for title in titles:
+            tag_obj = cached[title]
+            if tag_obj is None or tag_obj.id not in live_ids:
+                tag_obj, created = Tag.objects.get_or_create(title=title)
+                # Only once committed, a tag created by a rolled back request must not be cached
+                transaction.on_commit(lambda tag=tag_obj: tag_cache.remember(tag))
+            tag_objects.append(tag_obj)
         return tag_objects
-    
-    # get_is_favourited method to check if the user is authenticated before querying:
-    def get_is_favourited(self, obj):
-        user = self.context['request'].user # Get the user from the context
-        if user.is_authenticated:
-            return Favourite.objects.filter(user=user, blog=obj).exists() # Check if the user has favourited the blog
-        return False
 
 
 # Blog Detail Serializer
@@ -122,7 +205,7 @@ class BlogDetailSerializer(BlogSerializer):
         fields = BlogSerializer.Meta.fields + ['related_blogs'] # Include related_blogs in the fields
 
     def get_related_blogs(self, obj):
-        related_blogs = obj.related # Use the property to get related blogs
+        related_blogs = obj.related.only(*RelatedBlogSerializer.Meta.fields) # Use the property to get related blogs
         return RelatedBlogSerializer(related_blogs, many=True).data # Serialize the related blogs
 
 # Related Blog Serializer
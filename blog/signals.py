@@ -0,0 +1,346 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .changes import record_change, record_changes, record_favourite_changes
+from .duplicates import detection_mode, index_blog
+from .feeds import invalidate_feeds
+from users.models import User
+from .models import ArchiveMonth, Blog, Category, ChangeLogEntry, Favourite, Review, Tag
+from .personalization import invalidate_favourite_ids, invalidate_shared_payloads
+from .refcache import category_cache, end_request_checks, start_request_checks, tag_cache
+from .stats import invalidate_author_stats, invalidate_blog_author_stats
+from .suggest import suggest_index
+
+
+# Counter helpers
+# Use queryset `update` with F expressions so concurrent writers never overwrite each other
+# `Greatest` keeps the counters from going below zero if they ever drift
+def _increment(model, pks, amount):
+    if not pks or not amount:
+        return
+    model.objects.filter(pk__in=pks).update(
+        blog_count=Greatest(F('blog_count') + amount, Value(0))
+    )
+    # Not logged in the change feed: a counter moves on every blog write, and logging it would
+    # add a row per tag each time. Clients get the counts with the next real category/tag edit
+
+
+# Category.blog_count: count blogs on create, move them on category change
+# Blog tracks its loaded values (ChangeTrackingMixin), so the previous category is known without a query
+@receiver(post_save, sender=Blog)
+def update_category_count_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _increment(Category, [instance.category_id], 1)
+    elif instance.is_tracked and 'category' in instance.changed_fields:
+        previous_category_id = instance.initial_value('category')
+        if previous_category_id is not None:
+            _increment(Category, [previous_category_id], -1)
+        _increment(Category, [instance.category_id], 1)
+
+
+# Tag.blog_count: the M2M rows are removed by the cascade without sending m2m_changed,
+# so decrement the tags while the rows still exist
+@receiver(pre_delete, sender=Blog)
+def update_tag_counts_on_delete(sender, instance, **kwargs):
+    tag_ids = Blog.tags.through.objects.filter(blog_id=instance.pk).values_list('tag_id', flat=True)
+    _increment(Tag, list(tag_ids), -1)
+
+
+@receiver(post_delete, sender=Blog)
+def update_category_count_on_delete(sender, instance, **kwargs):
+    _increment(Category, [instance.category_id], -1)
+
+
+# Tag.blog_count: keep the counters in step with `blog.tags` (and `tag.tag_blogs`) changes
+@receiver(m2m_changed, sender=Blog.tags.through)
+def update_tag_counts_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Blog.tags.through
+
+    if action == 'pre_remove':
+        # `remove` does not filter out unlinked ids, so record the rows that really exist
+        if reverse:
+            linked = through.objects.filter(tag_id=instance.pk, blog_id__in=pk_set)
+        else:
+            linked = through.objects.filter(blog_id=instance.pk, tag_id__in=pk_set)
+        instance._removed_link_count = linked.count()
+        instance._removed_tag_ids = [] if reverse else list(linked.values_list('tag_id', flat=True))
+    elif action == 'pre_clear':
+        if reverse:
+            instance._removed_link_count = through.objects.filter(tag_id=instance.pk).count()
+            instance._removed_tag_ids = []
+        else:
+            instance._removed_tag_ids = list(
+                through.objects.filter(blog_id=instance.pk).values_list('tag_id', flat=True)
+            )
+            instance._removed_link_count = len(instance._removed_tag_ids)
+
+    elif action == 'post_add':
+        # `pk_set` only holds the ids that were actually added
+        if reverse:
+            _increment(Tag, [instance.pk], len(pk_set))
+        else:
+            _increment(Tag, pk_set, 1)
+    elif action in ('post_remove', 'post_clear'):
+        if reverse:
+            _increment(Tag, [instance.pk], -getattr(instance, '_removed_link_count', 0))
+        else:
+            _increment(Tag, getattr(instance, '_removed_tag_ids', []), -1)
+
+
+# ArchiveMonth: monthly counts, in total and per category
+def _count_in_archive(day, category_id, amount, total=True):
+    for archive_category_id in ((None, category_id) if total else (category_id,)):
+        rows = ArchiveMonth.objects.filter(year=day.year, month=day.month, category_id=archive_category_id)
+        if rows.update(blog_count=Greatest(F('blog_count') + amount, Value(0))) or amount < 0:
+            continue
+        # First blog of the month, a concurrent writer may create the row first
+        try:
+            with transaction.atomic():
+                ArchiveMonth.objects.create(
+                    year=day.year, month=day.month, category_id=archive_category_id, blog_count=amount
+                )
+        except IntegrityError:
+            rows.update(blog_count=F('blog_count') + amount)
+
+
+@receiver(post_save, sender=Blog)
+def update_archive_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _count_in_archive(instance.created_date, instance.category_id, 1)
+    elif instance.is_tracked and {'category', 'created_date'} & instance.changed_fields:
+        # The totals only move with the date, a new category only moves the per-category rows
+        date_changed = 'created_date' in instance.changed_fields
+        previous_date = instance.initial_value('created_date') if date_changed else instance.created_date
+        previous_category_id = instance.initial_value('category') or instance.category_id
+        _count_in_archive(previous_date, previous_category_id, -1, total=date_changed)
+        _count_in_archive(instance.created_date, instance.category_id, 1, total=date_changed)
+
+
+@receiver(post_delete, sender=Blog)
+def update_archive_on_delete(sender, instance, **kwargs):
+    _count_in_archive(instance.created_date, instance.category_id, -1)
+
+
+# Reference data caches: bump the version stamps so every process reloads
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    category_cache.invalidate()
+
+
+# The stamps are read once per request, see blog/refcache.py
+@receiver(request_started)
+def start_reference_cache_checks(sender, **kwargs):
+    start_request_checks()
+
+
+@receiver(request_finished)
+def end_reference_cache_checks(sender, **kwargs):
+    end_request_checks()
+
+
+# New tags are simply cache misses, only renamed and deleted tags make the cache stale
+@receiver(post_save, sender=Tag)
+def invalidate_tag_cache_on_save(sender, created, **kwargs):
+    if not created:
+        tag_cache.invalidate()
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_cache_on_delete(sender, **kwargs):
+    tag_cache.invalidate()
+
+
+# Autocomplete index: patch it once the change is committed, so rolled back
+# writes never show up in suggestions
+SUGGEST_KINDS = {Blog: 'blog', Category: 'category', Tag: 'tag'}
+
+
+@receiver(post_save, sender=Blog)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def update_suggest_index_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or not instance.is_tracked or {'title', 'slug'} & instance.changed_fields:
+        kind, pk, title, slug = SUGGEST_KINDS[sender], instance.pk, instance.title, instance.slug
+        transaction.on_commit(lambda: suggest_index.update(kind, pk, title, slug))
+
+
+@receiver(post_delete, sender=Blog)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def update_suggest_index_on_delete(sender, instance, **kwargs):
+    kind, pk = SUGGEST_KINDS[sender], instance.pk
+    transaction.on_commit(lambda: suggest_index.remove(kind, pk))
+
+
+# Author dashboard statistics: drop the cached numbers of the author concerned
+@receiver(post_save, sender=Blog)
+def invalidate_author_stats_on_blog_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or not instance.is_tracked:
+        invalidate_author_stats([instance.user_id])
+    elif {'title', 'slug', 'created_date', 'user'} & instance.changed_fields:
+        invalidate_author_stats([instance.user_id, instance.initial_value('user')])
+
+
+@receiver(post_delete, sender=Blog)
+def invalidate_author_stats_on_blog_delete(sender, instance, **kwargs):
+    invalidate_author_stats([instance.user_id])
+
+
+def _invalidate_blog_author(instance, using):
+    # Reviews and favourites only carry the blog id: use the loaded blog when the writer
+    # passed one in, otherwise the author is looked up once for the whole transaction
+    if type(instance)._meta.get_field('blog').is_cached(instance):
+        invalidate_author_stats([instance.blog.user_id])
+    else:
+        invalidate_blog_author_stats([instance.blog_id], using)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Favourite)
+def invalidate_author_stats_on_save(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        _invalidate_blog_author(instance, using)
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Favourite)
+def invalidate_author_stats_on_delete(sender, instance, origin=None, using='default', **kwargs):
+    # Deleting a blog cascades to its reviews and favourites, the blog handler covers those
+    if isinstance(origin, Blog) or getattr(origin, 'model', None) is Blog:
+        return
+    _invalidate_blog_author(instance, using)
+
+
+# Change feed: log every change on the connection of the write, see blog/changes.py
+@receiver(post_save, sender=Blog)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def record_change_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # An empty `update_fields` is a save that wrote nothing (blog/tracking.py)
+    if not raw and (update_fields is None or update_fields):
+        record_change(sender._meta.model_name, instance.pk, ChangeLogEntry.CREATE if created else ChangeLogEntry.UPDATE)
+
+
+@receiver(post_delete, sender=Blog)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def record_change_on_delete(sender, instance, **kwargs):
+    record_change(sender._meta.model_name, instance.pk, ChangeLogEntry.DELETE)
+
+
+# The tag titles are part of the blog payload. Deleting a tag removes its links without
+# sending m2m_changed, so log its blogs while the links still exist
+@receiver(pre_delete, sender=Tag)
+def record_change_on_tag_delete(sender, instance, **kwargs):
+    blog_ids = Blog.tags.through.objects.filter(tag_id=instance.pk).values_list('blog_id', flat=True)
+    record_changes('blog', list(blog_ids), ChangeLogEntry.UPDATE)
+
+
+@receiver(m2m_changed, sender=Blog.tags.through)
+def record_change_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        record_change('blog', instance.pk, ChangeLogEntry.UPDATE)
+    elif pk_set:
+        record_changes('blog', pk_set, ChangeLogEntry.UPDATE)
+
+
+# Favourites are logged per (user, blog) and only shown to that user
+@receiver(post_save, sender=Favourite)
+def record_favourite_change_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_favourite_changes([(instance.user_id, instance.blog_id)], ChangeLogEntry.CREATE)
+
+
+@receiver(post_delete, sender=Favourite)
+def record_favourite_change_on_delete(sender, instance, origin=None, **kwargs):
+    # The entries of a deleted user go with them, and must not point at the deleted row
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    record_favourite_changes([(instance.user_id, instance.blog_id)], ChangeLogEntry.DELETE)
+
+
+# Shared blog payloads (blog/personalization.py): anything they show changed
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_shared_payloads_on_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_shared_payloads()
+
+
+@receiver(m2m_changed, sender=Blog.tags.through)
+def invalidate_shared_payloads_on_tags_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_shared_payloads()
+
+
+# Usernames are shown on blogs and reviews, logins only save `last_login`
+@receiver(post_save, sender=User)
+def invalidate_shared_payloads_on_user_save(sender, created, update_fields=None, raw=False, **kwargs):
+    if not raw and not created and (update_fields is None or 'username' in update_fields):
+        invalidate_shared_payloads()
+
+
+# Per-user favourite id sets, dropped on every favourite write
+# Bulk creates send no post_save, the write buffer drops the sets of its batch itself
+@receiver(post_save, sender=Favourite)
+def invalidate_favourite_ids_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        invalidate_favourite_ids([instance.user_id])
+
+
+@receiver(post_delete, sender=Favourite)
+def invalidate_favourite_ids_on_delete(sender, instance, origin=None, **kwargs):
+    # The id of a deleted blog can stay in the set, it is never shown again
+    if isinstance(origin, Blog) or getattr(origin, 'model', None) is Blog:
+        return
+    invalidate_favourite_ids([instance.user_id])
+
+
+# Near-duplicate detection (blog/duplicates.py): sign new blogs and blogs whose text changed
+@receiver(post_save, sender=Blog)
+def index_blog_signature(sender, instance, created, raw=False, **kwargs):
+    if raw or not detection_mode():
+        return
+    if created or not instance.is_tracked or {'title', 'description'} & instance.changed_fields:
+        index_blog(instance)
+
+
+# Feeds and sitemaps (blog/feeds.py): their Last-Modified moves on
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_feeds_on_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_feeds()
+
+
+@receiver(m2m_changed, sender=Blog.tags.through)
+def invalidate_feeds_on_tags_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_feeds()
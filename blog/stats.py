@@ -0,0 +1,122 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Blog, Favourite, Review
+
+
+# Author dashboard statistics
+# Computed with three aggregate queries whatever the size of the author's corpus,
+# and cached per author until one of their blogs, or a review or favourite on them, changes
+# (see blog/signals.py). The cache is the shared CACHES backend, so a write in one process
+# drops the numbers for all of them. The timeout bounds staleness after writes that skip signals
+
+AUTHOR_STATS_CACHE_TIMEOUT = getattr(settings, 'AUTHOR_STATS_CACHE_TIMEOUT', 300)
+
+
+def _cache_key(user_id):
+    return f'author-stats:{user_id}'
+
+
+def _average(total, count):
+    return round(total / count, 2) if count else None
+
+
+def compute_author_stats(user_id):
+    """
+    Totals and a per-blog breakdown of what the author's blogs received.
+    """
+    blogs = Blog.objects.filter(user_id=user_id) \
+                        .order_by('-created_date', '-id') \
+                        .values('id', 'title', 'slug', 'created_date')
+    reviews = {
+        row['blog']: row
+        for row in Review.objects.filter(blog__user_id=user_id)
+                                 .order_by()
+                                 .values('blog')
+                                 .annotate(total=Count('pk'), rated=Count('rating'), rating_sum=Sum('rating'))
+    }
+    favourites = dict(
+        Favourite.objects.filter(blog__user_id=user_id)
+                         .order_by()
+                         .values('blog')
+                         .annotate(total=Count('pk'))
+                         .values_list('blog', 'total')
+    )
+
+    breakdown = []
+    review_total = rated_total = rating_sum_total = 0
+    for blog in blogs:
+        review = reviews.get(blog['id'], {'total': 0, 'rated': 0, 'rating_sum': None})
+        review_total += review['total']
+        rated_total += review['rated']
+        rating_sum_total += review['rating_sum'] or 0
+        breakdown.append({
+            'id': blog['id'],
+            'title': blog['title'],
+            'slug': blog['slug'],
+            'created_date': blog['created_date'].isoformat(),
+            'reviews_received': review['total'],
+            'average_rating': _average(review['rating_sum'] or 0, review['rated']),
+            'favourites_received': favourites.get(blog['id'], 0),
+        })
+
+    return {
+        'blog_count': len(breakdown),
+        'reviews_received': review_total,
+        'average_rating': _average(rating_sum_total, rated_total),
+        'favourites_received': sum(favourites.values()),
+        'blogs': breakdown,
+    }
+
+
+def get_author_stats(user_id):
+    stats = cache.get(_cache_key(user_id))
+    if stats is None:
+        stats = compute_author_stats(user_id)
+        cache.set(_cache_key(user_id), stats, AUTHOR_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_author_stats(user_ids):
+    """
+    Drop the cached statistics of these authors once the current transaction commits,
+    so a dashboard read in between can not cache the old numbers again.
+    """
+    keys = [_cache_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# Blog ids whose authors are still to be looked up, per thread and database
+_pending = threading.local()
+
+
+def invalidate_blog_author_stats(blog_ids, using='default'):
+    """
+    Same for the authors of these blogs, when the caller does not have them.
+    The authors are looked up once the transaction commits, in a single query for
+    every blog collected until then, so bulk and cascade deletes cost one query.
+    """
+    blog_ids = {blog_id for blog_id in blog_ids if blog_id is not None}
+    if not blog_ids:
+        return
+    pending = getattr(_pending, using, None)
+    if pending is None:
+        pending = set()
+        setattr(_pending, using, pending)
+    pending.update(blog_ids)
+
+    def look_up_authors():
+        if not pending:
+            return # Already done by a callback registered earlier in the same transaction
+        blog_ids = list(pending)
+        pending.clear()
+        user_ids = Blog.objects.using(using).filter(id__in=blog_ids).values_list('user_id', flat=True).distinct()
+        cache.delete_many([_cache_key(user_id) for user_id in set(user_ids)])
+
+    # Every call registers its callback, a savepoint rollback may drop the earlier ones
+    transaction.on_commit(look_up_authors, using=using)
@@ -0,0 +1,205 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Count
+
+
+# Prefix autocomplete index
+# Blog, tag and category titles are normalized and stored in one sorted list of
+# (key, kind, pk) tuples. Every word start of a title is a key, so "rest" finds
+# "Django REST framework". Prefixes matching more than HEAVY_PREFIX_SIZE keys get
+# their ranked results computed at build time, any other lookup is a binary search
+# plus a scan of at most HEAVY_PREFIX_SIZE keys.
+# The index is built once per process and patched in place by the save/delete signals
+# of the process that made the change. It is rebuilt every SUGGEST_REFRESH_INTERVAL
+# seconds, which picks up the changes made by other processes and the new popularity
+# weights. Other processes are not told about a change: rebuilding every index on
+# every blog, tag or category save would cost more than the staleness it avoids, so
+# the API and the admin of another worker may suggest an old title until then.
+
+Suggestion = namedtuple('Suggestion', ['kind', 'pk', 'title', 'slug', 'weight'])
+
+SUGGEST_REFRESH_INTERVAL = getattr(settings, 'SUGGEST_REFRESH_INTERVAL', 600)
+MAX_SUGGESTIONS = 20    # Most results a lookup can return
+HEAVY_PREFIX_SIZE = 64  # Prefixes matching more keys than this are ranked in advance
+RANKED_DEPTH = 2 * MAX_SUGGESTIONS # Precomputed results kept per prefix, the slack covers deletes until the next rebuild
+MAX_WORD_STARTS = 8     # Words of a title that start a key
+
+_non_alphanumeric = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """
+    Lowercase, strip accents and collapse everything but letters and digits to single spaces.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    return _non_alphanumeric.sub(' ', text).strip()
+
+
+def _keys(title):
+    words = normalize(title).split()
+    return {' '.join(words[start:]) for start in range(min(len(words), MAX_WORD_STARTS))}
+
+
+def _rank(suggestion):
+    return (-suggestion.weight, suggestion.title)
+
+
+def _top(suggestions, depth=RANKED_DEPTH):
+    unique = {(suggestion.kind, suggestion.pk): suggestion for suggestion in suggestions}
+    return heapq.nsmallest(depth, unique.values(), key=_rank)
+
+
+def _rank_heavy_prefixes(keys, entries, lo, hi, prefix, ranked):
+    # `keys[lo:hi]` all start with `prefix`. Splits the range by the next character,
+    # ranks the heavy children recursively and merges their results with the light ones
+    candidates = []
+    depth = len(prefix)
+    index = lo
+    while index < hi:
+        key = keys[index][0]
+        if len(key) == depth:
+            candidates.append(entries[keys[index][1:]])
+            index += 1
+            continue
+        child = prefix + key[depth]
+        end = bisect_left(keys, (prefix + chr(ord(key[depth]) + 1),), index, hi)
+        if end - index > HEAVY_PREFIX_SIZE:
+            candidates.extend(_rank_heavy_prefixes(keys, entries, index, end, child, ranked))
+        else:
+            candidates.extend(entries[entry[1:]] for entry in keys[index:end])
+        index = end
+    ranked[prefix] = _top(candidates)
+    return ranked[prefix]
+
+
+def _load_suggestions():
+    # Blogs are weighted by favourites, tags and categories by the number of blogs using them
+    from .models import Blog, Category, Tag
+
+    blogs = Blog.objects.order_by().annotate(weight=Count('favourited_by')) \
+                                   .values_list('id', 'title', 'slug', 'weight')
+    for pk, title, slug, weight in blogs.iterator():
+        yield Suggestion('blog', pk, title, slug, weight)
+    for kind, model in (('category', Category), ('tag', Tag)):
+        for pk, title, slug, weight in model.objects.values_list('id', 'title', 'slug', 'blog_count').iterator():
+            yield Suggestion(kind, pk, title, slug, weight)
+
+
+class SuggestIndex:
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader # Returns an iterable of Suggestion
+        self._lock = threading.Lock() # Guards reads and patches of the structures below
+        self._build_lock = threading.Lock() # One rebuild at a time
+        self._built_at = None # time.monotonic() of the last build
+        self._keys = [] # Sorted (key, kind, pk)
+        self._entries = {} # (kind, pk) -> Suggestion
+        self._ranked = {} # Heavy prefix -> ranked suggestions
+
+    def _build(self):
+        entries = {}
+        keys = []
+        for suggestion in self._loader():
+            entries[suggestion.kind, suggestion.pk] = suggestion
+            keys.extend((key, suggestion.kind, suggestion.pk) for key in _keys(suggestion.title))
+        keys.sort()
+        ranked = {}
+        if keys:
+            _rank_heavy_prefixes(keys, entries, 0, len(keys), '', ranked)
+        with self._lock:
+            self._keys, self._entries, self._ranked = keys, entries, ranked
+            self._built_at = time.monotonic()
+
+    def _is_current(self):
+        return self._built_at is not None and time.monotonic() - self._built_at < SUGGEST_REFRESH_INTERVAL
+
+    def _ensure_current(self):
+        if self._is_current():
+            return
+        # Other threads keep answering from the previous index while one rebuilds,
+        # only the very first build is waited for
+        if self._build_lock.acquire(blocking=self._built_at is None):
+            try:
+                if not self._is_current():
+                    self._build()
+            finally:
+                self._build_lock.release()
+
+    def warm(self):
+        """
+        Build the index now instead of on the first lookup.
+        """
+        self._ensure_current()
+
+    def lookup(self, query, limit=10):
+        """
+        Return up to `limit` suggestions whose title has a word starting with `query`,
+        most popular first.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self._ensure_current()
+
+        limit = min(limit, MAX_SUGGESTIONS)
+        with self._lock:
+            ranked = self._ranked.get(prefix)
+            if ranked is not None:
+                return ranked[:limit]
+
+            matches = []
+            keys = self._keys
+            index = bisect_left(keys, (prefix,))
+            while index < len(keys) and keys[index][0].startswith(prefix):
+                matches.append(self._entries[keys[index][1:]])
+                index += 1
+        return _top(matches, limit)
+
+    def update(self, kind, pk, title, slug):
+        """
+        Add or replace an entry. The popularity weight is kept until the next rebuild.
+        """
+        self._patch(kind, pk, title, slug)
+
+    def remove(self, kind, pk):
+        self._patch(kind, pk)
+
+    def _patch(self, kind, pk, title=None, slug=None):
+        if self._built_at is None:
+            return # Not built in this process yet, the first lookup loads everything
+        with self._lock:
+            previous = self._entries.pop((kind, pk), None)
+            touched = set()
+            if previous is not None:
+                for key in _keys(previous.title):
+                    touched.add(key)
+                    index = bisect_left(self._keys, (key, kind, pk))
+                    if index < len(self._keys) and self._keys[index] == (key, kind, pk):
+                        del self._keys[index]
+            suggestion = None
+            if title is not None:
+                weight = previous.weight if previous is not None else 0
+                suggestion = self._entries[kind, pk] = Suggestion(kind, pk, title, slug, weight)
+                for key in _keys(title):
+                    touched.add(key)
+                    insort(self._keys, (key, kind, pk))
+
+            # Patch the precomputed results of every heavy prefix of a touched key
+            prefixes = {key[:length] for key in touched for length in range(len(key) + 1)}
+            for prefix in prefixes & self._ranked.keys():
+                ranked = [other for other in self._ranked[prefix] if (other.kind, other.pk) != (kind, pk)]
+                if suggestion is not None and any(key.startswith(prefix) for key in _keys(title)):
+                    ranked.append(suggestion)
+                self._ranked[prefix] = _top(ranked)
+
+
+suggest_index = SuggestIndex('suggest', _load_suggestions)
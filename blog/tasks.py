@@ -0,0 +1,22 @@
+from jobs.queue import job
+from .counters import rebuild_archive, reconcile_blog_counts
+from .models import Tag
+
+
+# Background jobs of the blog app, run by `python manage.py run_workers`
+# Each job runs in a transaction
+
+@job('blog.delete_orphan_tags')
+def delete_orphan_tags(tag_ids):
+    # Tags replaced on a blog update (queued by BlogSerializer.update), deleted unless a
+    # blog linked them again since. The delete signals drop them from the tag cache of
+    # every process once this job commits; a request still holding one of them checks
+    # it before linking it (BlogSerializer._get_or_create_tags)
+    Tag.objects.filter(id__in=tag_ids, tag_blogs__isnull=True).delete()
+
+
+@job('blog.reconcile_counts')
+def reconcile_counts():
+    # Same as `python manage.py reconcile_counts`
+    reconcile_blog_counts()
+    rebuild_archive()
@@ -1,3 +1,1320 @@
-from django.test import TestCase
+import calendar
+import hashlib
+import io
+import re
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from jobs import queue
+from jobs.models import Job
+from users.models import User
+from . import feeds, refcache, stats
+from .admin import ReviewAdmin, TagAdmin
+from .changes import CHANGE_FEED_RETENTION_DAYS, compact_changes
+from .favourite_buffer import FavouriteWriteBuffer
+from .fast_serializers import BlogValuesSerializer
+from .models import ArchiveMonth, Blog, BlogSignature, Category, ChangeLogEntry, Favourite, Review, Tag
+from .personalization import PAYLOAD_VERSION, _favourite_ids_key
+from .refcache import ReferenceCache, category_cache, get_version, tag_cache
+from .serializers import BlogSerializer
+from .suggest import MAX_SUGGESTIONS, SuggestIndex, Suggestion, _load_suggestions, normalize
+from .views import sparse_blog_queryset
+
+
+# BlogValuesSerializer must render exactly what BlogSerializer renders
+# Buffer whose writes are recorded instead of applied, to test the triggers without threads touching the database
+class RecordingWriteBuffer(FavouriteWriteBuffer):
+
+    def __init__(self, fail=0, during_apply=None, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        self.flushed = threading.Event()
+        self._fail = fail
+        self._during_apply = during_apply
+
+    def _apply(self, batch):
+        if self._during_apply is not None:
+            self._during_apply()
+        if self._fail:
+            self._fail -= 1
+            raise RuntimeError('database is locked')
+        self.batches.append(dict(batch))
+        self.flushed.set()
+
+
+class FavouriteWriteBufferTests(TestCase):
+
+    def _buffer(self, **kwargs):
+        buffer = RecordingWriteBuffer(**{'max_size': 100, 'flush_interval': 60, **kwargs})
+        self.addCleanup(buffer.shutdown)
+        return buffer
+
+    def test_toggles_coalesce_per_pair(self):
+        buffer = self._buffer()
+        buffer.add(1, 10)
+        buffer.remove(1, 10)
+        buffer.add(1, 10)
+        buffer.remove(2, 10)
+        self.assertEqual(buffer.pending_for_user(1), ({10}, set()))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.batches, [{(1, 10): True, (2, 10): False}])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_size_trigger(self):
+        buffer = self._buffer(max_size=3)
+        for blog_id in (10, 11, 12):
+            buffer.add(1, blog_id)
+        self.assertTrue(buffer.flushed.wait(5))
+        self.assertEqual(len(buffer.batches[0]), 3)
+
+    def test_time_trigger(self):
+        buffer = self._buffer(flush_interval=0.05)
+        buffer.add(1, 10)
+        self.assertTrue(buffer.flushed.wait(5))
+        self.assertEqual(buffer.batches, [{(1, 10): True}])
+
+    def test_batches_being_written_stay_visible(self):
+        seen = []
+        buffer = self._buffer(during_apply=lambda: seen.append(buffer.pending_for_user(1)))
+        buffer.add(1, 10)
+        buffer.flush()
+        self.assertEqual(seen, [({10}, set())])
+        self.assertEqual(buffer.pending_for_user(1), (set(), set())) # Committed, the database has it
+
+    def test_failed_flushes_are_requeued_behind_newer_toggles(self):
+        buffer = self._buffer(fail=1, during_apply=lambda: buffer.remove(1, 11) if not buffer.batches else None)
+        buffer.add(1, 10)
+        buffer.add(1, 11)
+        with self.assertLogs('blog.favourite_buffer', level='ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending_for_user(1), ({10}, {11})) # The remove recorded during the flush wins
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.batches, [{(1, 10): True, (1, 11): False}])
+
+    def test_shutdown_flushes_and_stops(self):
+        buffer = self._buffer()
+        buffer.add(1, 10)
+        buffer.shutdown()
+        self.assertEqual(buffer.batches, [{(1, 10): True}])
+        self.assertFalse(buffer._thread.is_alive())
+        with self.assertRaises(RuntimeError):
+            buffer.add(1, 11)
+
+    def test_flush_writes_the_favourites(self):
+        author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        category = Category.objects.create(title='Python')
+        blogs = [Blog.objects.create(user=author, category=category, title=f'Post {index}', description='Body')
+                 for index in range(3)]
+        Favourite.objects.create(user=author, blog=blogs[2])
+        buffer = FavouriteWriteBuffer(max_size=100, flush_interval=60)
+        self.addCleanup(buffer.shutdown)
+        buffer.add(author.id, blogs[0].id)
+        buffer.add(author.id, blogs[1].id)
+        buffer.remove(author.id, blogs[1].id)
+        buffer.remove(author.id, blogs[2].id)
+        buffer.add(author.id, 10 ** 9) # Blog deleted since the toggle was acknowledged
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(set(Favourite.objects.values_list('blog_id', flat=True)), {blogs[0].id})
+
+
+class BlogValuesSerializerEquivalenceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+        python = Category.objects.create(title='Python')
+        go = Category.objects.create(title='Go')
+        tags = [Tag.objects.create(title=title) for title in ('django', 'drf', 'orm', 'goroutines')]
+
+        cls.blogs = []
+        for index in range(6):
+            blog = Blog.objects.create(
+                user=cls.author,
+                category=python if index % 2 else go,
+                title=f'Post {index}',
+                description=f'Body of post {index}',
+                banner='blog_banners/banner.jpg' if index % 3 == 0 else '',
+            )
+            blog.tags.set(tags[:index % 4])
+            for review_index in range(index % 3):
+                Review.objects.create(
+                    user=cls.reader if review_index % 2 else cls.author,
+                    blog=blog,
+                    comment=f'Review {review_index}',
+                    rating=None if review_index == 1 else 4,
+                )
+            cls.blogs.append(blog)
+
+        Favourite.objects.create(user=cls.reader, blog=cls.blogs[1])
+        Favourite.objects.create(user=cls.reader, blog=cls.blogs[4])
+
+    def _context(self, user=None):
+        request = APIRequestFactory().get('/api/all-blogs/')
+        request = Request(request)
+        request.user = user
+        return {'request': request}
+
+    def _assert_equivalent(self, queryset, context):
+        expected = BlogSerializer(
+            queryset.select_related('user').prefetch_related('tags', 'blog_reviews__user'),
+            many=True,
+            context=context,
+        ).data
+        actual = BlogValuesSerializer(BlogValuesSerializer.project(queryset), many=True, context=context).data
+        self.assertEqual(actual, [dict(row) for row in expected])
+
+    def test_matches_blog_serializer_with_favourite_annotation(self):
+        queryset = Blog.objects.annotate(
+            is_favourited=Exists(Favourite.objects.filter(user=self.reader, blog=OuterRef('pk')))
+        ).order_by('-created_date', 'id')
+        self._assert_equivalent(queryset, self._context(self.reader))
+
+    def test_matches_blog_serializer_for_anonymous_users(self):
+        queryset = Blog.objects.annotate(
+            is_favourited=Value(False, output_field=BooleanField())
+        ).order_by('id')
+        self._assert_equivalent(queryset, self._context())
+
+    def test_matches_blog_serializer_without_annotation(self):
+        self._assert_equivalent(Blog.objects.filter(category__title='Python').order_by('id'), self._context())
+
+    def test_matches_blog_serializer_without_request(self):
+        self._assert_equivalent(Blog.objects.order_by('id'), {})
+
+    def test_empty_queryset(self):
+        self.assertEqual(BlogValuesSerializer(BlogValuesSerializer.project(Blog.objects.none())).data, [])
+
+    def test_list_endpoints_keep_their_shape(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+
+        page = client.get('/api/all-blogs/', {'page_size': 10}).data
+        self.assertEqual(page['count'], len(self.blogs))
+        self.assertEqual(sum(blog['is_favourited'] for blog in page['results']), 2)
+        self.assertNotIn('description', page['results'][0])
+        self.assertEqual(page['results'][0]['excerpt'], Blog.objects.get(pk=page['results'][0]['id']).description)
+
+        favourites = client.get('/api/favourites/').data
+        self.assertEqual(sorted(blog['id'] for blog in favourites), [self.blogs[1].id, self.blogs[4].id])
+        self.assertNotIn('is_favourited', favourites[0])
+
+        latest = client.get('/api/all-blogs/', {'latest': 2}).data
+        self.assertEqual(len(latest), 2)
+
+
+class BlogCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.python, cls.go = Category.objects.create(title='Python'), Category.objects.create(title='Go')
+        cls.orm, cls.web, cls.api = (Tag.objects.create(title=title) for title in ('orm', 'web', 'api'))
+
+    def _counts(self):
+        return {
+            obj.title: obj.blog_count
+            for model in (Category, Tag) for obj in model.objects.all()
+        }
+
+    def _blog(self, title='Post', category=None):
+        return Blog.objects.create(user=self.author, category=category or self.python, title=title, description='Body')
+
+    def test_create_change_category_and_delete(self):
+        blog = self._blog()
+        self.assertEqual(self._counts()['Python'], 1)
+        blog.category = self.go
+        blog.save()
+        self.assertEqual((self._counts()['Python'], self._counts()['Go']), (0, 1))
+        blog.tags.set([self.orm, self.web])
+        blog.delete()
+        self.assertEqual(set(self._counts().values()), {0})
+
+    def test_tag_add_remove_and_clear(self):
+        first, second = self._blog('First'), self._blog('Second')
+        first.tags.add(self.orm, self.web)
+        first.tags.add(self.orm) # Already linked
+        self.web.tag_blogs.add(second) # Reverse side
+        self.assertEqual([self._counts()[title] for title in ('orm', 'web', 'api')], [1, 2, 0])
+        first.tags.remove(self.web, self.api) # `api` is not linked
+        self.assertEqual([self._counts()[title] for title in ('orm', 'web', 'api')], [1, 1, 0])
+        self.web.tag_blogs.clear()
+        first.tags.clear()
+        self.assertEqual([self._counts()[title] for title in ('orm', 'web', 'api')], [0, 0, 0])
+
+    def test_cascade_deletes(self):
+        for index in range(3):
+            self._blog(f'Post {index}', category=self.go).tags.set([self.orm, self.api])
+        self._blog('Python post').tags.set([self.orm])
+        self.go.delete() # Cascades to its blogs
+        self.assertEqual((self._counts()['Python'], self._counts()['orm'], self._counts()['api']), (1, 1, 0))
+        self.author.delete() # Cascades to the remaining blog
+        self.assertEqual(set(self._counts().values()), {0})
+
+    def test_counter_updates_are_not_logged_as_edits(self):
+        last_id = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+        self._blog().tags.set([self.orm])
+        self.assertFalse(ChangeLogEntry.objects.filter(id__gt=last_id, model__in=('category', 'tag')).exists())
+
+    def test_reconcile_command_repairs_drift(self):
+        self._blog().tags.set([self.orm])
+        Tag.objects.update(blog_count=7)
+        Category.objects.update(blog_count=0)
+        call_command('reconcile_counts', stdout=io.StringIO())
+        self.assertEqual(self._counts(), {'Python': 1, 'Go': 0, 'orm': 1, 'web': 0, 'api': 0})
+
+
+# Saves of loaded instances write only what changed, without reading the row first
+class ChangeTrackingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.blog = Blog.objects.create(user=cls.author, category=Category.objects.create(title='Python'),
+                                       title='Post', description='Body')
+
+    def _blog_writes(self, blog):
+        with CaptureQueriesContext(connection) as queries:
+            blog.save()
+        return [query['sql'] for query in queries if '"blog_blog"' in query['sql'].split(' WHERE ')[0]]
+
+    def test_only_changed_columns_are_written(self):
+        blog = Blog.objects.get(pk=self.blog.pk)
+        blog.title = 'Renamed'
+        writes = self._blog_writes(blog)
+        # No SELECT of the row, one UPDATE of the title and its new slug (the slug check reads other rows)
+        update, = [sql for sql in writes if sql.startswith('UPDATE')]
+        columns = set(re.findall(r'"(\w+)" = ', update.split(' WHERE ')[0]))
+        self.assertEqual(columns, {'title', 'slug'})
+        self.assertFalse([sql for sql in writes if sql.startswith('SELECT') and 'WHERE "blog_blog"."id" =' in sql])
+        self.assertEqual(blog.changed_fields, set())
+
+    def test_unchanged_saves_write_nothing_but_send_the_signals(self):
+        blog = Blog.objects.get(pk=self.blog.pk)
+        received = []
+
+        def receiver(sender, update_fields, **kwargs):
+            received.append(update_fields)
+
+        post_save.connect(receiver, sender=Blog)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                blog.save()
+        finally:
+            post_save.disconnect(receiver, sender=Blog)
+        self.assertEqual(received, [frozenset()])
+        self.assertFalse([query for query in queries if 'blog_blog' in query['sql'] or 'blog_changelogentry' in query['sql']])
+
+    def test_assigned_deferred_fields_are_written(self):
+        blog = Blog.objects.only('title').get(pk=self.blog.pk)
+        blog.description = 'Deferred then assigned'
+        self.assertEqual(blog.changed_fields, {'description'})
+        blog.save()
+        saved = Blog.objects.get(pk=self.blog.pk)
+        self.assertEqual((saved.description, saved.excerpt), ('Deferred then assigned', 'Deferred then assigned'))
+
+        # Reading a deferred field loads and snapshots it, it is not a change
+        blog = Blog.objects.only('title').get(pk=self.blog.pk)
+        self.assertEqual(blog.description, 'Deferred then assigned')
+        self.assertEqual(blog.changed_fields, set())
+
+    def test_untracked_instances_save_every_field(self):
+        blog = Blog(pk=self.blog.pk, user=self.author, category_id=self.blog.category_id, title='Post',
+                    description='New body', created_date=self.blog.created_date)
+        blog.save(force_update=True)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).excerpt, 'New body')
+
+
+class AdminActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.blog = Blog.objects.create(user=cls.author, category=Category.objects.create(title='Python'),
+                                       title='Post', description='Body')
+
+    def _run(self, model_admin, action, queryset):
+        with mock.patch.object(model_admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            getattr(model_admin, action)(None, queryset)
+
+    def test_delete_unused_tags_checks_the_links(self):
+        used, unused = Tag.objects.create(title='used'), Tag.objects.create(title='unused')
+        self.blog.tags.add(used)
+        Tag.objects.update(blog_count=0) # Drifted counter
+        self._run(TagAdmin(Tag, admin.site), 'delete_unused_tags', Tag.objects.all())
+        self.assertEqual(list(Tag.objects.values_list('title', flat=True)), ['used'])
+        self.assertEqual(list(self.blog.tags.values_list('title', flat=True)), ['used'])
+
+    def test_clear_rating_is_set_based(self):
+        reviews = [Review.objects.create(user=self.author, blog=self.blog, comment='Nice', rating=4) for _ in range(3)]
+        last_id = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+        cache.set(stats._cache_key(self.author.id), {'blogs': 1})
+        payload_version = get_version(PAYLOAD_VERSION)
+        with CaptureQueriesContext(connection) as queries:
+            self._run(ReviewAdmin(Review, admin.site), 'clear_rating', Review.objects.all())
+        self.assertFalse(Review.objects.exclude(rating=None).exists())
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 1)
+        logged = ChangeLogEntry.objects.filter(id__gt=last_id, model='review').values_list('object_id', flat=True)
+        self.assertEqual(sorted(logged), sorted(review.id for review in reviews))
+        self.assertIsNone(cache.get(stats._cache_key(self.author.id)))
+        self.assertNotEqual(get_version(PAYLOAD_VERSION), payload_version)
+
+
+class ReferenceCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.category = Category.objects.create(title='Python')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        # Another worker process: its own copy, the same shared cache
+        self.other_process = ReferenceCache('category', lambda: Category.objects.all())
+
+    def test_renames_reach_every_process(self):
+        self.assertEqual(self.other_process.title(self.category.id), 'Python')
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.get(pk=self.category.pk)
+            category.title = 'Django'
+            category.save()
+        self.assertEqual(self.other_process.title(self.category.id), 'Django')
+        self.assertEqual(category_cache.title(self.category.id), 'Django')
+
+    def test_stamps_are_read_once_per_request(self):
+        for index in range(20):
+            Blog.objects.create(user=self.author, category=self.category, title=f'Post {index}', description='Body')
+        with mock.patch('blog.refcache.get_version', wraps=refcache.get_version) as get_version:
+            self.assertEqual(self.client.get('/api/all-blogs/').status_code, 200)
+            self.assertEqual(self.client.get('/api/search/?q=post').status_code, 200)
+        checked = [call.args[0] for call in get_version.call_args_list]
+        self.assertEqual(checked.count('category'), 2)
+
+        # Outside a request, every lookup sees the latest stamp
+        with mock.patch('blog.refcache.get_version', wraps=refcache.get_version) as get_version:
+            category_cache.title(self.category.id)
+            category_cache.title(self.category.id)
+        self.assertEqual(get_version.call_count, 2)
+
+    def test_deleted_categories_are_rejected_by_every_process(self):
+        category = Category.objects.create(title='Go')
+        self.assertIsNotNone(self.other_process.get(category.id))
+        self.assertIsNotNone(category_cache.get(category.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertIsNone(self.other_process.get(category.id))
+        response = self.client.post('/api/blogs/', {
+            'title': 'Gone', 'description': 'Body', 'category': category.id, 'tags': 'go',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data)
+
+    def test_invalidation_waits_for_the_commit(self):
+        self.other_process.warm()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Category.objects.get(pk=self.category.pk).delete()
+            self.assertIsNotNone(self.other_process.get(self.category.id)) # Not committed yet
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self.other_process.get(self.category.id))
+
+    def test_tags_of_rolled_back_requests_are_not_remembered(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    BlogSerializer()._get_or_create_tags('rolled-back')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(tag_cache.get_by_title('rolled-back'))
+        self.assertFalse(Tag.objects.filter(title='rolled-back').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BlogSerializer()._get_or_create_tags('committed')
+        self.assertIsNotNone(tag_cache.get_by_title('committed'))
+
+    def _post(self, title, tags):
+        response = self.client.post('/api/blogs/', {
+            'title': title, 'description': 'Body', 'category': self.category.id, 'tags': tags,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_replaced_tags_are_deleted_by_a_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = self._post('First', 'orphan, relinked, shared')
+            self._post('Second', 'shared')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(f"/api/blogs/{blog['id']}/", {'tags': 'new'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(Job.objects.exists()) # Queued once the update commits
+        for callback in callbacks:
+            callback()
+        job, = Job.objects.all()
+        self.assertEqual(job.name, 'blog.delete_orphan_tags')
+        self.assertIsNotNone(tag_cache.get_by_title('orphan'))
+
+        # Linked again before the job ran
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('Third', 'relinked')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(queue.run(queue.claim('worker-1')))
+        self.assertEqual(sorted(Tag.objects.values_list('title', flat=True)), ['new', 'relinked', 'shared'])
+        self.assertIsNone(tag_cache.get_by_title('orphan'))
+
+    def test_stale_cached_tags_are_not_linked(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('Hot', 'hot')
+        stale = tag_cache.get_by_title('hot')
+        self.assertIsNotNone(stale)
+        # Deleted by another process, this one has not seen the new stamp yet
+        with self.captureOnCommitCallbacks():
+            Tag.objects.filter(pk=stale.pk).delete()
+        self.assertIsNotNone(tag_cache.get_by_title('hot'))
+
+        blog = self._post('Still hot', 'hot')
+        tag = Tag.objects.get(title='hot')
+        self.assertNotEqual(tag.pk, stale.pk)
+        self.assertEqual(list(Blog.objects.get(pk=blog['id']).tags.all()), [tag])
+        connection.check_constraints() # No link to the deleted row
+
+
+class ReviewCreationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+        category = Category.objects.create(title='Python')
+        cls.blog = Blog.objects.create(user=cls.author, category=category, title='Reviewed', description='Body')
+        Review.objects.bulk_create(Review(blog=cls.blog, user=cls.reader, comment=f'Review {index}') for index in range(50))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_review_creation_runs_three_queries(self):
+        # The blog (id and author), the review, its change log entry, plus the savepoint around them
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/blog-details/{self.blog.slug}/', {'comment': 'Nice', 'rating': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertEqual(len(statements), 3, '\n'.join(statements))
+        self.assertEqual(response.data['user'], 'reader')
+        self.assertEqual(response.data['rating'], 5)
+
+    def test_rating_bounds_and_unknown_blogs(self):
+        self.assertEqual(self.client.post(f'/api/blog-details/{self.blog.slug}/', {'comment': 'Bad', 'rating': 6}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/blog-details/missing/', {'comment': 'Nice'}, format='json').status_code, 404)
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        category = Category.objects.create(title='Python')
+        cls.blog = Blog.objects.create(user=cls.user, category=category, title='Post', description='word ' * 100)
+        cls.blog.tags.set([Tag.objects.create(title='django')])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_excerpt_is_generated_on_save(self):
+        self.assertTrue(self.blog.excerpt.endswith('…'))
+        self.assertLessEqual(len(self.blog.excerpt), 201)
+
+    def test_list_fields(self):
+        results = self.client.get('/api/all-blogs/', {'fields': 'id,title,description'}).data['results']
+        self.assertEqual(list(results[0]), ['id', 'title', 'description'])
+
+    def test_list_exclude(self):
+        results = self.client.get('/api/all-blogs/', {'exclude': 'reviews,tag_title'}).data['results']
+        self.assertNotIn('reviews', results[0])
+        self.assertNotIn('tag_title', results[0])
+        self.assertNotIn('description', results[0])
+
+    def test_viewset_and_detail_fields(self):
+        blogs = self.client.get('/api/blogs/', {'fields': 'id,user,tag_title'}).data
+        self.assertEqual(blogs, [{'id': self.blog.id, 'user': 'author', 'tag_title': ['django']}])
+
+        detail = self.client.get(f'/api/blog-details/{self.blog.slug}/', {'exclude': 'reviews,related_blogs'}).data
+        self.assertNotIn('reviews', detail)
+        self.assertIn('description', detail)
+
+    # The point of sparse fieldsets: unrequested columns, joins and prefetches are never fetched
+    def _queries(self, url, params):
+        cache.clear() # Shared payloads would skip the queries
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def _blog_select(self, queries):
+        selects = [sql for sql in queries if sql.startswith('SELECT') and 'FROM "blog_blog"' in sql and 'COUNT(' not in sql]
+        self.assertEqual(len(selects), 1, selects)
+        return selects[0]
+
+    def test_queryset_only_selects_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(sparse_blog_queryset(Blog.objects.all(), ['id', 'title']))
+        self.assertEqual(len(queries), 1) # No tag or review prefetch
+        sql = queries[0]['sql']
+        self.assertIn('"blog_blog"."title"', sql)
+        for column in ('description', 'excerpt', 'banner', 'slug', 'user_id'):
+            self.assertNotIn(f'"blog_blog"."{column}"', sql)
+        self.assertNotIn('"users_user"', sql)
+
+    def test_detail_sql_is_narrowed(self):
+        queries = self._queries(f'/api/blog-details/{self.blog.slug}/', {'fields': 'id,title'})
+        sql = self._blog_select(queries)
+        for column in ('description', 'excerpt', 'banner'):
+            self.assertNotIn(f'"blog_blog"."{column}"', sql)
+        self.assertNotIn('"users_user"', sql)
+        self.assertFalse([sql for sql in queries if 'blog_review' in sql or 'blog_tag' in sql], queries)
+
+    def test_list_sql_is_narrowed(self):
+        queries = self._queries('/api/all-blogs/', {'fields': 'id,title'})
+        sql = self._blog_select(queries)
+        for column in ('description', 'excerpt', 'banner'):
+            self.assertNotIn(f'"blog_blog"."{column}"', sql)
+        self.assertNotIn('"users_user"', sql)
+        self.assertFalse([sql for sql in queries if 'blog_review' in sql or 'blog_tag' in sql], queries)
+
+        # By default lists read the stored excerpt, never the description
+        sql = self._blog_select(self._queries('/api/all-blogs/', {}))
+        self.assertIn('"blog_blog"."excerpt"', sql)
+        self.assertNotIn('"blog_blog"."description"', sql)
+
+
+
+class ArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.python, cls.go = Category.objects.create(title='Python'), Category.objects.create(title='Go')
+
+    def _blog(self, category, day=None, title='Post'):
+        blog = Blog.objects.create(user=self.author, category=category, title=title, description='Body')
+        if day is not None:
+            blog = Blog.objects.get(pk=blog.pk)
+            blog.created_date = day
+            blog.save()
+        return blog
+
+    def _months(self):
+        return {
+            (row.year, row.month, row.category_id): row.blog_count
+            for row in ArchiveMonth.objects.filter(blog_count__gt=0)
+        }
+
+    def _recounted(self):
+        months = {}
+        for blog in Blog.objects.all():
+            for category_id in (None, blog.category_id):
+                key = (blog.created_date.year, blog.created_date.month, category_id)
+                months[key] = months.get(key, 0) + 1
+        return months
+
+    def test_rollup_follows_creates_moves_and_deletes(self):
+        january, march = date(2023, 1, 5), date(2023, 3, 9)
+        first = self._blog(self.python, january)
+        self._blog(self.python, january)
+        moved = self._blog(self.go, january)
+        self.assertEqual(self._months(), {(2023, 1, None): 3, (2023, 1, self.python.id): 2, (2023, 1, self.go.id): 1})
+
+        moved.category = self.python # Same month, only the per-category rows move
+        moved.save()
+        first.created_date = march
+        first.save()
+        self.assertEqual(self._months(), self._recounted())
+        first.delete()
+        self.go.delete()
+        self.assertEqual(self._months(), self._recounted())
+        self.assertEqual(self._months(), {(2023, 1, None): 2, (2023, 1, self.python.id): 2})
+
+    def test_archive_view(self):
+        for day in (date(2022, 12, 1), date(2023, 1, 5), date(2023, 2, 1)):
+            self._blog(self.python, day)
+        self._blog(self.go, date(2023, 1, 20))
+        self.assertEqual(self.client.get('/api/archive/').json(), [
+            {'year': 2023, 'blog_count': 3, 'months': [{'month': 2, 'blog_count': 1}, {'month': 1, 'blog_count': 2}]},
+            {'year': 2022, 'blog_count': 1, 'months': [{'month': 12, 'blog_count': 1}]},
+        ])
+        self.assertEqual(self.client.get('/api/archive/', {'category': self.go.id}).json(), [
+            {'year': 2023, 'blog_count': 1, 'months': [{'month': 1, 'blog_count': 1}]},
+        ])
+        self.assertEqual(self.client.get('/api/archive/', {'category': 'go'}).json(), [])
+
+    def test_month_pages_are_stable_when_dates_tie(self):
+        day = date(2023, 1, 5)
+        blogs = [self._blog(self.python if index % 2 else self.go, day, f'Post {index}') for index in range(7)]
+        self._blog(self.python, date(2023, 2, 1)) # Other month
+        self._blog(self.python, date(2022, 12, 31))
+
+        seen, url, params = [], '/api/archive/2023/1/', {'page_size': 3}
+        while url:
+            page = self.client.get(url, params).json()
+            seen.extend(blog['id'] for blog in page['results'])
+            url, params = page['next'], {}
+        self.assertEqual(seen, sorted((blog.id for blog in blogs), reverse=True)) # Every blog exactly once
+
+        python_ids = [blog['id'] for blog in self.client.get('/api/archive/2023/1/', {'category': self.python.id}).json()['results']]
+        self.assertEqual(python_ids, sorted((blog.id for blog in blogs[1::2]), reverse=True))
+
+    def test_invalid_months_and_cursors(self):
+        self.assertEqual(self.client.get('/api/archive/2023/13/').status_code, 404)
+        self.assertEqual(self.client.get('/api/archive/2023/1/', {'cursor': 'yesterday'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/archive/9999/12/').json(), {'next': None, 'results': []})
+
+
+class AuthorStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+        category = Category.objects.create(title='Python')
+        cls.blogs = [
+            Blog.objects.create(user=cls.author, category=category, title=f'Post {index}', description='Body')
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.reader_client = APIClient()
+        self.reader_client.force_authenticate(self.reader)
+
+    def _stats(self):
+        return self.author_client.get('/api/profile/stats/').data
+
+    def _author_lookups(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT DISTINCT "blog_blog"."user_id"')]
+
+    def test_numbers_and_caching(self):
+        Review.objects.create(user=self.reader, blog=self.blogs[0], comment='Good', rating=4)
+        Review.objects.create(user=self.author, blog=self.blogs[0], comment='Mine', rating=None)
+        Review.objects.create(user=self.reader, blog=self.blogs[1], comment='Fine', rating=3)
+        Favourite.objects.create(user=self.reader, blog=self.blogs[1])
+        stats = self._stats()
+        self.assertEqual(
+            {key: stats[key] for key in ('blog_count', 'reviews_received', 'average_rating', 'favourites_received')},
+            {'blog_count': 2, 'reviews_received': 3, 'average_rating': 3.5, 'favourites_received': 1},
+        )
+        by_id = {blog['id']: blog for blog in stats['blogs']}
+        self.assertEqual((by_id[self.blogs[0].id]['reviews_received'], by_id[self.blogs[0].id]['average_rating']), (2, 4.0))
+        self.assertEqual(by_id[self.blogs[1].id]['favourites_received'], 1)
+        with self.assertNumQueries(0):
+            self._stats()
+
+    def test_writes_through_the_api_invalidate_without_lookups(self):
+        self._stats()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.reader_client.post(f'/api/blog-details/{self.blogs[0].slug}/', {'comment': 'Nice', 'rating': 5}, format='json')
+            self.reader_client.post(f'/api/favourites/{self.blogs[1].id}/')
+        self.assertEqual(self._author_lookups(queries), [])
+        self.assertEqual((self._stats()['reviews_received'], self._stats()['favourites_received']), (1, 1))
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.reader_client.delete(f'/api/favourites/{self.blogs[1].id}/')
+        self.assertEqual(self._author_lookups(queries), [])
+        self.assertEqual(self._stats()['favourites_received'], 0)
+
+    def test_cascades_look_the_authors_up_once(self):
+        for blog in self.blogs:
+            for index in range(3):
+                Review.objects.create(user=self.reader, blog=blog, comment=f'Review {index}', rating=5)
+            Favourite.objects.create(user=self.reader, blog=blog)
+        self.assertEqual(self._stats()['reviews_received'], 6)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Favourite.objects.filter(user=self.reader).delete() # Bulk delete, as the admin and the write buffer do
+            self.reader.delete() # Cascades to the 6 reviews
+        self.assertEqual(len(self._author_lookups(queries)), 1) # One for every row deleted before the commit
+        self.assertEqual((self._stats()['reviews_received'], self._stats()['favourites_received']), (0, 0))
+
+    def test_blog_changes_invalidate(self):
+        self._stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.get(pk=self.blogs[0].pk)
+            blog.title = 'Renamed'
+            blog.save()
+        self.assertIn('Renamed', [blog['title'] for blog in self._stats()['blogs']])
+        with self.captureOnCommitCallbacks(execute=True):
+            blog.delete()
+        self.assertEqual(self._stats()['blog_count'], 1)
+
+
+class ChangeFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+        cls.category = Category.objects.create(title='Python')
+
+    def setUp(self):
+        self.start = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def _blog(self, title):
+        return Blog.objects.create(user=self.author, category=self.category, title=title, description='Body')
+
+    def _sync(self, since, limit, client=None):
+        changes = []
+        while True:
+            page = (client or self.client).get('/api/changes/', {'since': since, 'limit': limit}).data
+            self.assertFalse(page['resync'])
+            changes.extend((change['model'], change['object_id'], change['action']) for change in page['changes'])
+            since = page['cursor']
+            if not page['has_more']:
+                return changes, since
+
+    def test_paging_with_the_cursor(self):
+        blogs = [self._blog(f'Post {index}') for index in range(5)]
+        blogs[0].title = 'Renamed'
+        blogs[0].save()
+        deleted_id = blogs[1].id
+        blogs[1].delete()
+        Favourite.objects.create(user=self.reader, blog=blogs[2])
+        Favourite.objects.create(user=self.author, blog=blogs[3]) # Not the reader's
+
+        changes, cursor = self._sync(self.start, 2)
+        blog_changes = [change for change in changes if change[0] == 'blog']
+        self.assertEqual(blog_changes, [('blog', blog.id or deleted_id, 'create') for blog in blogs] + [
+            ('blog', blogs[0].id, 'update'), ('blog', deleted_id, 'delete'),
+        ])
+        self.assertEqual([change for change in changes if change[0] == 'favourite'], [('favourite', blogs[2].id, 'create')])
+        self.assertEqual(self._sync(cursor, 2), ([], cursor)) # Nothing new
+
+        # A single page keeps the latest entry per object, with its current state
+        page = self.client.get('/api/changes/', {'since': self.start, 'limit': 100}).data
+        latest = {(change['model'], change['object_id']): change for change in page['changes']}
+        self.assertEqual(latest['blog', blogs[0].id]['data']['title'], 'Renamed')
+        self.assertIsNone(latest['blog', deleted_id]['data'])
+        self.assertEqual(self._sync(self.start, 100, APIClient())[0].count(('favourite', blogs[2].id, 'create')), 0)
+
+    def test_compaction_and_retention(self):
+        kept, deleted = self._blog('Kept'), self._blog('Deleted')
+        kept.title = 'Kept and renamed'
+        kept.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        old_delete = ChangeLogEntry.objects.get(model='blog', object_id=deleted_id, action='delete')
+
+        compact_changes()
+        entries = list(ChangeLogEntry.objects.filter(id__gt=self.start, model='blog').values_list('object_id', 'action'))
+        self.assertEqual(entries, [(kept.id, 'update'), (deleted_id, 'delete')]) # Recent deletions stay
+
+        stale_cursor = old_delete.id - 1
+        later = timezone.now() + timedelta(days=CHANGE_FEED_RETENTION_DAYS + 1)
+        compact_changes(now=later)
+        entries = list(ChangeLogEntry.objects.filter(id__gt=self.start, model='blog').values_list('object_id', 'action'))
+        self.assertEqual(entries, [(kept.id, 'update')])
+
+        page = self.client.get('/api/changes/', {'since': stale_cursor}).data
+        self.assertEqual((page['resync'], page['cursor'], page['changes']), (True, 0, []))
+        changes, cursor = self._sync(0, 100) # Starting over works, without the marker
+        self.assertIn(('blog', kept.id, 'update'), changes)
+        self.assertNotIn('purge', {change[0] for change in changes})
+        self.assertFalse(self.client.get('/api/changes/', {'since': cursor}).data['resync'])
+
+        compact_changes(now=later) # Nothing more to purge, the marker stays
+        self.assertTrue(self.client.get('/api/changes/', {'since': stale_cursor}).data['resync'])
+
+    def test_tag_deletes_log_their_blogs(self):
+        tagged, other = self._blog('Tagged'), self._blog('Other')
+        tag = Tag.objects.create(title='orm')
+        tagged.tags.add(tag)
+        since, tag_id = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first(), tag.id
+        tag.delete()
+        changes, _ = self._sync(since, 100)
+        self.assertEqual(changes, [('blog', tagged.id, 'update'), ('tag', tag_id, 'delete')])
+
+    def test_deleting_a_user_with_favourites(self):
+        Favourite.objects.create(user=self.reader, blog=self._blog('Post'))
+        reader_id = self.reader.id
+        self.reader.delete() # The constraint check at the end of the test catches entries left pointing at it
+        self.assertFalse(ChangeLogEntry.objects.filter(user_id=reader_id).exists())
+
+
+class SuggestIndexTests(TestCase):
+
+    def _index(self, suggestions):
+        return SuggestIndex('suggest-test', lambda: list(suggestions))
+
+    def _titles(self, index, query, limit=10):
+        return [suggestion.title for suggestion in index.lookup(query, limit)]
+
+    def test_prefix_matching(self):
+        index = self._index([
+            Suggestion('blog', 1, 'Django REST framework', 'drf', 0),
+            Suggestion('tag', 1, 'Café culture', 'cafe', 0),
+            Suggestion('category', 1, 'Go', 'go', 0),
+        ])
+        self.assertEqual(self._titles(index, 'rest'), ['Django REST framework']) # Any word start
+        self.assertEqual(self._titles(index, 'rest fr'), ['Django REST framework'])
+        self.assertEqual(self._titles(index, 'CAFE'), ['Café culture']) # Case and accents are ignored
+        self.assertEqual(self._titles(index, 'ango'), []) # Not a word start
+        self.assertEqual(self._titles(index, '  '), [])
+
+    def test_ranking(self):
+        # Enough titles for the heavy prefixes to be ranked in advance
+        suggestions = [Suggestion('blog', pk, f'Python tip {pk:03}', f'tip-{pk}', pk % 7) for pk in range(200)]
+        index = self._index(suggestions)
+        expected = sorted(suggestions, key=lambda suggestion: (-suggestion.weight, suggestion.title))
+        for query in ('p', 'python', 'python tip', 'tip 1'):
+            matching = [suggestion.title for suggestion in expected if query in normalize(suggestion.title)]
+            self.assertEqual(self._titles(index, query, 15), matching[:15])
+        self.assertEqual(len(index.lookup('python', 1000)), MAX_SUGGESTIONS)
+
+    def test_patching(self):
+        suggestions = [Suggestion('blog', pk, f'Python tip {pk:03}', f'tip-{pk}', 1) for pk in range(200)]
+        index = self._index(suggestions)
+        index.warm()
+        index.update('tag', 1, 'Pythonic code', 'pythonic-code')
+        index.update('blog', 5, 'Rust tip', 'rust-tip') # Renamed, keeps its weight
+        index.remove('blog', 0)
+        self.assertEqual(self._titles(index, 'pythonic'), ['Pythonic code'])
+        self.assertEqual(self._titles(index, 'rust'), ['Rust tip'])
+        self.assertEqual(index.lookup('rust')[0].weight, 1)
+        for query in ('python', 'python tip 00', 'p'): # Heavy and light prefixes
+            titles = self._titles(index, query, 20)
+            self.assertNotIn('Python tip 000', titles)
+            self.assertNotIn('Python tip 005', titles)
+        self.assertIn('Python tip 001', self._titles(index, 'python tip 00'))
+
+    def test_saves_and_deletes_patch_the_index(self):
+        index = SuggestIndex('suggest-test', _load_suggestions)
+        author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        with mock.patch('blog.signals.suggest_index', index), mock.patch('blog.views.suggest_index', index):
+            index.warm()
+            with self.captureOnCommitCallbacks(execute=True):
+                blog = Blog.objects.create(user=author, category=Category.objects.create(title='Web'),
+                                           title='Unicorn deployments', description='Body')
+            self.assertEqual(
+                self.client.get('/api/suggest/', {'q': 'unic'}).json(),
+                [{'type': 'blog', 'id': blog.id, 'title': 'Unicorn deployments', 'slug': blog.slug}],
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                blog.title = 'Gunicorn deployments'
+                blog.save()
+            self.assertEqual(self._titles(index, 'unic'), [])
+            self.assertEqual(self._titles(index, 'gunic'), ['Gunicorn deployments'])
+            with self.captureOnCommitCallbacks(execute=True):
+                blog.delete()
+            self.assertEqual(self._titles(index, 'gunic'), [])
+            self.assertEqual(self._titles(index, 'web'), ['Web']) # The category is still there
+
+
+# Blog lists and details are cached once for everyone, `is_favourited` is merged in per user
+class SharedPayloadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+        category = Category.objects.create(title='Python')
+        cls.blogs = [
+            Blog.objects.create(user=cls.author, category=category, title=f'Post {index}', description='Body')
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def _favourited(self):
+        return {blog['id'] for blog in self.client.get('/api/all-blogs/').data['results'] if blog['is_favourited']}
+
+    def test_users_share_the_payload_and_see_their_own_favourites(self):
+        Favourite.objects.create(user=self.reader, blog=self.blogs[0])
+        anonymous = APIClient().get('/api/all-blogs/').data['results']
+        self.assertFalse(any(blog['is_favourited'] for blog in anonymous))
+
+        with self.assertNumQueries(1): # The favourite ids, the payload is cached
+            self.assertEqual(self._favourited(), {self.blogs[0].id})
+        with self.assertNumQueries(0):
+            self.assertEqual(self._favourited(), {self.blogs[0].id})
+
+    def test_favourite_toggles_update_the_overlay(self):
+        self.assertEqual(self._favourited(), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/favourites/{self.blogs[1].id}/')
+        self.assertEqual(self._favourited(), {self.blogs[1].id})
+
+        detail = self.client.get(f'/api/blog-details/{self.blogs[1].slug}/').data
+        self.assertTrue(detail['is_favourited'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/favourites/{self.blogs[1].id}/')
+        self.assertEqual(self._favourited(), set())
+
+    def test_favourite_writes_replace_the_cached_ids(self):
+        key = _favourite_ids_key(self.reader.id)
+        self.assertEqual(self._favourited(), set())
+        self.assertEqual(cache.get(key), set())
+
+        # Written by another process while this one loads the set from before the write:
+        # cached late, under the old stamp, so the write is not hidden
+        with self.captureOnCommitCallbacks(execute=True):
+            Favourite.objects.create(user=self.reader, blog=self.blogs[0])
+            self.assertEqual(_favourite_ids_key(self.reader.id), key) # Until the write commits
+        cache.set(key, set())
+        self.assertNotEqual(_favourite_ids_key(self.reader.id), key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/favourites/{self.blogs[1].id}/')
+        self.assertEqual(self._favourited(), {self.blogs[0].id, self.blogs[1].id})
+
+        # Buffered adds are bulk created, the buffer bumps the stamps itself
+        key = _favourite_ids_key(self.reader.id)
+        buffer = FavouriteWriteBuffer(max_size=100, flush_interval=60)
+        self.addCleanup(buffer.shutdown)
+        buffer.add(self.reader.id, self.blogs[2].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer.flush()
+        self.assertNotEqual(_favourite_ids_key(self.reader.id), key)
+        self.assertEqual(self._favourited(), {blog.id for blog in self.blogs})
+
+    def test_only_recognized_query_parameters_are_cached(self):
+        anonymous = APIClient()
+        first = anonymous.get('/api/all-blogs/?page_size=2&fields=id,title').data
+        with self.assertNumQueries(0):
+            self.assertEqual(anonymous.get('/api/all-blogs/?fields=id,title&page_size=2').data, first)
+        # Anything else is computed every time, and adds no entry
+        for query in ('junk=1', 'page_size=2&page_size=3', 'page_size=2&utm_source=mail'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(anonymous.get(f'/api/all-blogs/?{query}').status_code, 200)
+            self.assertTrue(queries, query)
+        self.assertNotIn('utm_source', anonymous.get('/api/all-blogs/?page_size=2').data['next'])
+
+    def test_blog_changes_refresh_the_payload(self):
+        self.client.get('/api/all-blogs/')
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.get(pk=self.blogs[2].pk)
+            blog.title = 'Renamed'
+            blog.save()
+        titles = [blog['title'] for blog in self.client.get('/api/all-blogs/').data['results']]
+        self.assertIn('Renamed', titles)
+
+
+class NearDuplicateTests(TestCase):
+    TEXT = ("Django signals let decoupled applications get notified when actions occur elsewhere "
+            "in the framework, for example after a model is saved or deleted, and are a common way "
+            "to keep caches, search indexes and counters in sync with the database")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.category = Category.objects.create(title='Python')
+        cls.original = Blog.objects.create(user=cls.author, category=cls.category, title='Django signals', description=cls.TEXT)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def _post(self, title, description):
+        return self.client.post('/api/blogs/', {
+            'title': title, 'description': description, 'category': self.category.id, 'tags': 'django',
+        }, format='json')
+
+    def test_near_copies_are_flagged(self):
+        copy = self._post('Django signals', self.TEXT.replace('decoupled', 'loosely decoupled'))
+        unrelated = self._post('Pagination', "Cursor pagination keeps pages stable while rows are inserted, "
+                                             "offsets skip or repeat rows and get slower the deeper a client pages")
+        self.assertEqual(BlogSignature.objects.get(blog_id=copy.data['id']).duplicate_of_id, self.original.id)
+        self.assertIsNone(BlogSignature.objects.get(blog_id=unrelated.data['id']).duplicate_of_id)
+
+    @override_settings(DUPLICATE_DETECTION='reject')
+    def test_reject_mode_refuses_near_copies(self):
+        response = self._post('Django signals', self.TEXT)
+        self.assertEqual(response.status_code, 400)
+        # The other blog is not named, it may belong to another user
+        self.assertEqual(response.data['description'], ["This post is a near-duplicate of an existing post."])
+        self.assertEqual(Blog.objects.count(), 1)
+
+        with override_settings(DUPLICATE_THRESHOLD=1.01): # Nothing is that similar
+            self.assertEqual(self._post('Django signals', self.TEXT).status_code, 201)
+
+    @override_settings(DUPLICATE_DETECTION=None)
+    def test_detection_can_be_turned_off(self):
+        copy = self._post('Django signals', self.TEXT)
+        self.assertEqual(copy.status_code, 201)
+        self.assertFalse(BlogSignature.objects.filter(blog_id=copy.data['id']).exists())
+
+
+class FeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.category = Category.objects.create(title='Python')
+        cls.tag = Tag.objects.create(title='orm')
+        cls.blogs = [
+            Blog.objects.create(user=cls.author, category=cls.category, title=f'Post {index} <&>', description='Body')
+            for index in range(5)
+        ]
+        cls.blogs[0].tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+
+    def _get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_feeds_are_valid_and_scoped(self):
+        for url, count in (('/api/feeds/rss/', 5), ('/api/feeds/atom/', 5),
+                           ('/api/feeds/category/python/rss/', 5), ('/api/feeds/tag/orm/atom/', 1)):
+            response, body = self._get(url)
+            items = ElementTree.fromstring(body).iter()
+            self.assertEqual(sum(element.tag in ('item', '{http://www.w3.org/2005/Atom}entry') for element in items), count, url)
+        self.assertEqual(self.client.get('/api/feeds/tag/missing/rss/').status_code, 404)
+        self.assertEqual(self.client.get('/api/feeds/json/').status_code, 404)
+
+    def test_conditional_requests_until_a_blog_changes(self):
+        response, body = self._get('/api/feeds/rss/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get('/api/feeds/rss/')[1], body) # Cached
+            self.assertEqual(self.client.get('/api/feeds/rss/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.get(pk=self.blogs[4].pk)
+            blog.title = 'Renamed'
+            blog.save()
+        response, body = self._get('/api/feeds/rss/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Renamed', body)
+
+    def test_documents_are_not_cached_when_a_change_lands_while_streaming(self):
+        url = hashlib.sha1(b'http://testserver/api/feeds/rss/').hexdigest()
+        response = self.client.get('/api/feeds/rss/')
+        key = f"feeds:{response['ETag'].strip(chr(34))}:{url}"
+        chunks = iter(response.streaming_content)
+        next(chunks)
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.get(pk=self.blogs[4].pk)
+            blog.title = 'Renamed'
+            blog.save()
+        list(chunks)
+        self.assertIsNone(cache.get(key)) # It may or may not hold the change
+
+        response, body = self._get('/api/feeds/rss/')
+        key = f"feeds:{response['ETag'].strip(chr(34))}:{url}"
+        self.assertEqual(cache.get(key).encode(), body)
+
+    def test_the_stamp_is_stable_without_a_change_log(self):
+        ChangeLogEntry.objects.all().delete() # As right after migrating an existing database
+        cache.clear()
+        response = self.client.get('/api/feeds/rss/')
+        newest = max(blog.created_date for blog in self.blogs)
+        self.assertEqual(response['Last-Modified'], http_date(calendar.timegm(newest.timetuple())))
+
+        cache.clear() # The stamp expired
+        later = timezone.now() + timedelta(hours=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(self.client.get('/api/feeds/rss/')['ETag'], response['ETag'])
+
+    def test_sitemap_shards(self):
+        with mock.patch.object(feeds, 'SITEMAP_SHARD_SIZE', 2):
+            index = ElementTree.fromstring(self._get('/api/sitemap.xml')[1])
+            shards = [loc.text for loc in index.iter('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
+            urls = []
+            for shard in shards:
+                urlset = ElementTree.fromstring(self._get(shard)[1])
+                urls += [loc.text for loc in urlset.iter('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
+        self.assertEqual(len(shards), len({blog.id // 2 for blog in self.blogs}))
+        self.assertEqual(sorted(urls), sorted(f'http://testserver/api/blog-details/{blog.slug}/' for blog in self.blogs))
+
+
+# Every endpoint of blog/urls.py and users/urls.py must run the same number of queries
+# whatever the size of the corpus. The corpus grows from 1 to 10 to 100 blogs with a
+# varying number of tags, reviews and favourites, and each endpoint is measured at every
+# size with cold caches. A failure lists the statements that ran more often on the larger corpus.
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryCountScalingTests(TestCase):
+    SIZES = (1, 10, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='author@example.com', username='author', password='pass')
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+        cls.reviewers = [
+            User.objects.create_user(email=f'reviewer{index}@example.com', username=f'reviewer{index}', password='pass')
+            for index in range(4)
+        ]
+        cls.categories = [Category.objects.create(title=title) for title in ('Python', 'Go', 'Rust')]
+
+    def setUp(self):
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.reader_client = APIClient()
+        self.reader_client.force_authenticate(self.reader)
+        self.anonymous_client = APIClient()
+        self.blogs = []
+        self.tags = []
+
+    def _grow(self, size):
+        # Blog n has 1 to 5 tags (new ones keep being added) and 1 to 4 reviews,
+        # and every other blog is one of the reader's favourites
+        for index in range(len(self.blogs), size):
+            blog = Blog.objects.create(
+                user=self.author,
+                category=self.categories[index % len(self.categories)],
+                title=f'Scaling post {index}',
+                description=f'Body of scaling post {index}',
+            )
+            self.tags.append(Tag.objects.create(title=f'scaling-{index}'))
+            blog.tags.set(self.tags[-(index % 5 + 1):])
+            for review_index in range(index % 4 + 1):
+                Review.objects.create(
+                    user=self.reviewers[review_index], blog=blog, comment=f'Review {review_index}', rating=review_index + 1
+                )
+            if index % 2 == 0:
+                Favourite.objects.create(user=self.reader, blog=blog)
+            self.blogs.append(blog)
+
+    def _count(self, request):
+        cache.clear() # Cold caches: author statistics, version stamps and the in-process caches reload
+        with mock.patch('blog.suggest.SUGGEST_REFRESH_INTERVAL', 0), CaptureQueriesContext(connection) as queries:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content) # Feeds and sitemaps query while streaming
+        self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+        return [query['sql'] for query in queries]
+
+    def _reads(self):
+        blog = self.blogs[0]
+        created = blog.created_date
+        return {
+            'all-blogs': lambda: self.anonymous_client.get('/api/all-blogs/', {'page_size': 100}),
+            'all-blogs (reader)': lambda: self.reader_client.get('/api/all-blogs/', {'page_size': 100}),
+            'all-blogs latest': lambda: self.reader_client.get('/api/all-blogs/', {'latest': 100}),
+            'blog-detail': lambda: self.anonymous_client.get(f'/api/blog-details/{blog.slug}/'),
+            'blog-detail (reader)': lambda: self.reader_client.get(f'/api/blog-details/{blog.slug}/'),
+            'favourites-list': lambda: self.reader_client.get('/api/favourites/'),
+            'search': lambda: self.reader_client.get('/api/search/', {'find': 'scaling'}),
+            'suggest': lambda: self.anonymous_client.get('/api/suggest/', {'q': 'scal'}),
+            'filter-category': lambda: self.reader_client.get('/api/filter-category/', {'category': self.categories[0].id}),
+            'filter-tags': lambda: self.reader_client.get(
+                '/api/filter-tags/', {'tags': ','.join(tag.title for tag in self.tags[:20])}
+            ),
+            'archive': lambda: self.anonymous_client.get('/api/archive/'),
+            'archive-month': lambda: self.reader_client.get(
+                f'/api/archive/{created.year}/{created.month}/', {'page_size': 100}
+            ),
+            'changes': lambda: self.reader_client.get('/api/changes/', {'since': 0, 'limit': 1000}),
+            'categories': lambda: self.anonymous_client.get('/api/categories/', {'ordering': 'popular'}),
+            'tags': lambda: self.anonymous_client.get('/api/tags/', {'ordering': 'popular'}),
+            'blogs': lambda: self.author_client.get('/api/blogs/'),
+            'blogs detail': lambda: self.author_client.get(f'/api/blogs/{blog.id}/'),
+            'api root': lambda: self.anonymous_client.get('/api/'),
+            'feed': lambda: self.anonymous_client.get('/api/feeds/rss/'),
+            'category feed': lambda: self.anonymous_client.get(f'/api/feeds/category/{self.categories[0].slug}/atom/'),
+            'tag feed': lambda: self.anonymous_client.get(f'/api/feeds/tag/{self.tags[0].slug}/rss/'),
+            'sitemap index': lambda: self.anonymous_client.get('/api/sitemap.xml'),
+            'sitemap': lambda: self.anonymous_client.get(f'/api/sitemap-{blog.id // feeds.SITEMAP_SHARD_SIZE}.xml'),
+            'profile': lambda: self.author_client.get('/api/profile/'),
+            'profile detail': lambda: self.author_client.get(f'/api/profile/{self.author.id}/'),
+            'profile stats': lambda: self.author_client.get('/api/profile/stats/'),
+        }
+
+    def _writes(self, size):
+        # Each size writes new rows of the same shape, with fresh tag names and titles
+        steps = {}
+        state = {}
+
+        def create_blog():
+            response = self.author_client.post('/api/blogs/', {
+                'title': f'Written at {size}', 'description': 'Body', 'category': self.categories[0].id,
+                'tags': f'write-{size}-a, write-{size}-b',
+            }, format='json')
+            state['blog'] = response.data
+            return response
+
+        def login():
+            response = self.anonymous_client.post('/api/login/', {'email': 'reader@example.com', 'password': 'pass'}, format='json')
+            state['refresh'] = response.data['refresh_token']
+            return response
+
+        steps['create blog'] = create_blog
+        steps['update blog'] = lambda: self.author_client.patch(
+            f"/api/blogs/{state['blog']['id']}/", {'title': f'Rewritten at {size}', 'tags': f'write-{size}-c'}, format='json'
+        )
+        steps['review'] = lambda: self.reader_client.post(
+            f"/api/blog-details/{Blog.objects.get(pk=state['blog']['id']).slug}/", {'comment': 'Nice', 'rating': 5}, format='json'
+        )
+        steps['add favourite'] = lambda: self.reader_client.post(f"/api/favourites/{state['blog']['id']}/")
+        steps['remove favourite'] = lambda: self.reader_client.delete(f"/api/favourites/{state['blog']['id']}/")
+        steps['delete blog'] = lambda: self.author_client.delete(f"/api/blogs/{state['blog']['id']}/")
+        steps['update profile'] = lambda: self.author_client.patch(
+            f'/api/profile/{self.author.id}/', {'first_name': f'Size {size}'}, format='json'
+        )
+        steps['register'] = lambda: self.anonymous_client.post('/api/register/', {
+            'username': f'new{size}', 'email': f'new{size}@example.com', 'password': 'pass', 'confirm_password': 'pass',
+        }, format='json')
+        steps['login'] = login
+        steps['token refresh'] = lambda: self.anonymous_client.post('/api/token/refresh/', {'refresh': state['refresh']}, format='json')
+        return steps
+
+    def _assert_constant(self, measured):
+        failures = []
+        for name, by_size in measured.items():
+            counts = {size: len(queries) for size, queries in by_size.items()}
+            if len(set(counts.values())) > 1:
+                smallest, largest = by_size[self.SIZES[0]], by_size[self.SIZES[-1]]
+                failures.append(f"{name}: {counts} queries per corpus size\n" + _grown_sql(smallest, largest))
+        if failures:
+            self.fail('\n'.join(failures))
+
+    def test_query_counts_do_not_grow_with_the_corpus(self):
+        measured = {}
+        for size in self.SIZES:
+            self._grow(size)
+            for name, request in self._reads().items():
+                measured.setdefault(name, {})[size] = self._count(request)
+            # Writes run in order, each step uses the rows of the previous ones
+            for name, request in self._writes(size).items():
+                measured.setdefault(name, {})[size] = self._count(request)
+        self._assert_constant(measured)
+
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'IN \([^)]*\)')
+
+
+def _normalize_sql(sql):
+    return _in_lists.sub('IN (...)', _literals.sub('?', sql))
+
+
+def _grown_sql(smallest, largest):
+    # The statements that run more often on the larger corpus, with how often
+    before = Counter(map(_normalize_sql, smallest))
+    after = Counter(map(_normalize_sql, largest))
+    grown = [(count, before[sql], sql) for sql, count in after.items() if count > before[sql]]
+    grown.sort(reverse=True)
+    return '\n'.join(f'  {previous} -> {count} times: {sql}' for count, previous, sql in grown) \
+        or '  (the same statements, fewer of them on the larger corpus)'
@@ -0,0 +1,103 @@
+from django.db import models, router
+from django.db.models.signals import post_save, pre_save
+
+
+class ChangeTrackingMixin(models.Model):
+    """
+    Remember the field values an instance was loaded with and expose `changed_fields`.
+
+    Saving a loaded instance only writes the modified columns, and skips the
+    UPDATE entirely when nothing changed. `pre_save` and `post_save` are still
+    sent for such a save, with an empty `update_fields`, so receivers can tell
+    nothing was written. `post_save` receivers still see the values from before
+    the save through `changed_fields` and `initial_value()`.
+    Instances created in Python are tracked from their first save on. Deferred
+    fields are snapshotted when loaded, and count as changed when assigned first.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _take_snapshot(self):
+        # Deferred fields are not in __dict__ and are left out, reading them would run a query
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    @property
+    def is_tracked(self):
+        return getattr(self, '_loaded_values', None) is not None
+
+    @property
+    def changed_fields(self):
+        """
+        Names of the fields modified since the instance was loaded (or last saved).
+        Every concrete field for instances that were never loaded or saved.
+        """
+        concrete_fields = [field for field in self._meta.concrete_fields if not field.primary_key]
+        if not self.is_tracked:
+            return {field.name for field in concrete_fields}
+
+        changed = set()
+        for field in concrete_fields:
+            if field.attname not in self.__dict__:
+                continue # Deferred and never set
+            if field.attname not in self._loaded_values:
+                changed.add(field.name) # Deferred, then assigned: nothing to compare with
+                continue
+            value = self.__dict__[field.attname]
+            if not getattr(value, '_committed', True): # A newly assigned, unsaved file
+                changed.add(field.name)
+            elif value != self._loaded_values[field.attname]:
+                changed.add(field.name)
+        return changed
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if not self.is_tracked:
+            return
+        # Deferred fields are loaded here on first access: snapshot them so reading one does not mark it changed
+        names = None if fields is None else {self._meta.get_field(name).attname for name in fields}
+        for field in self._meta.concrete_fields:
+            if not field.primary_key and field.attname in self.__dict__ and (names is None or field.attname in names):
+                self._loaded_values[field.attname] = self.__dict__[field.attname]
+
+    def initial_value(self, name):
+        """
+        Return the value a field had when the instance was loaded (or last saved), or None.
+        """
+        if not self.is_tracked:
+            return None
+        return self._loaded_values.get(self._meta.get_field(name).attname)
+
+    def save(self, *args, **kwargs):
+        limit_update = (
+            self.is_tracked
+            and not self._state.adding
+            and not args
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+        )
+        if limit_update:
+            changed = self.changed_fields
+            if not changed:
+                self._send_save_signals(kwargs.get('using')) # Nothing to write
+                return
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._take_snapshot()
+
+    def _send_save_signals(self, using):
+        # Django sends no signals for an empty `update_fields`, send them as for any save
+        origin = self.__class__
+        using = using or router.db_for_write(origin, instance=self)
+        pre_save.send(sender=origin, instance=self, raw=False, using=using, update_fields=frozenset())
+        post_save.send(sender=origin, instance=self, created=False, raw=False, using=using, update_fields=frozenset())
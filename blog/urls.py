@@ -11,6 +11,13 @@ from .views import (
     BlogFavouriteListView,
     CategoryListView,
     TagListView,
+    SuggestView,
+    ArchiveView,
+    ArchiveMonthView,
+    ChangeFeedView,
+    FeedView,
+    SitemapIndexView,
+    SitemapView,
 )
 
 router = DefaultRouter()
@@ -22,8 +29,17 @@ urlpatterns = [
     path('favourites/', BlogFavouriteListView.as_view(), name='favourites-list'),
     path('all-blogs/', BlogListView.as_view(), name='all-blogs'),
     path('search/', BlogSearchView.as_view(), name='search'),
+    path('suggest/', SuggestView.as_view(), name='suggest'),
     path('filter-category/', BlogCategoryFilterView.as_view(), name='category'),
     path('filter-tags/', BlogTagFilterView.as_view(), name='tags'),
+    path('archive/', ArchiveView.as_view(), name='archive'),
+    path('archive/<int:year>/<int:month>/', ArchiveMonthView.as_view(), name='archive-month'),
+    path('changes/', ChangeFeedView.as_view(), name='changes'),
+    path('feeds/<str:kind>/', FeedView.as_view(), name='feed'),
+    path('feeds/category/<slug:slug>/<str:kind>/', FeedView.as_view(scope='category'), name='category-feed'),
+    path('feeds/tag/<slug:slug>/<str:kind>/', FeedView.as_view(scope='tag'), name='tag-feed'),
+    path('sitemap.xml', SitemapIndexView.as_view(), name='sitemap'),
+    path('sitemap-<int:shard>.xml', SitemapView.as_view(), name='sitemap-shard'),
     path('categories/', CategoryListView.as_view(), name='categories'),
     path('tags/', TagListView.as_view(), name='tags'),
 
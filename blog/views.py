@@ -1,9 +1,18 @@
+from datetime import date
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.utils.text import slugify
+from django.views import View
 from rest_framework import viewsets, pagination, status
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.filters import SearchFilter
 from django.db.models import (
     Q, 
@@ -11,38 +20,198 @@ from django.db.models import (
     OuterRef, 
     Value, 
     BooleanField,
+    Case,
+    When,
 )
 
 
 from .models import (
+    ArchiveMonth,
     Blog,
     Category,
     Tag,
     Favourite,
 )
 
+from .favourite_buffer import get_favourite_buffer
+from .personalization import can_share, personalize, shared_payload
+from .changes import MAX_CHANGES, read_changes
+from .duplicates import duplicate_to_reject
+from .feeds import cached_document, feed, sitemap, sitemap_index
+from .fast_serializers import BlogValuesSerializer
+from .suggest import suggest_index
 from .serializers import (
     BlogSerializer,
-    ReviewSerializer,
+    ReviewCreateSerializer,
     BlogDetailSerializer,
     CategorySerializer,
     TagSerializer,
+    resolve_fieldset,
 )
 # Create your views here.
 
+# Build the `is_favourited` annotation for the given user
+# Use `Exists` and `OuterRef` for better performance
+# In write-behind mode, toggles still waiting in the buffer override the database
+# so the acting user always reads their own writes
+def favourite_annotation(user):
+    if not user.is_authenticated:
+        return Value(False, output_field=BooleanField())
+
+    annotation = Exists(Favourite.objects.filter(user=user, blog=OuterRef('pk')))
+
+    buffer = get_favourite_buffer()
+    if buffer is None:
+        return annotation
+
+    added, removed = buffer.pending_for_user(user.id)
+    if not added and not removed:
+        return annotation
+    return Case(
+        When(pk__in=added, then=Value(True)),
+        When(pk__in=removed, then=Value(False)),
+        default=annotation,
+        output_field=BooleanField(),
+    )
+
+
+# Fetch only what the selected BlogSerializer fields need
+# Unselected columns are deferred and unneeded joins and prefetches are skipped
+def sparse_blog_queryset(queryset, fields):
+    fields = set(fields)
+    columns = ['id', 'category'] # `category_id` is also read by related_blogs
+    columns += [name for name in ('title', 'slug', 'banner', 'description', 'excerpt', 'created_date') if name in fields]
+
+    if 'user' in fields:
+        columns += ['user', 'user__username']
+        queryset = queryset.select_related('user')
+
+    prefetches = []
+    if 'tag_title' in fields:
+        prefetches.append('tags')
+    if 'reviews' in fields:
+        prefetches.append('blog_reviews__user')
+
+    return queryset.only(*columns).prefetch_related(*prefetches)
+
+
+# Serve read-only Blog lists through BlogValuesSerializer
+# Same JSON as BlogSerializer, built from a `.values()` projection of the queryset
+# Lists return the stored `excerpt` instead of the full `description`, unless `?fields=` asks for it
+class BlogValuesListMixin:
+    default_exclude = ('description',)
+    extra_columns = () # Fetched whatever the fieldset, e.g. for the pagination cursor
+
+    def list(self, request, *args, **kwargs):
+        fields = resolve_fieldset(request, BlogValuesSerializer.fields, self.default_exclude)
+        queryset = BlogValuesSerializer.project(
+            self.filter_queryset(self.get_queryset()), fields, extra_columns=self.extra_columns
+        )
+        context = self.get_serializer_context()
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                BlogValuesSerializer(page, many=True, context=context, fields=fields).data
+            )
+        return Response(BlogValuesSerializer(queryset, many=True, context=context, fields=fields).data)
+
+
 # Custom pagination class
 class PaginationView(pagination.PageNumberPagination):
     page_size = 4
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+# Keyset pagination for blog lists, newest first
+# The cursor is the (created_date, id) of the last row, so every page is a range scan
+# on blog_archive_keyset_idx however deep the client pages, and no COUNT(*) is run
+class KeysetPagination(pagination.BasePagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            day, pk = cursor
+            queryset = queryset.filter(Q(created_date__lt=day) | Q(created_date=day, id__lt=pk))
+
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1]) # One extra row tells if there is a next page
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = f"{rows[-1]['created_date'].isoformat()}.{rows[-1]['id']}"
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            day, pk = cursor.split('.')
+            return date.fromisoformat(day), int(pk)
+        except ValueError:
+            raise NotFound("Invalid cursor")
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+# Pagination for metadata lists (categories and tags)
+# Lists stay unpaginated unless the client asks for a `page_size`
+class MetadataPaginationView(pagination.PageNumberPagination):
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# Popularity ordering and prefix filtering for metadata lists
+# `?ordering=popular` sorts by the maintained `blog_count` column (indexed)
+# `?prefix=` is matched against the indexed slug as a range scan
+class MetadataListMixin:
+    pagination_class = MetadataPaginationView
+    ordering_options = {
+        'popular': ('-blog_count', 'title'),
+        'title': ('title',),
+        'newest': ('-created_date', '-id'),
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        prefix = slugify(self.request.query_params.get('prefix', ''))
+        if prefix:
+            queryset = queryset.filter(slug__gte=prefix, slug__lt=prefix + '\U0010ffff')
+
+        ordering = self.ordering_options.get(self.request.query_params.get('ordering'), ('id',))
+        return queryset.order_by(*ordering)
+
+
 # List all Categories
-class CategoryListView(ListAPIView):
+class CategoryListView(MetadataListMixin, ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer 
 
 # List all Tags
-class TagListView(ListAPIView):
+class TagListView(MetadataListMixin, ListAPIView):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer   
 
@@ -60,40 +229,64 @@ class BlogViewSet(viewsets.ModelViewSet):
         # Filter the queryset based on the user
         # Use select_related and prefetch_related for better performance
         # Use `filter` instead of `all` to avoid fetching all objects
-        return Blog.objects.filter(user=self.request.user) \
-                           .select_related('category', 'user') \
-                           .prefetch_related('tags', 'blog_reviews__user')
+        # Only fetch the fields selected with `?fields=` / `?exclude=`
+        fields = resolve_fieldset(self.request, self.get_serializer_class().Meta.fields)
+        return sparse_blog_queryset(Blog.objects.filter(user=self.request.user), fields)
     
 
+    # Writes run in a transaction, so the counters, the archive and the
+    # change log entries written by the signals commit or roll back with the blog
     def perform_create(self, serializer):
-        # Set the user before saving the object
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            # Near-duplicates of existing blogs are rejected when DUPLICATE_DETECTION is 'reject',
+            # otherwise they are flagged on save (blog/duplicates.py)
+            # Checked in the transaction that saves the blog, and without naming the other
+            # blog, which may belong to another user
+            duplicate = duplicate_to_reject(serializer.validated_data['title'], serializer.validated_data['description'])
+            if duplicate is not None:
+                raise ValidationError({"description": ["This post is a near-duplicate of an existing post."]})
+
+            # Set the user before saving the object
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
 
 
 # List all Blogs with pagination or limit the queryset
 # Optimized for performance
-class BlogListView(ListAPIView):
+class BlogListView(BlogValuesListMixin, ListAPIView):
     serializer_class = BlogSerializer
     pagination_class = PaginationView  # Default pagination class
+    favourite_user = None # Who `is_favourited` is annotated for, the request user by default
+    shared_params = ('page', 'page_size', 'latest', 'fields', 'exclude') # Query parameters of cached payloads
+
+    # Every user gets the cached anonymous payload with their own `is_favourited`
+    # merged in, see blog/personalization.py
+    def list(self, request, *args, **kwargs):
+        fields = resolve_fieldset(request, BlogValuesSerializer.fields, self.default_exclude)
+        if not can_share(fields):
+            return super().list(request, *args, **kwargs)
+
+        self.favourite_user = AnonymousUser()
+        data = shared_payload(request, lambda: super(BlogListView, self).list(request, *args, **kwargs).data, self.shared_params)
+        return Response(personalize(data, request.user))
 
     def get_queryset(self):
         # Get the `latest` parameter from the request
         latest = self.request.query_params.get('latest', None)
-        user = self.request.user # Get the user from the request
 
-        
-        # Annotate `is_favourited` only if the user is authenticated
-        # Use `Exists` and `OuterRef` for better performance
-        if user.is_authenticated:
-            queryset = Blog.objects.annotate(
-                is_favourited=Exists(Favourite.objects.filter(user=user, blog=OuterRef('pk')))
-            )
-        else:
-            queryset = Blog.objects.annotate(
-                is_favourited=Value(False, output_field=BooleanField())
-            )
+        # Annotate `is_favourited` (always False for anonymous users and shared payloads)
+        queryset = Blog.objects.annotate(
+            is_favourited=favourite_annotation(self.favourite_user or self.request.user)
+        )
 
-        queryset = queryset.select_related('category', 'user') \
+        queryset = queryset.select_related('user') \
                        .prefetch_related('tags', 'blog_reviews__user') \
                        .order_by('-created_date')
 
@@ -109,53 +302,71 @@ class BlogListView(ListAPIView):
 # Retrieve a single Blog with reviews
 # Optimized for performance
 class BlogDetailView(RetrieveAPIView):
-    queryset = Blog.objects.select_related('category', 'user') \
-                            .prefetch_related('tags', 'blog_reviews__user')
+    queryset = Blog.objects.all()
     serializer_class = BlogDetailSerializer
     lookup_field = 'slug'  # You can still use slug for easy URL access
     permission_classes = [IsAuthenticatedOrReadOnly]
+    favourite_user = None # Who `is_favourited` is annotated for, the request user by default
+    shared_params = ('fields', 'exclude') # Query parameters of cached payloads
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        user = self.request.user
+        # Only fetch the fields selected with `?fields=` / `?exclude=`
+        fields = resolve_fieldset(self.request, BlogDetailSerializer.Meta.fields)
+        queryset = sparse_blog_queryset(super().get_queryset(), fields)
 
         # Annotate `is_favourited` for the single blog
-        if user.is_authenticated:
-            queryset = queryset.annotate(
-                is_favourited=Exists(Favourite.objects.filter(user=user, blog=OuterRef('pk')))
-            )
-        else:
-            queryset = queryset.annotate(
-                is_favourited=Value(False, output_field=BooleanField())
-            )
-        return queryset
+        return queryset.annotate(
+            is_favourited=favourite_annotation(self.favourite_user or self.request.user)
+        )
+
+    # Shared between users like the blog list, with `is_favourited` merged in per user
+    def retrieve(self, request, *args, **kwargs):
+        if not can_share(resolve_fieldset(request, BlogDetailSerializer.Meta.fields)):
+            return super().retrieve(request, *args, **kwargs)
+
+        self.favourite_user = AnonymousUser()
+        data = shared_payload(request, lambda: super(BlogDetailView, self).retrieve(request, *args, **kwargs).data, self.shared_params)
+        return Response(personalize(data, request.user))
     
     # Override the `get_serializer_class` method to use different serializers
-    # Use the ReviewSerializer for POST requests
+    # Use the ReviewCreateSerializer for POST requests
     # Use the BlogDetailSerializer for GET requests
     def get_serializer_class(self):
         if self.request.method == 'POST':
-            return ReviewSerializer
+            return ReviewCreateSerializer
         return BlogDetailSerializer
     
-    # Override the `get_object` method to prefetch related objects
-    # This method is called before the view retrieves the object
-    def perform_create(self, serializer):
-        blog = self.get_object()
-        serializer.save(user=self.request.user, blog=blog)
+    # Save the review against a blog loaded with its id and author only
+    # The full detail queryset (annotations and prefetches) is not needed to write a review,
+    # the author is read by the dashboard statistics signal without querying the blog again
+    def perform_create(self, serializer, blog):
+        with transaction.atomic():
+            serializer.save(user=self.request.user, blog=blog)
     
     # Override the `post` method to handle review creation
     # This method is called when a POST request is made to the view
-    # Use the `perform_create` method to save the review
+    # Resolve the blog with a single id-only query, then insert the review
+    # Three queries in all: the blog, the review and its change log entry
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+
+        blog = Blog.objects.filter(slug=kwargs[self.lookup_field]) \
+                           .only('id', 'user') \
+                           .first()
+        if blog is None:
+            raise Http404
+
+        self.perform_create(serializer, blog)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 # For add and delete favourite
 # Optimized for performance
+# With `FAVOURITE_WRITE_BEHIND` enabled, toggles are validated with a single read
+# and handed to the write buffer instead of writing on the request thread
+# Either way the user's cached favourite id set is dropped once the write commits
+# (blog/signals.py), pending toggles are merged in on read (blog/personalization.py)
 class BlogFavouriteView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -164,7 +375,15 @@ class BlogFavouriteView(APIView):
         Add a blog to the user's favorites.
         """
         user = request.user
-        blog = get_object_or_404(Blog, id=id)
+        buffer = get_favourite_buffer()
+        if buffer is not None:
+            if self._favourite_state(buffer, user, id):
+                return Response({"message": "Blog is already in favorites"}, status=status.HTTP_400_BAD_REQUEST)
+            buffer.add(user.id, id)
+            return Response({"message": "Blog added to favorites"}, status=status.HTTP_201_CREATED)
+
+        # The author is loaded for the stats invalidation (blog/signals.py)
+        blog = get_object_or_404(Blog.objects.only('id', 'user'), id=id)
         favourite, created = Favourite.objects.get_or_create(user=user, blog=blog)
 
         if created:
@@ -176,14 +395,33 @@ class BlogFavouriteView(APIView):
         Remove a Blog from the user's favorites.
         """
         user = request.user
-        blog = get_object_or_404(Blog, id=id)
-        # Use `delete()` directly with a filter for better efficiency
-        deleted, _ = Favourite.objects.filter(user=user, blog=blog).delete()
+        buffer = get_favourite_buffer()
+        if buffer is not None:
+            if not self._favourite_state(buffer, user, id):
+                return Response({"message": "Blog not found in favorites"}, status=status.HTTP_404_NOT_FOUND)
+            buffer.remove(user.id, id)
+            return Response({"message": "Blog removed from favorites"}, status=status.HTTP_200_OK)
 
-        if deleted:
+        blog = get_object_or_404(Blog.objects.only('id', 'user'), id=id)
+        favourite = Favourite.objects.filter(user=user, blog=blog).only('id', 'user', 'blog').first()
+
+        if favourite is not None:
+            favourite.blog = blog # Hands the author to the delete signals, no lookup needed
+            favourite.delete()
             return Response({"message": "Blog removed from favorites"}, status=status.HTTP_200_OK)
         return Response({"message": "Blog not found in favorites"}, status=status.HTTP_404_NOT_FOUND)
 
+    def _favourite_state(self, buffer, user, blog_id):
+        # Check that the blog exists and read the current favourite state in one query
+        # A pending toggle in the buffer takes precedence over the stored state
+        favourited = Blog.objects.filter(id=blog_id) \
+                                 .annotate(is_favourited=favourite_annotation(user)) \
+                                 .values_list('is_favourited', flat=True) \
+                                 .first()
+        if favourited is None:
+            raise Http404
+        return favourited
+
 
 # for get all favourite blogs
 # Optimized for performance
@@ -192,16 +430,27 @@ class BlogFavouriteListView(APIView):
 
     def get(self, request):
         user = request.user
-        favourites = Blog.objects.filter(favourited_by__user=user) \
-                                   .select_related('category', 'user') \
-                                   .prefetch_related('tags', 'blog_reviews__user')
-        serializer = BlogSerializer(favourites, many=True, context={'request': request})
+        favourites = Blog.objects.filter(favourited_by__user=user)
+
+        # Include toggles still waiting in the write buffer (read-your-writes)
+        buffer = get_favourite_buffer()
+        if buffer is not None:
+            added, removed = buffer.pending_for_user(user.id)
+            if added:
+                favourites = Blog.objects.filter(Q(favourited_by__user=user) | Q(pk__in=added)).distinct()
+            if removed:
+                favourites = favourites.exclude(pk__in=removed)
+
+        fields = resolve_fieldset(request, BlogValuesSerializer.fields, default_exclude=('description',))
+        serializer = BlogValuesSerializer(
+            BlogValuesSerializer.project(favourites, fields), many=True, context={'request': request}, fields=fields
+        )
         return Response(serializer.data)
     
 
 # Filter Blogs by category
 # Optimized for performance
-class BlogCategoryFilterView(ListAPIView):
+class BlogCategoryFilterView(BlogValuesListMixin, ListAPIView):
     serializer_class = BlogSerializer
 
     def get_queryset(self):
@@ -213,7 +462,7 @@ class BlogCategoryFilterView(ListAPIView):
             return Blog.objects.none()
 
         # Filter the Blogs by category ID
-        queryset = Blog.objects.select_related('category', 'user') \
+        queryset = Blog.objects.select_related('user') \
                                  .prefetch_related(
                                      'tags', 'blog_reviews__user'  # Prefetch tags, reviews and the users who created them
                                  ) \
@@ -225,7 +474,7 @@ class BlogCategoryFilterView(ListAPIView):
 
 # Filter Blogs by tags
 # Optimized for performance
-class BlogTagFilterView(ListAPIView):
+class BlogTagFilterView(BlogValuesListMixin, ListAPIView):
     serializer_class = BlogSerializer
 
     def get_queryset(self):
@@ -240,7 +489,7 @@ class BlogTagFilterView(ListAPIView):
         tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
 
         # Filter blogs that are associated with the provided tags
-        queryset = Blog.objects.select_related('category', 'user') \
+        queryset = Blog.objects.select_related('user') \
                                .prefetch_related(
                                    'tags', 'blog_reviews__user'  # Prefetch tags, reviews, and the users who created them
                                ) \
@@ -253,14 +502,14 @@ class BlogTagFilterView(ListAPIView):
 
 # Search Blogs by title or tags
 # Optimized for performance
-class BlogSearchView(ListAPIView):
+class BlogSearchView(BlogValuesListMixin, ListAPIView):
     
     serializer_class = BlogSerializer
     filter_backends = [SearchFilter]
 
 
     def get_queryset(self):
-        queryset = Blog.objects.select_related('category', 'user') \
+        queryset = Blog.objects.select_related('user') \
                                 .prefetch_related('tags', 'blog_reviews__user')
         
         search_query = self.request.query_params.get('find', None)
@@ -274,4 +523,109 @@ class BlogSearchView(ListAPIView):
         
         return queryset
 
-    
\ No newline at end of file
+    
+
+# Blog counts per year and month, for the archive sidebar
+# Read from the ArchiveMonth rollup, `?category=` gives the counts of one category
+class ArchiveView(APIView):
+
+    def get(self, request):
+        category_id = request.query_params.get('category', None)
+        months = ArchiveMonth.objects.filter(blog_count__gt=0)
+        if category_id is None:
+            months = months.filter(category__isnull=True)
+        elif category_id.isdigit():
+            months = months.filter(category_id=category_id)
+        else:
+            return Response([])
+
+        years = []
+        for year, month, blog_count in months.order_by('-year', '-month').values_list('year', 'month', 'blog_count'):
+            if not years or years[-1]['year'] != year:
+                years.append({'year': year, 'blog_count': 0, 'months': []})
+            years[-1]['blog_count'] += blog_count
+            years[-1]['months'].append({'month': month, 'blog_count': blog_count})
+        return Response(years)
+
+
+# Blogs created in one month, newest first
+# A range on the indexed `created_date`, paginated with a (created_date, id) cursor
+class ArchiveMonthView(BlogValuesListMixin, ListAPIView):
+    serializer_class = BlogSerializer
+    pagination_class = KeysetPagination
+    extra_columns = ('created_date',) # Read by the cursor
+
+    def get_queryset(self):
+        year, month = self.kwargs['year'], self.kwargs['month']
+        if not (1 <= month <= 12 and 1 <= year <= 9999):
+            raise Http404
+        start = date(year, month, 1)
+
+        queryset = Blog.objects.annotate(is_favourited=favourite_annotation(self.request.user)) \
+                               .filter(created_date__gte=start)
+        if (year, month) < (9999, 12):
+            queryset = queryset.filter(created_date__lt=date(year + month // 12, month % 12 + 1, 1))
+
+        category_id = self.request.query_params.get('category', None)
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id) if category_id.isdigit() else queryset.none()
+        return queryset
+
+
+# Change feed for delta sync
+# `?since=` is the `cursor` of the previous response (0 for a first sync)
+# Returns up to `?limit=` changes in order with the current state of each object,
+# favourite changes are only returned to their user
+# Clients apply `create` and `update` alike as an upsert of `data`, and start over from 0 on `resync`
+class ChangeFeedView(APIView):
+
+    def get(self, request):
+        try:
+            since = max(int(request.query_params.get('since', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', 200)), 1), MAX_CHANGES)
+        except ValueError:
+            return Response({"message": "`since` and `limit` must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(read_changes(request, since, limit))
+
+
+# Autocomplete for the search box
+# Served from the in-memory prefix index (blog/suggest.py), no database query per keystroke
+# `?q=` is matched against the start of any word of blog, tag and category titles
+class SuggestView(APIView):
+    authentication_classes = [] # Suggestions are the same for everyone, skip the JWT decode
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        suggestions = suggest_index.lookup(request.query_params.get('q', ''), limit=max(limit, 1))
+        return Response([
+            {'type': suggestion.kind, 'id': suggestion.pk, 'title': suggestion.title, 'slug': suggestion.slug}
+            for suggestion in suggestions
+        ])
+
+
+# RSS and Atom feeds of the latest blogs, all of them or of one category or tag (`scope`)
+# Plain Django views: XML streamed from blog/feeds.py, no content negotiation or authentication
+class FeedView(View):
+    scope = None
+
+    def get(self, request, kind, slug=None):
+        if kind not in ('rss', 'atom'):
+            raise Http404
+        return cached_document(request, kind, lambda: feed(request, kind, self.scope, slug))
+
+
+# Sitemap index, pointing at one sitemap per range of blog ids
+class SitemapIndexView(View):
+
+    def get(self, request):
+        return cached_document(request, 'sitemap', lambda: sitemap_index(request))
+
+
+class SitemapView(View):
+
+    def get(self, request, shard):
+        return cached_document(request, 'sitemap', lambda: sitemap(request, shard))
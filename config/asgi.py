@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Prime URL patterns, serializers, JWT and the in-memory caches before the first request
+# (enabled by WARMUP_ON_STARTUP, see config/warmup.py)
+from config.warmup import warm_up  # noqa: E402
+
+warm_up()
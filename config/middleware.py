@@ -0,0 +1,371 @@
+import gzip
+import random
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+from .profiling import profile_request, save_profile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+# Negotiated response compression
+# Picks brotli or gzip from the client's Accept-Encoding (honouring q-values),
+# skips small bodies, already encoded responses and already compressed media types.
+# Tuned through the COMPRESSION_* settings.
+class CompressionMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        self.skip_types = tuple(getattr(settings, 'COMPRESSION_SKIP_TYPES', ()))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type.startswith(self.skip_types):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response  # Async streams are left alone
+            response.streaming_content = self.compress_stream(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            compressed = self.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response  # Only keep the compressed body when it is smaller
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag no longer matches the encoded bytes, make it weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def negotiate(self, accept_encoding):
+        """
+        Return the best supported encoding ('br' or 'gzip') for an Accept-Encoding header, or None.
+        """
+        qualities = {}
+        for part in accept_encoding.lower().split(','):
+            coding, _, params = part.strip().partition(';')
+            if not coding:
+                continue
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            qualities[coding.strip()] = quality
+
+        supported = ('br', 'gzip') if brotli is not None else ('gzip',)
+        best, best_quality = None, 0.0
+        for coding in supported:  # Ordered by preference, so br wins ties
+            quality = qualities.get(coding, qualities.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = coding, quality
+        return best
+
+    def compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(content, quality=self.brotli_quality)
+        return gzip.compress(content, compresslevel=self.gzip_level, mtime=0)
+
+    def compress_stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            for chunk in chunks:
+                data = compressor.process(chunk)
+                if data:
+                    yield data
+            yield compressor.finish()
+        else:
+            # wbits=31 produces a gzip container
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+
+
+# Admission control
+# Each route class (ADMISSION_ROUTE_CLASSES) may run a limited number of requests at
+# once in this process. Requests over the limit wait in a short bounded queue and get
+# a fast 503 with Retry-After when the queue is full or the wait times out, so an
+# overload of expensive endpoints never makes the cheap ones time out as well.
+# Anonymous requests (without a valid JWT) may only fill half of a queue and
+# yield to waiting authenticated requests, so they are shed first.
+# The limits are per process: they matter for threaded (gthread) and ASGI workers.
+class AdmissionGate:
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._authenticated_turn = threading.Condition(self._lock)
+        self._anonymous_turn = threading.Condition(self._lock)
+        self.active = 0
+        self.waiting_authenticated = 0
+        self.waiting_anonymous = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_anonymous = 0 # Included in the two counters above
+
+    def acquire(self, anonymous):
+        """
+        Wait for a slot, returning False when the request should be rejected.
+        """
+        with self._lock:
+            waiting = self.waiting_authenticated + self.waiting_anonymous
+            if self.active < self.limit and not waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+
+            if waiting >= (self.queue_size // 2 if anonymous else self.queue_size):
+                self._reject(anonymous, timed_out=False)
+                return False
+
+            self.queued += 1
+            deadline = time.monotonic() + self.timeout
+            if anonymous:
+                self.waiting_anonymous += 1
+                turn = self._anonymous_turn
+            else:
+                self.waiting_authenticated += 1
+                turn = self._authenticated_turn
+            try:
+                # Anonymous requests also wait while authenticated ones are queued
+                while self.active >= self.limit or (anonymous and self.waiting_authenticated):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(anonymous, timed_out=True)
+                        return False
+                    turn.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                return True
+            finally:
+                if anonymous:
+                    self.waiting_anonymous -= 1
+                else:
+                    self.waiting_authenticated -= 1
+                # A wakeup this waiter took but did not need (it timed out, or a second release
+                # notified it before it ran), and the anonymous waiters' turn once the last
+                # authenticated one left, are passed on
+                self._wake_next()
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._wake_next()
+
+    def _wake_next(self):
+        # Called with the lock held
+        if self.active >= self.limit:
+            return
+        if self.waiting_authenticated:
+            self._authenticated_turn.notify()
+        elif self.waiting_anonymous:
+            self._anonymous_turn.notify()
+
+    def _reject(self, anonymous, timed_out):
+        if timed_out:
+            self.rejected_timeout += 1
+        else:
+            self.rejected_queue_full += 1
+        if anonymous:
+            self.rejected_anonymous += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'active': self.active,
+                'queue_depth': self.waiting_authenticated + self.waiting_anonymous,
+                'queue_depth_anonymous': self.waiting_anonymous,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout,
+                'rejected_anonymous': self.rejected_anonymous,
+            }
+
+
+_admission_gates = None
+_admission_gates_lock = threading.Lock()
+
+
+def get_admission_gates():
+    """
+    Return the gates of this process by route class name, built once from ADMISSION_LIMITS.
+    """
+    global _admission_gates
+    if _admission_gates is None:
+        with _admission_gates_lock:
+            if _admission_gates is None:
+                timeout = getattr(settings, 'ADMISSION_QUEUE_TIMEOUT', 0.5)
+                _admission_gates = {
+                    name: AdmissionGate(name, limit, queue_size, timeout)
+                    for name, (limit, queue_size) in getattr(settings, 'ADMISSION_LIMITS', {}).items()
+                }
+    return _admission_gates
+
+
+class AdmissionControlMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.gates = get_admission_gates()
+        # Longest prefixes first, so a more specific route wins
+        self.routes = sorted(
+            (
+                (prefix, name)
+                for name, prefixes in getattr(settings, 'ADMISSION_ROUTE_CLASSES', {}).items()
+                for prefix in prefixes
+            ),
+            key=lambda route: len(route[0]),
+            reverse=True,
+        )
+        self.exempt = tuple(getattr(settings, 'ADMISSION_EXEMPT_PATHS', ()))
+        self.retry_after = str(getattr(settings, 'ADMISSION_RETRY_AFTER', 1))
+
+    def route_class(self, path):
+        for prefix, name in self.routes:
+            if path.startswith(prefix):
+                return name
+        return 'default'
+
+    def __call__(self, request):
+        path = request.path_info
+        gate = None if path.startswith(self.exempt) else self.gates.get(self.route_class(path))
+        if gate is None:
+            return self.get_response(request)
+
+        if not gate.acquire(not self.is_authenticated(request)):
+            response = JsonResponse({"message": "Server is busy, please retry shortly"}, status=503)
+            response.headers['Retry-After'] = self.retry_after
+            return response
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            gate.release()
+            raise
+        if response.streaming:
+            # Keep the slot until the server has sent the body and closes the response
+            close = response.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    gate.release()
+
+            response.close = close_and_release
+        else:
+            gate.release()
+        return response
+
+    def is_authenticated(self, request):
+        """
+        Whether the request carries a valid JWT. Only the signature and the expiry are
+        checked, without a database query, any header will not do: it would let anyone
+        jump the queue. DRF loads the user later as usual.
+        """
+        authentication = JWTAuthentication()
+        header = authentication.get_header(request)
+        try:
+            raw_token = header and authentication.get_raw_token(header)
+            return bool(raw_token) and authentication.get_validated_token(raw_token) is not None
+        except (AuthenticationFailed, TokenError):
+            return False
+
+
+# On-demand request profiling, see config/profiling.py
+# Staff users profile a request by sending the PROFILING_HEADER (with a session, or with
+# their JWT, which is checked here since DRF only authenticates inside the view), and
+# PROFILING_SAMPLE_RATE profiles a random fraction of all requests.
+# The response of a profiled request names its profile in X-Profile-Id.
+# Only the view and the rendering are profiled, not the body of streaming responses.
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        header = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+        self.header = header and 'HTTP_' + header.upper().replace('-', '_')
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        self.exempt = tuple(getattr(settings, 'PROFILING_EXEMPT_PATHS', ()))
+
+    def __call__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        response, stats, summary = profile_request(self.get_response, request)
+        name = save_profile(stats, {
+            'path': request.path_info,
+            'method': request.method,
+            'status': response.status_code,
+            'trigger': trigger,
+            'created': time.time(),
+            **summary,
+        })
+        response.headers['X-Profile-Id'] = name
+        return response
+
+    def trigger(self, request):
+        """
+        Return why the request is profiled ('header' or 'sample'), or None.
+        """
+        if request.path_info.startswith(self.exempt):
+            return None
+        if self.header and request.META.get(self.header) and self.is_staff(request):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
@@ -0,0 +1,196 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+# Request profiling
+# ProfilingMiddleware (config/middleware.py) runs a request under cProfile when a staff
+# user sends the PROFILING_HEADER, or for a PROFILING_SAMPLE_RATE fraction of all requests.
+# Each profile is saved as a .pstats file with a .json summary next to it in PROFILING_DIR,
+# which keeps the PROFILING_KEEP most recent ones. Staff list and download them through
+# /api/ops/profiles/, and open them with `python -m pstats` or snakeviz.
+
+PROFILING_DIR = getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles')
+PROFILING_KEEP = getattr(settings, 'PROFILING_KEEP', 50)
+
+# Where the time goes: the self time of the functions in these modules, plus the self time
+# of whatever they call outside of them (the stdlib, Django utilities, C functions), split
+# between callers like gprof does. Queries run from a serializer count as ORM time,
+# serializers run by a renderer count as serializer time. The rest is 'other'
+CATEGORIES = (
+    ('orm', ('django/db/',)),
+    ('serializers', (
+        'rest_framework/serializers.py',
+        'rest_framework/fields.py',
+        'rest_framework/relations.py',
+        'blog/serializers.py',
+        'blog/fast_serializers.py',
+        'users/serializers.py',
+    )),
+    ('rendering', ('rest_framework/renderers.py', 'config/renderers.py')),
+)
+
+_profile_name = re.compile(r'^[0-9]+-[0-9]+-[a-z0-9-]+$')
+
+
+def _category(filename):
+    filename = filename.replace(os.sep, '/')
+    for name, modules in CATEGORIES:
+        if any(module in filename for module in modules):
+            return name
+    return None
+
+
+def breakdown(stats):
+    """
+    Milliseconds spent in each category of CATEGORIES and in everything else ('other').
+    """
+    shares = {}
+
+    def share(func, visiting):
+        # Fraction of the function's time that belongs to each category
+        if func in shares:
+            return shares[func]
+        category = _category(func[0])
+        if category is not None:
+            result = {category: 1.0}
+        else:
+            callers = stats.stats[func][4]
+            visiting.add(func) # Before the total, so a function calling itself is left out of it
+            total = sum(edge[3] for caller, edge in callers.items() if caller not in visiting)
+            if not total:
+                result = {'other': 1.0} # Where the profile starts, or only called recursively
+            else:
+                result = {}
+                for caller, edge in callers.items():
+                    if caller in visiting:
+                        continue
+                    for name, fraction in share(caller, visiting).items():
+                        result[name] = result.get(name, 0.0) + fraction * edge[3] / total
+            visiting.discard(func)
+        shares[func] = result # Inside recursive cycles this depends on the path taken, like in gprof
+        return result
+
+    seconds = {name: 0.0 for name, _ in CATEGORIES}
+    seconds['other'] = 0.0
+    for func, (_, _, self_time, _, _) in stats.stats.items():
+        for name, fraction in share(func, set()).items():
+            seconds[name] += self_time * fraction
+    return {name: round(value * 1000, 2) for name, value in seconds.items()}
+
+
+class _QueryTimer:
+    # Execute wrapper counting the queries and the time the database takes to run them
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+def profile_request(get_response, request):
+    """
+    Run `get_response(request)` under cProfile. Returns the response, the pstats.Stats
+    and a summary with the total time, the time per category and the query count.
+    """
+    profiler = cProfile.Profile()
+    queries = _QueryTimer()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    total = time.perf_counter() - start
+
+    stats = pstats.Stats(profiler)
+    summary = {
+        'total_ms': round(total * 1000, 2),
+        **{f'{name}_ms': value for name, value in breakdown(stats).items()},
+        'queries': queries.count,
+        'sql_ms': round(queries.seconds * 1000, 2),
+    }
+    return response, stats, summary
+
+
+def save_profile(stats, summary):
+    """
+    Write the profile and its summary to PROFILING_DIR and drop the oldest ones
+    beyond PROFILING_KEEP. Returns the profile name.
+    """
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', summary['path'].lower()).strip('-')[:60] or 'root'
+    name = f'{time.time_ns() // 1000}-{os.getpid()}-{slug}'
+    summary = {'name': name, **summary}
+    stats.dump_stats(os.path.join(PROFILING_DIR, name + '.pstats'))
+    with open(os.path.join(PROFILING_DIR, name + '.json'), 'w') as file:
+        json.dump(summary, file)
+
+    for old in _names()[PROFILING_KEEP:]:
+        for extension in ('.json', '.pstats'):
+            try:
+                os.remove(os.path.join(PROFILING_DIR, old + extension))
+            except FileNotFoundError:
+                pass # Removed by another process
+    return name
+
+
+def _names():
+    # Newest first, names start with the timestamp in microseconds
+    try:
+        files = os.listdir(PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    names = {file.rsplit('.', 1)[0] for file in files if file.endswith('.json')}
+    return sorted(names, key=lambda name: int(name.split('-', 1)[0]), reverse=True)
+
+
+def list_profiles():
+    """
+    Summaries of the saved profiles, newest first.
+    """
+    profiles = []
+    for name in _names():
+        try:
+            with open(os.path.join(PROFILING_DIR, name + '.json')) as file:
+                profiles.append(json.load(file))
+        except (FileNotFoundError, ValueError):
+            continue # Pruned or still being written
+    return profiles
+
+
+def profile_path(name):
+    """
+    Path of the saved .pstats file called `name`, or None.
+    """
+    if not _profile_name.match(name):
+        return None
+    path = os.path.join(PROFILING_DIR, name + '.pstats')
+    return path if os.path.exists(path) else None
+
+
+def profile_text(path, sort='cumulative', limit=40):
+    """
+    The `limit` most expensive functions of a saved profile, as printed by pstats.
+    """
+    output = io.StringIO()
+    pstats.Stats(path, stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'users',
     'blog',
+    'jobs',
     'rest_framework',
     'rest_framework_simplejwt',
     'django_filters',
@@ -50,13 +52,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.middleware.CompressionMiddleware', # Keep near the top so it sees the final response body
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', # This is for CORS
+    'config.middleware.AdmissionControlMiddleware', # After CORS so browsers can read the 503s
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.middleware.ProfilingMiddleware', # Last, so it profiles the view rather than the middleware
     # 'querycount.middleware.QueryCountMiddleware',
 ]
 
@@ -88,6 +93,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,             # Reuse connections between requests of a thread (seconds)
+        'CONN_HEALTH_CHECKS': True,     # Check a reused connection before the request uses it
+        'OPTIONS': {
+            # Web requests and job workers write concurrently: wait for the lock instead of
+            # failing with "database is locked", and let readers go on while a writer commits (WAL).
+            # IMMEDIATE takes the write lock when a transaction begins, for every atomic block:
+            # - a DEFERRED transaction that reads and then writes can not wait for the lock,
+            #   SQLite fails it with "database is locked" at once whatever the timeout
+            # - read-then-write jobs stay serialized with requests, e.g. delete_orphan_tags
+            #   (blog/tasks.py) checks a tag is unlinked and deletes it with no request linking
+            #   it in between, and the queue's claim compare-and-set (jobs/queue.py)
+            # Read-only requests do not open transactions (ATOMIC_REQUESTS is off) and are unaffected
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
     }
 }
 
@@ -141,6 +162,15 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.FastJSONRenderer',  # orjson when installed, stdlib json otherwise
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',  # Filtering backend
         'rest_framework.filters.SearchFilter',  # Search backend
@@ -180,3 +210,141 @@ CORS_ALLOW_HEADERS = (
     'x-requested-with',
 )
 
+
+# Cache shared by every worker process
+# Version stamps of the in-process caches (blog/refcache.py), shared blog payloads and
+# favourite ids, author statistics, feeds and the autocomplete stamp are only coherent
+# when every process reads and writes the same cache: with the per-process LocMemCache
+# a change made through one worker would stay invisible to the others.
+# The file cache is shared by the processes of one host, set REDIS_URL (for example
+# redis://127.0.0.1:6379/0, needs the `redis` package) when the app runs on several hosts.
+# Tests get a fresh directory for each run, see config/test_runner.py
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+TEST_RUNNER = 'config.test_runner.TestRunner'
+
+
+# Favourite toggles write-behind mode
+# When enabled, add/remove favourite requests are acknowledged immediately and
+# written in coalesced batches, keeping bursts of taps off SQLite's single writer lock
+# The buffer is per process: another worker process sees a toggle only once it is flushed
+FAVOURITE_WRITE_BEHIND = False
+FAVOURITE_BUFFER_MAX_SIZE = 100         # Flush once this many (user, blog) pairs are pending
+FAVOURITE_BUFFER_FLUSH_INTERVAL = 2.0   # Flush at least this often (seconds)
+
+# Process-local reference data cache for categories and the most used tags
+# Kept coherent through version stamps in the Django cache, see blog/refcache.py
+TAG_CACHE_SIZE = 500  # Number of most used tags kept in memory
+
+# Response compression, see config/middleware.py
+# Brotli is used when the `brotli` package is installed and the client accepts it
+COMPRESSION_MIN_SIZE = 1024         # Bodies smaller than this (bytes) are sent as is
+COMPRESSION_GZIP_LEVEL = 6          # 1 (fastest) to 9 (smallest)
+COMPRESSION_BROTLI_QUALITY = 5      # 0 (fastest) to 11 (smallest)
+COMPRESSION_SKIP_TYPES = (          # Already compressed media
+    'image/',
+    'video/',
+    'audio/',
+    'font/woff',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-brotli',
+    'application/octet-stream',
+)
+
+# Admin changelists estimate their row count above this many rows, see blog/admin.py
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Autocomplete index behind /api/suggest/, see blog/suggest.py
+# Patched in place by the process that saves a change, and rebuilt this often (seconds)
+# to pick up the changes of other processes and new popularity weights
+SUGGEST_REFRESH_INTERVAL = 600
+
+# Author dashboard statistics (/api/profile/stats/) are cached per author for this
+# long (seconds), writes through the ORM invalidate them earlier, see blog/stats.py
+AUTHOR_STATS_CACHE_TIMEOUT = 300
+
+# Blog list and detail payloads are cached once for everyone for this long (seconds),
+# signed-in users get their `is_favourited` merged in from a cached set of favourite
+# ids (FAVOURITE_IDS_CACHE_TIMEOUT seconds), replaced whenever the user's favourites
+# change. Both need the shared cache configured in CACHES, see blog/personalization.py
+BLOG_PAYLOAD_CACHE_TIMEOUT = 60
+FAVOURITE_IDS_CACHE_TIMEOUT = 300
+
+# Near-duplicate detection of new blogs, see blog/duplicates.py
+# 'flag' marks them (admin filter "near-duplicate"), 'reject' refuses them on
+# POST /api/blogs/ with a 400, None turns detection off
+DUPLICATE_DETECTION = 'flag'
+DUPLICATE_THRESHOLD = 0.8  # Estimated Jaccard similarity of the title and description shingles
+
+# RSS/Atom feeds (/api/feeds/) and sitemaps (/api/sitemap.xml), see blog/feeds.py
+# Documents are cached for FEED_CACHE_TIMEOUT seconds or until a blog, category or tag
+# changes, clients and proxies may reuse them for FEED_MAX_AGE seconds before revalidating
+FEED_ITEMS = 50             # Latest blogs per feed
+SITEMAP_SHARD_SIZE = 5000   # Blog ids per sitemap, keeps each one well under the cache's item size limit
+FEED_CACHE_TIMEOUT = 300
+FEED_MAX_AGE = 60
+BLOG_URL_TEMPLATE = None    # Link of a blog in feeds and sitemaps, e.g. 'https://example.com/blog/{slug}/'. None: the API detail URL
+
+# Change feed (/api/changes/), see blog/changes.py
+# Entries younger than this (seconds) wait for the next poll. SQLite serializes writers,
+# so ids always commit in order. With concurrent writers (PostgreSQL) set it above the
+# longest write transaction so a late commit with a lower id is not skipped
+CHANGE_FEED_SETTLE_SECONDS = 0
+# `compact_changes` drops deletions older than this (days). Clients that have not synced
+# for longer get `resync: true` and start again from cursor 0
+CHANGE_FEED_RETENTION_DAYS = 30
+
+# Admission control, see config/middleware.py
+# Concurrent requests and queue slots per route class and process: (limit, queue size)
+ADMISSION_LIMITS = {
+    'expensive': (4, 8),
+    'default': (8, 16),
+    'cheap': (16, 32),
+}
+# Matched by path prefix, everything else is 'default'
+ADMISSION_ROUTE_CLASSES = {
+    'expensive': ('/api/search/', '/api/favourites/', '/api/blog-details/', '/api/filter-tags/', '/api/changes/'),
+    'cheap': ('/api/categories/', '/api/tags/', '/api/suggest/', '/api/archive/', '/api/feeds/', '/api/sitemap'),
+}
+ADMISSION_EXEMPT_PATHS = ('/admin/', '/api/ops/')  # Never queued or rejected
+ADMISSION_QUEUE_TIMEOUT = 0.5   # Longest wait for a slot (seconds) before the 503
+ADMISSION_RETRY_AFTER = 1       # Retry-After of the 503 (seconds)
+
+# Background jobs, see jobs/queue.py and `python manage.py run_workers`
+JOBS_LEASE_SECONDS = 60         # A claimed job is run again when its worker has not finished it by then
+JOBS_MAX_ATTEMPTS = 5           # Attempts before a job is marked as failed
+JOBS_BACKOFF_BASE = 2.0         # Retry after about BASE ** attempts seconds
+JOBS_BACKOFF_MAX = 600.0        # Longest pause between attempts (seconds)
+JOBS_KEEP_DONE_SECONDS = 86400  # Finished jobs are purged when the workers start
+
+# Request profiling, see config/profiling.py
+# Staff users profile a request by sending `X-Profile: 1`, list and download the
+# profiles at /api/ops/profiles/. Profiled requests run about twice as slow
+PROFILING_HEADER = 'X-Profile'  # None to disable the header
+PROFILING_SAMPLE_RATE = 0.0     # Fraction of all requests profiled, e.g. 0.001
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_KEEP = 50             # Most recent profiles kept on disk
+PROFILING_EXEMPT_PATHS = ('/api/ops/',)
+
+# Startup warm-up, see config/warmup.py
+# The WSGI/ASGI entry points prime URL patterns, serializers, JWT and the in-memory
+# caches so the first requests after a deploy or worker recycle are not slow.
+# Database connections are per thread and opened by each thread's first request.
+# Measure cold starts with `python manage.py profile_startup`
+WARMUP_ON_STARTUP = True
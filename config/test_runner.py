@@ -0,0 +1,27 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+# Runs the tests against a fresh, empty file cache, so entries left by the development
+# server or an earlier run (keyed by ids the test database reuses) never leak into them
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        self._cache_dir = tempfile.mkdtemp(prefix='blog-test-cache-')
+        self._cache_settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self._cache_dir,
+                'OPTIONS': {'MAX_ENTRIES': 10000},
+            }
+        })
+        self._cache_settings.enable()
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
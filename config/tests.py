@@ -0,0 +1,371 @@
+import cProfile
+import datetime
+import decimal
+import gzip
+import io
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils.functional import lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+from . import middleware, profiling, warmup
+from .middleware import AdmissionControlMiddleware, AdmissionGate, CompressionMiddleware, ProfilingMiddleware
+from .renderers import FastJSONParser, FastJSONRenderer
+
+
+class FakeBrotli:
+    # Stands in for the optional brotli package, with zlib underneath
+
+    @staticmethod
+    def compress(content, quality):
+        return b'br:' + zlib.compress(content)
+
+    class Compressor:
+        def __init__(self, quality):
+            self._compressor = zlib.compressobj()
+
+        def process(self, chunk):
+            return self._compressor.compress(chunk)
+
+        def finish(self):
+            return self._compressor.flush()
+
+
+BODY = b'{"title": "Compressible"}' * 200
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024, COMPRESSION_SKIP_TYPES=('image/',))
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def _respond(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/api/all-blogs/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiation(self):
+        negotiate = CompressionMiddleware(lambda request: None).negotiate
+        with mock.patch.object(middleware, 'brotli', None):
+            self.assertEqual(negotiate('gzip, deflate, br'), 'gzip')
+            self.assertIsNone(negotiate('br'))
+        with mock.patch.object(middleware, 'brotli', FakeBrotli):
+            self.assertEqual(negotiate('gzip, deflate, br'), 'br')
+            self.assertEqual(negotiate('br;q=0.5, gzip'), 'gzip')
+            self.assertEqual(negotiate('*'), 'br')
+            self.assertIsNone(negotiate('identity'))
+            self.assertIsNone(negotiate('gzip;q=0, br;q=0'))
+            self.assertIsNone(negotiate(''))
+
+    def test_gzip(self):
+        response = self._respond(HttpResponse(BODY, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_brotli(self):
+        with mock.patch.object(middleware, 'brotli', FakeBrotli):
+            response = self._respond(HttpResponse(BODY, content_type='application/json'), 'br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(zlib.decompress(response.content[3:]), BODY)
+
+    def test_identity_still_varies(self):
+        response = self._respond(HttpResponse(BODY, content_type='application/json'), 'identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY)
+        self.assertIn('Accept-Encoding', response['Vary']) # Caches must not serve it to gzip clients
+
+    def test_small_bodies_are_sent_as_is(self):
+        response = self._respond(HttpResponse(BODY[:1023], content_type='application/json'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY[:1023])
+
+    def test_skipped_types_and_encoded_responses(self):
+        image = self._respond(HttpResponse(BODY, content_type='image/png'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+        encoded = HttpResponse(BODY, content_type='application/json')
+        encoded['Content-Encoding'] = 'gzip'
+        self.assertEqual(self._respond(encoded).content, BODY)
+
+    def test_incompressible_bodies_are_sent_as_is(self):
+        noise = random.Random(0).randbytes(4096) # Random bytes do not compress, gzip only adds its header
+        response = self._respond(HttpResponse(noise, content_type='application/json'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        chunks = [BODY[index:index + 500] for index in range(0, len(BODY), 500)]
+        response = self._respond(StreamingHttpResponse(iter(chunks), content_type='application/xml'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), BODY)
+
+    def test_strong_etags_are_weakened(self):
+        response = HttpResponse(BODY, content_type='application/json')
+        response['ETag'] = '"abc"'
+        self.assertEqual(self._respond(response)['ETag'], 'W/"abc"')
+
+
+class AdmissionGateTests(SimpleTestCase):
+
+    def _wait_in_queue(self, gate, anonymous):
+        # Start a request waiting for a slot, return a callable giving its admission result
+        result = []
+        thread = threading.Thread(target=lambda: result.append(gate.acquire(anonymous)))
+        queued = gate.queued
+        thread.start()
+        deadline = time.monotonic() + 5
+        while gate.queued == queued and thread.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+        def admitted():
+            # Well within the gate's timeout: a waiter nobody woke up is still waiting
+            thread.join(1)
+            return result[0] if result else None
+        return admitted
+
+    def test_waiting_requests_get_released_slots(self):
+        gate = AdmissionGate('test', limit=1, queue_size=4, timeout=5)
+        self.assertTrue(gate.acquire(anonymous=False))
+        waiting = self._wait_in_queue(gate, anonymous=False)
+        self.assertEqual(gate.stats()['queue_depth'], 1)
+        gate.release()
+        self.assertTrue(waiting())
+        self.assertEqual((gate.active, gate.admitted, gate.queued), (1, 2, 1))
+
+    def test_full_queues_reject_and_anonymous_requests_fill_half(self):
+        gate = AdmissionGate('test', limit=1, queue_size=2, timeout=5)
+        gate.acquire(anonymous=False)
+        anonymous = self._wait_in_queue(gate, anonymous=True)
+        self.assertFalse(gate.acquire(anonymous=True)) # Half of the queue is full for anonymous requests
+        authenticated = self._wait_in_queue(gate, anonymous=False)
+        self.assertFalse(gate.acquire(anonymous=False))
+        stats = gate.stats()
+        self.assertEqual((stats['rejected_queue_full'], stats['rejected_anonymous']), (2, 1))
+
+        # Authenticated requests go first, whatever the arrival order
+        gate.release()
+        self.assertTrue(authenticated())
+        self.assertEqual(gate.waiting_anonymous, 1)
+        gate.release()
+        self.assertTrue(anonymous())
+
+    def test_waits_time_out(self):
+        gate = AdmissionGate('test', limit=1, queue_size=2, timeout=0.01)
+        gate.acquire(anonymous=False)
+        self.assertFalse(gate.acquire(anonymous=True))
+        self.assertEqual((gate.rejected_timeout, gate.rejected_anonymous, gate.active), (1, 1, 1))
+
+    def test_back_to_back_releases_wake_every_waiter(self):
+        gate = AdmissionGate('test', limit=2, queue_size=4, timeout=5)
+        gate.acquire(anonymous=False)
+        gate.acquire(anonymous=False)
+        anonymous = self._wait_in_queue(gate, anonymous=True)
+        authenticated = self._wait_in_queue(gate, anonymous=False)
+        with gate._lock: # Both slots free up before the authenticated waiter gets to run
+            for _ in range(2):
+                gate.active -= 1
+                gate._wake_next()
+        self.assertTrue(authenticated())
+        self.assertTrue(anonymous())
+        self.assertEqual(gate.active, 2)
+
+
+@override_settings(ADMISSION_LIMITS={'default': (1, 0)}, ADMISSION_ROUTE_CLASSES={}, ADMISSION_RETRY_AFTER=3)
+class AdmissionControlMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(middleware, '_admission_gates', None) # Built from the settings above
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.middleware = AdmissionControlMiddleware(lambda request: HttpResponse('ok'))
+
+    def _request(self, authorization=None):
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        return RequestFactory().get('/api/blogs/', **headers)
+
+    def test_only_valid_tokens_count_as_authenticated(self):
+        token = AccessToken()
+        token['user_id'] = 1
+        self.assertTrue(self.middleware.is_authenticated(self._request(f'Bearer {token}')))
+        for header in (None, 'Bearer junk', 'Bearer', 'Bearer a b', 'Basic dXNlcjpwYXNz', f'Bearer {token}x'):
+            self.assertFalse(self.middleware.is_authenticated(self._request(header)), header)
+
+    def test_rejected_requests_get_a_503(self):
+        self.assertEqual(self.middleware(self._request()).status_code, 200)
+        gate = self.middleware.gates['default']
+        gate.acquire(anonymous=False)
+        response = self.middleware(self._request('Bearer junk'))
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '3'))
+        self.assertEqual(gate.rejected_anonymous, 1)
+
+
+class FastJSONTests(SimpleTestCase):
+    DATA = {
+        'id': 1,
+        'title': 'Unicode \u2713 and separators \u2028 \u2029',
+        'created_date': datetime.date(2024, 6, 1),
+        'updated': datetime.datetime(2024, 6, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'time': datetime.time(9, 5),
+        'duration': datetime.timedelta(minutes=3),
+        'price': decimal.Decimal('12.50'),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': lazy(lambda: 'translated', str)(),
+        'nested': [{'a': None, 'b': True, 'c': 1.5}, [], {}],
+        'big': 2 ** 70, # Wider than orjson's 64 bits
+        7: 'integer key',
+    }
+
+    def test_renders_the_same_bytes_as_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.DATA), JSONRenderer().render(self.DATA))
+        for data in ([], {}, 'text', 0, None, [self.DATA] * 3):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indented_output_matches_too(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(self.DATA, media_type, {}),
+            JSONRenderer().render(self.DATA, media_type, {}),
+        )
+
+    def test_parser(self):
+        body = b'{"title": "Caf\xc3\xa9", "tags": ["a", "b"], "rating": 5, "draft": false}'
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"title": '))
+
+
+class WarmupTests(TestCase):
+
+    @override_settings(WARMUP_ON_STARTUP=False)
+    def test_disabled_unless_forced(self):
+        with mock.patch.object(warmup, 'WARMUP_STEPS', (('step', mock.Mock()),)):
+            self.assertEqual(warmup.warm_up(), {})
+            self.assertEqual(list(warmup.warm_up(force=True)), ['step'])
+
+    def test_failing_steps_are_logged_and_skipped(self):
+        steps = (('broken', mock.Mock(side_effect=RuntimeError)), ('fine', mock.Mock()))
+        with mock.patch.object(warmup, 'WARMUP_STEPS', steps), self.assertLogs('config.warmup', 'ERROR'):
+            self.assertEqual(list(warmup.warm_up(force=True)), ['fine'])
+        steps[1][1].assert_called_once_with()
+
+    def test_every_step_runs(self):
+        with mock.patch('blog.suggest.suggest_index.warm') as warm_suggest_index:
+            timings = warmup.warm_up(force=True)
+        self.assertEqual(list(timings), ['url patterns', 'serializers', 'jwt', 'caches and indexes'])
+        warm_suggest_index.assert_called_once_with()
+
+
+class ProfileStartupTests(SimpleTestCase):
+
+    def test_reports_imports_and_first_requests(self):
+        # Runs in a fresh interpreter, a 404 page keeps it away from the database
+        stdout = io.StringIO()
+        with self.assertRaisesMessage(CommandError, 'Above 0 ms'):
+            call_command('profile_startup', path=['/no-such-page/'], top=3, fail_above=0, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertRegex(output, r'Project modules: \d+')
+        self.assertIn('django.setup():', output)
+        self.assertRegex(output, r'/no-such-page/ +404 ')
+
+
+class ProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', username='staff', password='pass', is_staff=True)
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='pass')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, value in (('PROFILING_DIR', directory.name), ('PROFILING_KEEP', 3)):
+            patcher = mock.patch.object(profiling, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _bearer(self, user):
+        return f'Bearer {AccessToken.for_user(user)}'
+
+    def _stats(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        sorted(random.random() for _ in range(1000))
+        profiler.disable()
+        return pstats.Stats(profiler)
+
+    def test_the_header_profiles_requests_of_staff_only(self):
+        response = self.client.get('/api/all-blogs/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=self._bearer(self.staff))
+        self.assertEqual(response.status_code, 200)
+        profile, = profiling.list_profiles()
+        self.assertEqual(profile['name'], response['X-Profile-Id'])
+        self.assertEqual((profile['path'], profile['trigger'], profile['status']), ('/api/all-blogs/', 'header', 200))
+        self.assertGreater(profile['queries'], 0)
+
+        for headers in ({'HTTP_AUTHORIZATION': self._bearer(self.reader)}, {'HTTP_AUTHORIZATION': 'Bearer junk'}, {}):
+            response = self.client.get('/api/all-blogs/', HTTP_X_PROFILE='1', **headers)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(len(profiling.list_profiles()), 1)
+
+    def test_sampling_follows_the_setting(self):
+        request = RequestFactory().get('/api/all-blogs/')
+        with override_settings(PROFILING_SAMPLE_RATE=0.0):
+            self.assertIsNone(ProfilingMiddleware(HttpResponse).trigger(request))
+        with override_settings(PROFILING_SAMPLE_RATE=0.25):
+            sampled = ProfilingMiddleware(HttpResponse)
+            with mock.patch('config.middleware.random.random', side_effect=[0.1, 0.5]):
+                self.assertEqual([sampled.trigger(request), sampled.trigger(request)], ['sample', None])
+            self.assertIsNone(sampled.trigger(RequestFactory().get('/api/ops/profiles/'))) # Exempt
+
+    def test_breakdown_adds_up_to_the_total(self):
+        response, stats, summary = profiling.profile_request(
+            lambda request: self.client.get('/api/all-blogs/'), RequestFactory().get('/'),
+        )
+        times = profiling.breakdown(stats)
+        self.assertEqual(set(times), {'orm', 'serializers', 'rendering', 'other'})
+        self.assertAlmostEqual(sum(times.values()), stats.total_tt * 1000, delta=0.05)
+        self.assertGreater(times['orm'], 0)
+
+    def test_old_profiles_are_pruned(self):
+        stats = self._stats()
+        with mock.patch('config.profiling.time.time_ns', side_effect=[index * 1000 for index in range(1, 6)]):
+            names = [profiling.save_profile(stats, {'path': f'/page/{index}/'}) for index in range(5)]
+        self.assertEqual([profile['name'] for profile in profiling.list_profiles()], names[:1:-1])
+        self.assertEqual(len(os.listdir(profiling.PROFILING_DIR)), 6) # A .json and a .pstats each
+
+    def test_profile_names_can_not_leave_the_directory(self):
+        name = profiling.save_profile(self._stats(), {'path': '/'})
+        self.assertEqual(profiling.profile_path(name), os.path.join(profiling.PROFILING_DIR, name + '.pstats'))
+        for name in ('../settings', '..', f'{name}/../{name}', '/etc/passwd', '', '1-2-x.pstats', '1-2-missing'):
+            self.assertIsNone(profiling.profile_path(name), name)
+
+    def test_endpoints_are_staff_only(self):
+        name = profiling.save_profile(self._stats(), {'path': '/api/all-blogs/'})
+        client = APIClient()
+        for user, status in ((None, 401), (self.reader, 403)):
+            client.force_authenticate(user)
+            self.assertEqual(client.get('/api/ops/profiles/').status_code, status)
+            self.assertEqual(client.get(f'/api/ops/profiles/{name}/').status_code, status)
+
+        client.force_authenticate(self.staff)
+        self.assertEqual([profile['name'] for profile in client.get('/api/ops/profiles/').data], [name])
+        download = client.get(f'/api/ops/profiles/{name}/')
+        self.assertEqual(download.status_code, 200)
+        with open(profiling.profile_path(name), 'rb') as file:
+            self.assertEqual(b''.join(download.streaming_content), file.read())
+        self.assertIn('function calls', client.get(f'/api/ops/profiles/{name}/?output=text').content.decode())
+        self.assertEqual(client.get('/api/ops/profiles/1-2-missing/').status_code, 404)
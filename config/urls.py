@@ -19,7 +19,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import AdmissionStatsView, ProfileDownloadView, ProfileListView
+
 api_urlpatterns = [
+    path('ops/admission/', AdmissionStatsView.as_view(), name='admission-stats'),
+    path('ops/profiles/', ProfileListView.as_view(), name='profiles'),
+    path('ops/profiles/<str:name>/', ProfileDownloadView.as_view(), name='profile-download'),
     path('', include('users.urls')),
     path('', include('blog.urls')),
 ]
@@ -0,0 +1,40 @@
+from django.http import FileResponse, HttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .middleware import get_admission_gates
+from .profiling import list_profiles, profile_path, profile_text
+
+
+# Admission control counters of the process serving the request
+# Exempt from admission control, so it can be read while the API is overloaded
+class AdmissionStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({name: gate.stats() for name, gate in get_admission_gates().items()})
+
+
+# Saved request profiles, newest first, see config/profiling.py
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list_profiles())
+
+
+# One profile: the .pstats file, or the most expensive functions as text with ?output=text
+# (&sort=tottime to sort by self time)
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        path = profile_path(name)
+        if path is None:
+            raise NotFound("Profile not found")
+        if request.query_params.get('output') == 'text':
+            sort = 'tottime' if request.query_params.get('sort') == 'tottime' else 'cumulative'
+            return HttpResponse(profile_text(path, sort), content_type='text/plain; charset=utf-8')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name + '.pstats')
@@ -0,0 +1,106 @@
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Startup warm-up
+# The first request served by a fresh worker pays for work Django and DRF do
+# lazily: importing the views, compiling the URL patterns, introspecting the
+# serializer fields, loading the JWT backend and loading the in-memory caches
+# and indexes.
+# Database connections are not opened here: Django keeps one per thread, and a
+# gthread or ASGI worker serves requests from threads other than the one that
+# imports the application. Each thread opens its own on its first request and
+# CONN_MAX_AGE keeps it for the next ones.
+# `warm_up()` does that work once at process start instead, see config/wsgi.py.
+# It runs from the WSGI/ASGI entry points rather than AppConfig.ready(), which
+# also runs for management commands (migrate included) and must not query the database.
+
+
+def _url_patterns():
+    # Populating the resolver imports every view module
+    # Each pattern compiles its regex on first use, so walk the whole tree
+    from django.urls import get_resolver
+
+    def walk(resolver):
+        for pattern in resolver.url_patterns:
+            pattern.pattern.regex
+            if hasattr(pattern, 'url_patterns'):
+                walk(pattern)
+
+    resolver = get_resolver()
+    resolver._populate()
+    walk(resolver)
+
+
+def _serializers():
+    # ModelSerializer builds its fields from model introspection on first access
+    # The per-model metadata and field class lookups it fills are shared by later instances
+    from blog import serializers as blog_serializers
+    from users import serializers as user_serializers
+
+    for module in (blog_serializers, user_serializers):
+        for serializer_class in vars(module).values():
+            if (
+                isinstance(serializer_class, type)
+                and serializer_class.__module__ == module.__name__
+                and hasattr(serializer_class, 'Meta')
+            ):
+                serializer_class().fields
+
+
+def _jwt():
+    # Loads the simplejwt settings, the token backend and the signing algorithm
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    JWTAuthentication()
+    token = str(AccessToken())
+    AccessToken(token)
+
+
+def _caches_and_indexes():
+    # Loaded into process memory, shared by every thread. The connection these queries
+    # open belongs to the importing thread, close it so a server that warms up before
+    # forking (gunicorn --preload) does not hand it to every child
+    from django.db import connections
+    from blog.refcache import category_cache, tag_cache
+    from blog.suggest import suggest_index
+
+    category_cache.warm()
+    tag_cache.warm()
+    suggest_index.warm()
+    connections.close_all()
+
+
+WARMUP_STEPS = (
+    ('url patterns', _url_patterns),
+    ('serializers', _serializers),
+    ('jwt', _jwt),
+    ('caches and indexes', _caches_and_indexes),
+)
+
+
+def warm_up(force=False):
+    """
+    Prime the lazily built structures of this process, returning the time spent
+    per step in milliseconds. Does nothing unless WARMUP_ON_STARTUP is set or `force` is passed.
+    A failing step is logged and skipped, warm-up never keeps a worker from starting.
+    """
+    if not (force or getattr(settings, 'WARMUP_ON_STARTUP', False)):
+        return {}
+
+    timings = {}
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %r failed", name)
+            continue
+        timings[name] = (time.perf_counter() - started) * 1000
+    logger.info("Warm-up done in %.1f ms: %s", sum(timings.values()), timings)
+    return timings
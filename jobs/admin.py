@@ -0,0 +1,23 @@
+from django.contrib import admin, messages
+from django.utils import timezone
+from .models import Job
+# Register your models here.
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'run_after', 'created_date')
+    list_filter = ('status', 'name')
+    search_fields = ('=name',)
+    ordering = ('-id',)
+    readonly_fields = ('attempts', 'locked_by', 'lease_expires_at', 'last_error', 'created_date', 'finished_date')
+    actions = ['retry_now']
+
+    @admin.action(description="Queue selected jobs to run again now", permissions=['change'])
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_after=timezone.now(), last_error=''
+        )
+        self.message_user(request, f"Queued {updated} jobs.", messages.SUCCESS)
+
+
+admin.site.register(Job, JobAdmin)
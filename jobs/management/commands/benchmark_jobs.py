@@ -0,0 +1,43 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from jobs.models import Job
+from jobs.queue import enqueue
+from jobs.worker import WorkerPool
+
+
+class Command(BaseCommand):
+    help = "Measure enqueue and processing throughput (jobs per second) of the job queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=2000, help="No-op jobs processed per run")
+        parser.add_argument('--threads', default='1,2,4,8', help="Comma-separated worker thread counts")
+
+    def handle(self, *args, **options):
+        # Workers use their own connections, so the jobs are committed to the configured
+        # database (not rolled back like the other benchmarks) and deleted afterwards
+        run_id = uuid.uuid4().hex
+        count = options['jobs']
+        try:
+            started = time.perf_counter()
+            for _ in range(min(count, 500)):
+                enqueue('jobs.noop', benchmark=run_id)
+            single = min(count, 500) / (time.perf_counter() - started)
+            Job.objects.filter(name='jobs.noop', payload__benchmark=run_id).delete()
+            self.stdout.write(f"enqueue(): {single:,.0f} jobs/s (one transaction per job)")
+
+            self.stdout.write(f"{'threads':>8} {'processed':>10} {'jobs/s':>10}")
+            for threads in (int(threads) for threads in options['threads'].split(',')):
+                Job.objects.bulk_create(
+                    [Job(name='jobs.noop', payload={'benchmark': run_id}) for _ in range(count)], batch_size=500
+                )
+                pool = WorkerPool(threads=threads, poll_interval=0.05, names=['jobs.noop'])
+                started = time.perf_counter()
+                processed = pool.run(drain=True)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{threads:>8} {processed:>10} {processed / elapsed:>10,.0f}")
+                Job.objects.filter(name='jobs.noop', payload__benchmark=run_id).delete()
+        finally:
+            Job.objects.filter(name='jobs.noop', payload__benchmark=run_id).delete()
@@ -0,0 +1,35 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs import queue
+from jobs.worker import WorkerPool
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help="Worker threads")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Longest pause between polls when idle (seconds)")
+        parser.add_argument('--lease', type=int, default=queue.LEASE_SECONDS, help="Seconds a claimed job is held before it can be claimed again")
+        parser.add_argument('--only', action='append', dest='names', help="Only run jobs with this name (repeatable)")
+        parser.add_argument('--drain', action='store_true', help="Exit once no job is runnable")
+
+    def handle(self, *args, **options):
+        purged = queue.purge_finished(getattr(settings, 'JOBS_KEEP_DONE_SECONDS', 86400))
+        if purged:
+            self.stdout.write(f"Purged {purged} finished jobs")
+
+        pool = WorkerPool(options['threads'], options['poll_interval'], options['names'], options['lease'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: pool.stop())
+
+        self.stdout.write(f"Running {options['threads']} workers, press Ctrl+C to stop")
+        started = time.perf_counter()
+        processed = pool.run(drain=options['drain'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} jobs ({pool.failed} failed) in {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,36 @@
+from django.db import models
+from django.utils import timezone
+# Create your models here.
+
+
+# A unit of deferred work, see jobs/queue.py
+# Workers claim a job with a compare-and-set UPDATE and hold it for a lease;
+# a job whose lease ran out (crashed worker) can be claimed again
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100) # Registered job function
+    payload = models.JSONField(default=dict, blank=True) # Keyword arguments of the function
+    priority = models.SmallIntegerField(default=0) # Higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now) # Not claimed before, used for delays and backoff
+    locked_by = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='jobs_claim_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='jobs_lease_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,158 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+# Database-backed job queue
+# No broker: jobs are rows in the jobs table, claimed by `run_workers` threads.
+#
+#     @job('blog.delete_orphan_tags')     # in <app>/tasks.py
+#     def delete_orphan_tags(tag_ids): ...
+#
+#     enqueue('blog.delete_orphan_tags', tag_ids=[1, 2])
+#
+# `enqueue` inside a transaction writes the job in that transaction, so workers
+# only see it once the request's changes are committed and it is dropped on rollback.
+# Jobs run at least once: one whose lease expires mid-run is run again, keep them idempotent.
+
+LEASE_SECONDS = getattr(settings, 'JOBS_LEASE_SECONDS', 60)
+MAX_ATTEMPTS = getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+BACKOFF_BASE = getattr(settings, 'JOBS_BACKOFF_BASE', 2.0)
+BACKOFF_MAX = getattr(settings, 'JOBS_BACKOFF_MAX', 600.0)
+CLAIM_ATTEMPTS = 8 # Races lost before a claim gives up, so competing workers rarely come back empty
+
+_registry = {}
+
+
+def job(name):
+    """
+    Register a function as the job called `name`. It gets the payload as keyword arguments.
+    """
+    def register(func):
+        _registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, priority=0, delay=0, max_attempts=None, **payload):
+    """
+    Queue the job `name` with `payload` (JSON-serializable keyword arguments).
+    Runs after `delay` seconds, higher `priority` first. Returns the Job.
+    """
+    if name not in _registry:
+        raise KeyError(f"Unknown job {name!r}")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        priority=priority,
+        max_attempts=max_attempts or MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _claimable(now):
+    return Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, lease_expires_at__lt=now)
+
+
+def claim(worker_id, names=None, lease_seconds=LEASE_SECONDS):
+    """
+    Claim the most urgent runnable job for `worker_id`, or return None.
+    A job is runnable when it is queued and due, or when its lease expired.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        # Rebuilt on every attempt, so leases that expired meanwhile are claimable
+        now = timezone.now()
+        claimable = _claimable(now)
+        if names:
+            claimable &= Q(name__in=names)
+        candidates = Job.objects.filter(claimable).order_by('-priority', 'run_after', 'id').values('id')
+
+        # Compare-and-set in a single statement: the UPDATE only matches while the
+        # most urgent job is still claimable, so exactly one worker wins it
+        lease_expires_at = now + timedelta(seconds=lease_seconds)
+        claimed = Job.objects.filter(claimable, id=Subquery(candidates[:1])).update(
+            status=Job.RUNNING,
+            locked_by=worker_id,
+            lease_expires_at=lease_expires_at,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            # A worker holds one job at a time, its id and lease identify the row
+            return Job.objects.filter(locked_by=worker_id, lease_expires_at=lease_expires_at).first()
+        if not candidates.exists():
+            return None
+        # Lost the race, try the next most urgent job
+    return None
+
+
+def run(claimed):
+    """
+    Run a claimed job and record the outcome. Returns True when it succeeded.
+    """
+    if claimed.attempts > claimed.max_attempts: # Its worker died on every attempt
+        _finish(claimed, Job.FAILED, error="Lease expired on the last attempt")
+        return False
+
+    func = _registry.get(claimed.name)
+    try:
+        if func is None:
+            raise KeyError(f"Unknown job {claimed.name!r}")
+        with transaction.atomic():
+            func(**claimed.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed on attempt %s", claimed.id, claimed.name, claimed.attempts)
+        if claimed.attempts >= claimed.max_attempts or func is None:
+            _finish(claimed, Job.FAILED, error=error)
+        else:
+            _retry(claimed, error)
+        return False
+    _finish(claimed, Job.DONE)
+    return True
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before the next attempt: exponential with jitter, capped at BACKOFF_MAX.
+    """
+    return min(BACKOFF_MAX, BACKOFF_BASE ** attempts) * random.uniform(0.5, 1.0)
+
+
+def _retry(claimed, error):
+    # Only the worker holding the lease may hand the job back
+    Job.objects.filter(id=claimed.id, locked_by=claimed.locked_by, status=Job.RUNNING).update(
+        status=Job.QUEUED,
+        run_after=timezone.now() + timedelta(seconds=backoff(claimed.attempts)),
+        locked_by='',
+        lease_expires_at=None,
+        last_error=error,
+    )
+
+
+def _finish(claimed, status, error=''):
+    Job.objects.filter(id=claimed.id, locked_by=claimed.locked_by, status=Job.RUNNING).update(
+        status=status,
+        locked_by='',
+        lease_expires_at=None,
+        last_error=error,
+        finished_date=timezone.now(),
+    )
+
+
+def purge_finished(older_than):
+    """
+    Delete jobs that succeeded more than `older_than` seconds ago. Failed jobs are kept for inspection.
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_date__lt=cutoff).delete()
+    return deleted
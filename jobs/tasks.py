@@ -0,0 +1,7 @@
+from .queue import job
+
+
+@job('jobs.noop')
+def noop(**payload):
+    # Used by benchmark_jobs to measure the queue itself
+    pass
@@ -0,0 +1,155 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+from .worker import WorkerPool
+
+
+@queue.job('tests.fail')
+def fail(**payload):
+    raise ValueError("Broken on purpose")
+
+
+class QueueTests(TestCase):
+
+    def _make_due(self, claimed):
+        # Skip the backoff delay
+        Job.objects.filter(pk=claimed.pk).update(run_after=timezone.now())
+
+    def test_enqueue_then_claim(self):
+        enqueued = queue.enqueue('jobs.noop', items=[1, 2])
+        claimed = queue.claim('worker-1')
+        self.assertEqual(claimed.pk, enqueued.pk)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), (Job.RUNNING, 'worker-1', 1))
+        self.assertEqual(claimed.payload, {'items': [1, 2]})
+        self.assertGreater(claimed.lease_expires_at, timezone.now())
+        self.assertIsNone(queue.claim('worker-2')) # Held by worker-1
+
+        self.assertTrue(queue.run(claimed))
+        claimed.refresh_from_db()
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.lease_expires_at), (Job.DONE, '', None))
+        self.assertIsNotNone(claimed.finished_date)
+
+        with self.assertRaises(KeyError):
+            queue.enqueue('tests.unknown')
+
+    def test_priority_delay_and_names(self):
+        low = queue.enqueue('jobs.noop')
+        high = queue.enqueue('jobs.noop', priority=5)
+        queue.enqueue('jobs.noop', priority=9, delay=60)
+        other = queue.enqueue('tests.fail')
+        self.assertEqual(queue.claim('worker-1', names=['tests.fail']).pk, other.pk)
+        self.assertEqual([queue.claim(f'worker-{number}').pk for number in (2, 3)], [high.pk, low.pk])
+        self.assertIsNone(queue.claim('worker-4')) # The delayed job is not due
+
+    def test_a_worker_losing_the_claim_race(self):
+        enqueued = queue.enqueue('jobs.noop')
+        update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            # worker-1 claims the job between worker-2's lookup and its compare-and-set
+            if kwargs.get('locked_by') == 'worker-2':
+                self.assertEqual(queue.claim('worker-1').pk, enqueued.pk)
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            self.assertIsNone(queue.claim('worker-2'))
+        enqueued.refresh_from_db()
+        self.assertEqual((enqueued.locked_by, enqueued.attempts), ('worker-1', 1))
+
+    def test_expired_leases_are_claimed_again(self):
+        enqueued = queue.enqueue('jobs.noop')
+        first = queue.claim('worker-1', lease_seconds=60)
+        self.assertIsNone(queue.claim('worker-2'))
+        Job.objects.filter(pk=enqueued.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        second = queue.claim('worker-2')
+        self.assertEqual((second.pk, second.locked_by, second.attempts), (enqueued.pk, 'worker-2', 2))
+        queue.run(first) # The first worker finishing late records nothing
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.locked_by), (Job.RUNNING, 'worker-2'))
+        self.assertTrue(queue.run(second))
+
+    def test_retries_back_off_until_the_last_attempt(self):
+        enqueued = queue.enqueue('tests.fail', max_attempts=3)
+        for attempt in (1, 2):
+            claimed = queue.claim('worker-1')
+            before = timezone.now()
+            with self.assertLogs('jobs.queue', 'WARNING'):
+                self.assertFalse(queue.run(claimed))
+            claimed.refresh_from_db()
+            self.assertEqual((claimed.status, claimed.attempts, claimed.locked_by), (Job.QUEUED, attempt, ''))
+            delay = (claimed.run_after - before).total_seconds()
+            self.assertTrue(queue.BACKOFF_BASE ** attempt * 0.5 - 0.1 <= delay <= queue.BACKOFF_BASE ** attempt + 0.1, delay)
+            self.assertIn("ValueError: Broken on purpose", claimed.last_error)
+            self.assertIsNone(queue.claim('worker-1')) # Not due yet
+            self._make_due(claimed)
+
+        claimed = queue.claim('worker-1')
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertFalse(queue.run(claimed))
+        enqueued.refresh_from_db()
+        self.assertEqual((enqueued.status, enqueued.attempts), (Job.FAILED, 3))
+        self.assertIn("ValueError: Broken on purpose", enqueued.last_error)
+        self.assertIsNotNone(enqueued.finished_date)
+
+    def test_backoff_is_capped(self):
+        with mock.patch('jobs.queue.random.uniform', return_value=1.0):
+            self.assertEqual(queue.backoff(3), queue.BACKOFF_BASE ** 3)
+            self.assertEqual(queue.backoff(40), queue.BACKOFF_MAX)
+
+    def test_failures_are_recorded(self):
+        unknown = Job.objects.create(name='tests.removed')
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertFalse(queue.run(queue.claim('worker-1')))
+        unknown.refresh_from_db()
+        self.assertEqual(unknown.status, Job.FAILED) # Not retried
+        self.assertIn("Unknown job 'tests.removed'", unknown.last_error)
+
+        # A worker died on every attempt
+        crashed = queue.enqueue('jobs.noop', max_attempts=1)
+        Job.objects.filter(pk=crashed.pk).update(
+            status=Job.RUNNING, attempts=1, locked_by='dead', lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertFalse(queue.run(queue.claim('worker-1')))
+        crashed.refresh_from_db()
+        self.assertEqual((crashed.status, crashed.last_error), (Job.FAILED, "Lease expired on the last attempt"))
+
+    def test_purge_finished(self):
+        done, failed = queue.enqueue('jobs.noop'), queue.enqueue('tests.fail', max_attempts=1)
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            for _ in range(2):
+                queue.run(queue.claim('worker-1'))
+        Job.objects.update(finished_date=timezone.now() - timedelta(hours=2))
+        self.assertEqual(queue.purge_finished(older_than=3600), 1)
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [failed.pk]) # Kept for inspection
+        self.assertFalse(Job.objects.filter(pk=done.pk).exists())
+
+
+class WorkerPoolTests(TestCase):
+
+    def test_errors_recording_an_outcome_are_logged(self):
+        first, second = queue.enqueue('jobs.noop'), queue.enqueue('jobs.noop')
+        finish = queue._finish
+        calls = []
+
+        def failing_finish(claimed, status, error=''):
+            calls.append(claimed.pk)
+            if len(calls) == 1:
+                raise RuntimeError("Database went away")
+            return finish(claimed, status, error)
+
+        pool = WorkerPool(threads=1)
+        # Run on this thread, which holds the test transaction
+        with mock.patch.object(queue, '_finish', failing_finish), self.assertLogs('jobs.worker', 'ERROR') as logs:
+            pool._work('worker-1', drain=True)
+        self.assertIn(f"Job {first.pk} (jobs.noop) could not be completed", logs.output[0])
+        self.assertEqual((pool.processed, pool.failed), (2, 1))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (Job.RUNNING, Job.DONE)) # The first one waits for its lease
@@ -0,0 +1,77 @@
+import logging
+import os
+import socket
+import threading
+
+from django.db import close_old_connections, connection
+
+from . import queue
+
+logger = logging.getLogger(__name__)
+
+
+# Thread pool running queued jobs
+# Each thread claims, runs and completes one job at a time on its own database
+# connection. Idle threads poll with a growing pause, up to `poll_interval`.
+class WorkerPool:
+
+    def __init__(self, threads=4, poll_interval=1.0, names=None, lease_seconds=queue.LEASE_SECONDS):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.names = names
+        self.lease_seconds = lease_seconds
+        self.stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def run(self, drain=False):
+        """
+        Run the pool until `stop()` is called, or until no job is runnable when `drain` is set.
+        """
+        workers = [
+            threading.Thread(target=self._work, args=(f"{self._prefix}:{number}", drain), daemon=True)
+            for number in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(timeout=0.5) # Wake up regularly so signals are handled
+        return self.processed
+
+    def stop(self):
+        # Threads finish the job they are running, then exit
+        self.stopping.set()
+
+    def _work(self, worker_id, drain):
+        pause = 0.0
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    claimed = queue.claim(worker_id, self.names, self.lease_seconds)
+                except Exception:
+                    logger.exception("Claiming a job failed")
+                    claimed = None
+
+                if claimed is None:
+                    if drain:
+                        return
+                    pause = min(self.poll_interval, pause * 2 or 0.05)
+                    self.stopping.wait(pause)
+                    continue
+
+                pause = 0.0
+                try:
+                    succeeded = queue.run(claimed)
+                except Exception:
+                    # Recording the outcome failed (database error), the job runs again once its lease expires
+                    logger.exception("Job %s (%s) could not be completed", claimed.id, claimed.name)
+                    succeeded = False
+                with self._lock:
+                    self.processed += 1
+                    self.failed += not succeeded
+        finally:
+            connection.close()
@@ -3,9 +3,11 @@ from django.contrib.auth import authenticate
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated
 from .models import User
+from blog.stats import get_author_stats
 # Create your views here.
 from .serializers import (
     RegisterSerializer,
@@ -57,4 +59,10 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         return User.objects.filter(id=self.request.user.id)
 
     def perform_update(self, serializer):
-        serializer.save()  # No need to pass user here since the serializer handles it
\ No newline at end of file
+        serializer.save()  # No need to pass user here since the serializer handles it
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        # Author dashboard: totals and per-blog numbers of reviews, ratings and favourites received
+        # Aggregated in the database and cached per author, see blog/stats.py
+        return Response(get_author_stats(request.user.id))